@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки утилит на синтетических плейлистах
+
+Каждая операция выполняется в отдельном дочернем процессе, чтобы пиковая
+память (ru_maxrss из os.wait4) относилась только к ней. Для каждой
+операции записываются время (без запуска интерпретатора и импорта),
+пропускная способность (каналов в секунду) и пиковая память; по
+нескольким повторам берётся медиана. Результаты сохраняются как базовые
+и сравниваются с ними при следующих запусках: регрессией считается рост
+медианы больше относительного допуска и одновременно больше абсолютного
+порога шума, тогда код выхода 1.
+
+Пример:
+    python bench_m3u.py -n 10000 -n 100000 --save-baseline bench.json
+    python bench_m3u.py -n 10000 -n 100000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from gen_playlist import generate_playlist, group_names
+
+# Операция -> описание; выполняются в дочернем процессе функцией _run_operation
+OPERATIONS = {
+    'parse': 'iptv_manager.parse_m3u_playlist',
+    'filter': 'filter_m3u.filter_m3u_by_extgrp',
+    'sort': 'sort_iptv.sort_m3u_playlist',
+    'merge': 'merge_m3u.merge_m3u_playlists',
+    'rename': 'rename_group.update_group_title',
+    'pipeline': 'm3u_pipeline.run_pipeline (filter + set-group + sort)',
+}
+DEFAULT_SIZES = (10_000, 100_000)
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.15
+DEFAULT_RSS_TOLERANCE = 0.20
+# Абсолютные пороги шума: меньшая разница не считается регрессией при любом относительном росте
+DEFAULT_MIN_DELTA = 0.05
+DEFAULT_MIN_RSS_DELTA_MB = 8.0
+# Сохраняемая статистика по повторам; базовые результаты с другой статистикой сравнивать нельзя
+STATISTIC = 'median'
+
+
+def _run_operation(operation, playlist, workdir):
+    """Выполняет операцию над плейлистом (в дочернем процессе)"""
+    output = os.path.join(workdir, 'out.m3u')
+    extgrp = group_names(1)[0]
+    if operation == 'parse':
+        from iptv_manager import parse_m3u_playlist
+        from m3u_parser import open_playlist
+        with open_playlist(playlist) as f:
+            parse_m3u_playlist(f)
+    elif operation == 'filter':
+        from filter_m3u import filter_m3u_by_extgrp
+        filter_m3u_by_extgrp(playlist, output, extgrp, 'Бенчмарк')
+    elif operation == 'sort':
+        from sort_iptv import sort_m3u_playlist
+        sort_m3u_playlist(playlist, output)
+    elif operation == 'merge':
+        from merge_m3u import merge_m3u_playlists
+        # Второй экземпляр того же плейлиста целиком состоит из дубликатов
+        merge_m3u_playlists([playlist, playlist], output, ('url', 'tvg-id'))
+    elif operation == 'rename':
+        from rename_group import update_group_title
+        update_group_title(playlist, 'Бенчмарк')
+    elif operation == 'pipeline':
+        from m3u_pipeline import build_stage, run_pipeline
+        stages = [build_stage('filter', [extgrp]), build_stage('set-group', 'Бенчмарк'), build_stage('sort', None)]
+        run_pipeline([playlist], output, stages)
+    else:
+        raise ValueError(f"Неизвестная операция: {operation}")
+
+
+def measure(operation, playlist, workdir):
+    """
+    Запускает операцию в дочернем процессе
+
+    Returns:
+        tuple: (время в секундах, пиковая память в КБ)
+    """
+    if operation == 'rename':
+        # rename_group перезаписывает файл, поэтому работает с копией (копирование не замеряется)
+        copy = os.path.join(workdir, 'rename.m3u')
+        shutil.copyfile(playlist, copy)
+        playlist = copy
+    timing = os.path.join(workdir, 'timing')
+    command = [sys.executable, os.path.abspath(__file__), '--child', operation, playlist, workdir, timing]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise RuntimeError(f"Операция {operation} завершилась с кодом {process.returncode}")
+    with open(timing, 'r', encoding='utf-8') as f:
+        elapsed = float(f.read())
+    # ru_maxrss в Linux - в килобайтах, в macOS - в байтах
+    max_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    return elapsed, max_rss
+
+
+def run_benchmarks(sizes, operations, repeat=DEFAULT_REPEAT, groups=12, seed=1, dup_rate=0.05, workdir=None):
+    """
+    Генерирует плейлисты и замеряет операции
+
+    Returns:
+        dict: "операция/число каналов" -> {seconds, seconds_min, seconds_max, channels_per_s, max_rss_kb};
+        seconds и max_rss_kb - медианы повторов
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for size in sizes:
+            playlist = os.path.join(tmp, f'bench_{size}.m3u')
+            generate_playlist(playlist, size, groups, seed, dup_rate)
+            for operation in operations:
+                # Медиана повторов устойчива к единичным выбросам в обе стороны, в отличие от минимума
+                runs = [measure(operation, playlist, tmp) for _ in range(repeat)]
+                times = sorted(elapsed for elapsed, _ in runs)
+                seconds = statistics.median(times)
+                max_rss = round(statistics.median(rss for _, rss in runs))
+                results[f'{operation}/{size}'] = {
+                    'seconds': round(seconds, 4),
+                    'seconds_min': round(times[0], 4),
+                    'seconds_max': round(times[-1], 4),
+                    'channels_per_s': round(size / seconds),
+                    'max_rss_kb': max_rss,
+                }
+                print(f"{operation:>9} {size:>9} каналов: {seconds:8.3f} с ({times[0]:.3f}-{times[-1]:.3f}), "
+                      f"{size / seconds:>10.0f} каналов/с, пик памяти {max_rss / 1024:7.1f} МБ")
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, rss_tolerance=DEFAULT_RSS_TOLERANCE,
+            min_delta=DEFAULT_MIN_DELTA, min_rss_delta_mb=DEFAULT_MIN_RSS_DELTA_MB):
+    """
+    Список регрессий относительно базовых результатов
+
+    Рост медианы считается регрессией, только если он больше и
+    относительного допуска, и абсолютного порога шума (min_delta секунд,
+    min_rss_delta_mb МБ): на маленьких плейлистах десятки процентов - это
+    миллисекунды колебаний планировщика. Кроме того, по времени самый
+    быстрый повтор должен быть медленнее самого медленного повтора базового
+    замера: пока диапазоны повторов пересекаются, разница не отличима от шума.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        slower = result['seconds'] - base['seconds']
+        overlaps = result.get('seconds_min', result['seconds']) <= base.get('seconds_max', base['seconds'])
+        if slower > base['seconds'] * tolerance and slower > min_delta and not overlaps:
+            regressions.append(f"{key}: время {base['seconds']:.3f} -> {result['seconds']:.3f} с "
+                               f"(+{result['seconds'] / base['seconds'] - 1:.0%})")
+        grown = result['max_rss_kb'] - base['max_rss_kb']
+        if grown > base['max_rss_kb'] * rss_tolerance and grown > min_rss_delta_mb * 1024:
+            regressions.append(f"{key}: память {base['max_rss_kb'] / 1024:.1f} -> "
+                               f"{result['max_rss_kb'] / 1024:.1f} МБ "
+                               f"(+{result['max_rss_kb'] / base['max_rss_kb'] - 1:.0%})")
+    return regressions
+
+
+def main():
+    if len(sys.argv) == 6 and sys.argv[1] == '--child':
+        # Дочерний процесс: замеряется только сама операция
+        operation, playlist, workdir, timing = sys.argv[2:]
+        start = time.perf_counter()
+        _run_operation(operation, playlist, workdir)
+        elapsed = time.perf_counter() - start
+        with open(timing, 'w', encoding='utf-8') as f:
+            f.write(repr(elapsed))
+        return
+
+    parser = argparse.ArgumentParser(
+        description='Бенчмарки утилит (время, каналов/с, пиковая память) с сохранением базовых результатов',
+        epilog=f"Операции: {', '.join(f'{name} ({description})' for name, description in OPERATIONS.items())}")
+    parser.add_argument('-n', '--channels', type=int, action='append', metavar='N',
+                        help=f"Размер плейлиста (можно несколько, по умолчанию {', '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('-o', '--operation', action='append', choices=list(OPERATIONS),
+                        help='Операция (можно несколько, по умолчанию все)')
+    parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f'Число повторов каждой операции, берётся медиана (по умолчанию {DEFAULT_REPEAT})')
+    parser.add_argument('-g', '--groups', type=int, default=12, help='Число групп в плейлисте (по умолчанию 12)')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора (по умолчанию 1)')
+    parser.add_argument('--dup-rate', type=float, default=0.05, help='Доля дубликатов (по умолчанию 0.05)')
+    parser.add_argument('--tmp-dir', help='Каталог для сгенерированных плейлистов')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Сохранить результаты как базовые')
+    parser.add_argument('--baseline', metavar='FILE', help='Сравнить с базовыми результатами')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Допустимое замедление (по умолчанию {DEFAULT_TOLERANCE:g})')
+    parser.add_argument('--rss-tolerance', type=float, default=DEFAULT_RSS_TOLERANCE,
+                        help=f'Допустимый рост пиковой памяти (по умолчанию {DEFAULT_RSS_TOLERANCE:g})')
+    parser.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA, metavar='SECONDS',
+                        help=f'Замедление меньше SECONDS не считается регрессией (по умолчанию {DEFAULT_MIN_DELTA:g})')
+    parser.add_argument('--min-rss-delta', type=float, default=DEFAULT_MIN_RSS_DELTA_MB, metavar='MB',
+                        help=f'Рост памяти меньше MB не считается регрессией (по умолчанию {DEFAULT_MIN_RSS_DELTA_MB:g})')
+
+    args = parser.parse_args()
+
+    # Параметры генерации: сравнивать имеет смысл только одинаковые плейлисты
+    playlist_params = {'groups': args.groups, 'seed': args.seed, 'dup_rate': args.dup_rate}
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            print(f"Ошибка: Файл {args.baseline} не найден")
+            sys.exit(2)
+        baseline = data['results']
+        if data.get('statistic') != STATISTIC:
+            print("Предупреждение: Базовые результаты сохранены по минимуму повторов, а сравнивается медиана; "
+                  "пересохраните их через --save-baseline")
+        if data.get('playlist') != playlist_params:
+            print(f"Предупреждение: Базовые результаты получены на других плейлистах: {data.get('playlist')}")
+
+    results = run_benchmarks(args.channels or DEFAULT_SIZES, args.operation or list(OPERATIONS), args.repeat,
+                             args.groups, args.seed, args.dup_rate, args.tmp_dir)
+
+    if args.save_baseline:
+        data = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'playlist': playlist_params,
+            'repeat': args.repeat,
+            'statistic': STATISTIC,
+            'results': results,
+        }
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"Базовые результаты сохранены в {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.rss_tolerance, args.min_delta, args.min_rss_delta)
+        if regressions:
+            print("Регрессии:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("Регрессий нет")
+
+if __name__ == "__main__":
+    main()
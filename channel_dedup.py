@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Поиск нечётких дубликатов каналов
+
+Провайдеры называют один и тот же канал по-разному: «Первый канал»,
+«Первый канал HD», «Perviy kanal FHD». Названия нормализуются (регистр,
+суффиксы качества, транслитерация, пунктуация), каналы с одинаковым
+нормализованным названием сразу попадают в один кластер, а похожие
+названия находятся через MinHash по символьным триграммам с разбиением
+на полосы (LSH). Попарно сравниваются только кандидаты из одной корзины,
+поэтому время растёт почти линейно с числом каналов.
+"""
+import re
+import zlib
+from collections import defaultdict
+
+# Суффиксы качества и служебные пометки, не влияющие на то, какой это канал
+QUALITY_RANKS = {
+    'sd': 1, 'hq': 1, 'hd': 2, '720p': 2, 'fhd': 3, 'fullhd': 3, '1080p': 3, 'hdr': 3,
+    'uhd': 4, '4k': 4, '2160p': 4, '8k': 5,
+}
+_NOISE_TOKENS = frozenset(QUALITY_RANKS) | {
+    'hevc', 'h264', 'h265', 'x264', 'x265', '50fps', '60fps', 'orig', 'original', 'backup', 'reserve',
+}
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'і': 'i', 'ї': 'i', 'є': 'e', 'ґ': 'g',
+})
+
+# Варианты латинской записи одних и тех же звуков сводятся к одному написанию
+_PHONETIC = (
+    ('shch', 'sch'), ('kh', 'h'), ('ts', 'c'), ('tz', 'c'), ('ck', 'k'),
+    ('ph', 'f'), ('w', 'v'), ('x', 'ks'), ('q', 'k'), ('j', 'i'), ('y', 'i'),
+)
+# Правила, которые применяются только к словам длиннее указанного: короткие
+# названия вроде «СТС» (sts) - аббревиатуры, а не запись звука «ц»
+_PHONETIC_MIN_LENGTH = {'ts': 4}
+
+_TOKEN_RE = re.compile(r'[^\W_]+')
+_REPEAT_RE = re.compile(r'(.)\1+')
+_DIGITS_RE = re.compile(r'\d+')
+
+# Параметры MinHash: NUM_BANDS полос по ROWS_PER_BAND хешей
+NUM_BANDS = 6
+ROWS_PER_BAND = 4
+
+# Ключи из слишком большой корзины сравниваются только с соседями по
+# отсортированному списку, чтобы частые триграммы не давали O(n²)
+BUCKET_WINDOW = 50
+_MASK = (1 << 61) - 1
+_COEFFS = [((0x9E3779B97F4A7C15 * (i + 1)) & _MASK | 1, (0xC2B2AE3D27D4EB4F * (i + 7)) & _MASK)
+           for i in range(NUM_BANDS * ROWS_PER_BAND)]
+
+
+def title_tokens(title):
+    """Слова названия в нижнем регистре без пунктуации"""
+    return _TOKEN_RE.findall(title.casefold())
+
+
+def normalize_title(title):
+    """
+    Нормализует название канала для сравнения:
+    «Первый канал HD» и «Perviy kanal FHD» дают одно и то же «pervi kanal»
+    """
+    words = []
+    for token in title_tokens(title):
+        if token in _NOISE_TOKENS:
+            continue
+        token = token.translate(_TRANSLIT)
+        length = len(token)
+        for src, dst in _PHONETIC:
+            if length >= _PHONETIC_MIN_LENGTH.get(src, 0):
+                token = token.replace(src, dst)
+        words.append(_REPEAT_RE.sub(r'\1', token))
+    return ' '.join(words)
+
+
+def quality_rank(title):
+    """Качество по суффиксам названия (0 - не указано)"""
+    return max((QUALITY_RANKS.get(token, 0) for token in title_tokens(title)), default=0)
+
+
+def _trigrams(key):
+    text = f' {key} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def _band_keys(grams, digits):
+    hashes = [zlib.crc32(gram.encode('utf-8')) for gram in grams]
+    signature = [min((a * h + b) & _MASK for h in hashes) for a, b in _COEFFS]
+    for band in range(NUM_BANDS):
+        # Номера входят в ключ корзины: «Россия 1» и «Россия 2» не станут кандидатами
+        yield band, digits, tuple(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def find_duplicate_clusters(channels, threshold=0.8, fuzzy=True):
+    """
+    Находит кластеры дубликатов среди каналов
+
+    Args:
+        channels (list): Список объектов Channel
+        threshold (float): Минимальное сходство (Жаккар по триграммам) для нечёткого совпадения
+        fuzzy (bool): Искать похожие названия через MinHash, а не только одинаковые
+
+    Returns:
+        list: Кластеры - списки индексов каналов (только кластеры из двух и более каналов)
+    """
+    # Блокировка по нормализованному названию: одинаковые ключи - один кластер
+    by_key = defaultdict(list)
+    for i, channel in enumerate(channels):
+        key = normalize_title(channel.name)
+        if key:
+            by_key[key].append(i)
+    keys = list(by_key)
+    union = _UnionFind(len(keys))
+
+    if fuzzy:
+        # Кандидаты - ключи, совпавшие хотя бы в одной полосе MinHash
+        buckets = defaultdict(list)
+        grams = [_trigrams(key) for key in keys]
+        for k, key_grams in enumerate(grams):
+            for band_key in _band_keys(key_grams, tuple(_DIGITS_RE.findall(keys[k]))):
+                buckets[band_key].append(k)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) > BUCKET_WINDOW:
+                members.sort(key=keys.__getitem__)
+            for i, a in enumerate(members):
+                for b in members[i + 1:i + 1 + BUCKET_WINDOW]:
+                    if union.find(a) == union.find(b):
+                        continue
+                    size_a, size_b = len(grams[a]), len(grams[b])
+                    if min(size_a, size_b) < threshold * max(size_a, size_b):
+                        continue  # Жаккар не может достичь порога при такой разнице размеров
+                    if _jaccard(grams[a], grams[b]) >= threshold:
+                        union.union(a, b)
+
+    clusters = defaultdict(list)
+    for k, key in enumerate(keys):
+        clusters[union.find(k)].extend(by_key[key])
+    return sorted((sorted(members) for members in clusters.values() if len(members) > 1),
+                  key=lambda members: members[0])
+
+
+class TitleIndex:
+    """
+    Поиск самого похожего нормализованного названия среди добавленных
+
+    Используются те же триграммы и корзины MinHash, что и при поиске
+    дубликатов, поэтому сравниваются только кандидаты из общих корзин.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self._grams = []
+        self._buckets = defaultdict(list)
+
+    def add(self, key):
+        """Добавляет нормализованное название, возвращает его номер"""
+        k = len(self.keys)
+        grams = _trigrams(key)
+        self.keys.append(key)
+        self._grams.append(grams)
+        for band_key in _band_keys(grams, tuple(_DIGITS_RE.findall(key))):
+            self._buckets[band_key].append(k)
+        return k
+
+    def best(self, key, threshold=0.8):
+        """Номер самого похожего названия и сходство (не ниже порога) или None"""
+        grams = _trigrams(key)
+        best = None
+        checked = set()
+        for band_key in _band_keys(grams, tuple(_DIGITS_RE.findall(key))):
+            for k in self._buckets.get(band_key, ()):
+                if k in checked:
+                    continue
+                checked.add(k)
+                score = _jaccard(grams, self._grams[k])
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (k, score)
+        return best
+
+
+def best_channel_index(channels, members):
+    """Лучший канал кластера: выше качество, есть tvg-id и логотип, раньше в плейлисте"""
+    def score(i):
+        channel = channels[i]
+        return (quality_rank(channel.name), bool(channel.get_attr('tvg-id')),
+                bool(channel.get_attr('tvg-logo')), -i)
+    return max(members, key=score)
+
+
+def keep_best(channels, clusters):
+    """Оставляет по одному лучшему каналу из каждого кластера, порядок остальных не меняется"""
+    drop = set()
+    for members in clusters:
+        best = best_channel_index(channels, members)
+        drop.update(i for i in members if i != best)
+    return [channel for i, channel in enumerate(channels) if i not in drop]
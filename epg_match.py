@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Заполнение tvg-id и tvg-name каналов по программе передач XMLTV
+
+Файл XMLTV (в том числе .gz и .zst) разбирается потоково через
+iterparse: из элементов <channel> берутся id и все <display-name>,
+каждый разобранный элемент сразу удаляется из дерева, поэтому память
+не растёт с размером файла. По стандарту XMLTV каналы идут перед
+передачами, и чтение останавливается на первом <programme> (--scan-all
+читает файл до конца). Список каналов EPG сохраняется в файле-спутнике
+<epg>.epgidx и при следующих запусках берётся оттуда, пока не изменились
+размер и время изменения файла EPG. EPG по URL http(s) сначала
+обновляется в кеше m3u_remote условным запросом.
+
+Название канала плейлиста (то же, что возвращает
+filter_m3u.extract_channel_name) нормализуется так же, как при поиске
+дубликатов, и ищется среди нормализованных display-name: сначала точно,
+затем нечётко по триграммам (channel_dedup.TitleIndex). Найденные id
+и display-name записываются в строку #EXTINF через Extinf.set, как
+group-title в add_group_title_to_extinf.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import m3u_stats
+from channel_dedup import TitleIndex, normalize_title
+from m3u_parser import compression_for, is_url, read_channels, require_zstandard
+from m3u_remote import fetch
+from m3u_snapshot import save_playlist
+from m3u_stats import add_stats_arguments, instrument, stage
+
+CACHE_SUFFIX = '.epgidx'
+CACHE_VERSION = 1
+DEFAULT_THRESHOLD = 0.8
+
+
+def open_epg(path):
+    """Открывает файл XMLTV в двоичном режиме, .gz и .zst распаковываются на лету"""
+    compression = compression_for(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        return require_zstandard().open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_epg_channels(path, scan_all=False):
+    """
+    Потоково выдаёт каналы XMLTV
+
+    Yields:
+        tuple: (id канала, список display-name)
+    """
+    if m3u_stats.current is not None:
+        m3u_stats.current.bytes_read += os.path.getsize(path)
+    root = None
+    with open_epg(path) as f:
+        for event, element in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                elif element.tag == 'programme' and not scan_all:
+                    break
+                continue
+            if element.tag == 'channel':
+                channel_id = element.get('id')
+                names = [name.text.strip() for name in element.iter('display-name')
+                         if name.text and name.text.strip()]
+                if channel_id and names:
+                    yield channel_id, names
+            elif element.tag != 'programme':
+                continue
+            # Разобранные элементы удаляются, чтобы дерево не росло
+            root.clear()
+
+
+def cache_path(path):
+    return path + CACHE_SUFFIX
+
+
+def save_epg_cache(path, channels, cache_file=None):
+    """Сохраняет список каналов EPG в файл-спутник (ошибки записи не критичны)"""
+    stat = os.stat(path)
+    data = {
+        'version': CACHE_VERSION,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'channels': channels,
+    }
+    sidecar = cache_file or cache_path(path)
+    tmp_path = sidecar + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, sidecar)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_epg_channels(path, use_cache=True, cache_file=None, scan_all=False):
+    """
+    Возвращает список каналов EPG [(id, [display-name, ...]), ...]
+
+    Если размер и время изменения файла совпадают с сохранёнными в кеше,
+    файл EPG не читается. Иначе он разбирается заново и кеш обновляется.
+    """
+    if is_url(path):
+        path = fetch(path)
+    if use_cache:
+        stat = os.stat(path)
+        try:
+            with open(cache_file or cache_path(path), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if (data is not None and data.get('version') == CACHE_VERSION
+                and data['size'] == stat.st_size and data['mtime_ns'] == stat.st_mtime_ns):
+            return [(channel_id, names) for channel_id, names in data['channels']]
+
+    with stage('parse'):
+        channels = list(iter_epg_channels(path, scan_all))
+    if use_cache:
+        save_epg_cache(path, channels, cache_file)
+    return channels
+
+
+class EpgIndex:
+    """Поиск канала EPG по названию: точный по нормализованному названию, затем нечёткий"""
+
+    def __init__(self, epg_channels):
+        self.exact = {}
+        self.titles = TitleIndex()
+        self._entries = []  # Номер в TitleIndex -> (id, display-name)
+        self._fuzzy = {}  # (нормализованное название, порог) -> результат нечёткого поиска
+        for channel_id, names in epg_channels:
+            for name in names:
+                key = normalize_title(name)
+                # При совпадении нормализованных названий побеждает первый канал
+                if key and key not in self.exact:
+                    self.exact[key] = (channel_id, name)
+                    self.titles.add(key)
+                    self._entries.append((channel_id, name))
+
+    def __len__(self):
+        return len(self.exact)
+
+    def match(self, title, threshold=DEFAULT_THRESHOLD, fuzzy=True):
+        """
+        Ищет канал EPG по названию канала плейлиста
+
+        Returns:
+            tuple: (id, display-name, сходство) или None; при точном совпадении сходство 1.0
+        """
+        key = normalize_title(title)
+        if not key:
+            return None
+        found = self.exact.get(key)
+        if found is not None:
+            return found + (1.0,)
+        if not fuzzy:
+            return None
+        # Варианты одного названия (HD, FHD, регистр) нормализуются одинаково
+        if (key, threshold) in self._fuzzy:
+            return self._fuzzy[key, threshold]
+        best = self.titles.best(key, threshold)
+        found = None if best is None else self._entries[best[0]] + (best[1],)
+        self._fuzzy[key, threshold] = found
+        return found
+
+
+def assign_epg(channels, index, threshold=DEFAULT_THRESHOLD, fuzzy=True, overwrite=False, counts=None):
+    """
+    Потоково заполняет tvg-id и tvg-name каналов по индексу EPG
+
+    Args:
+        channels: Итератор каналов
+        index (EpgIndex): Индекс каналов EPG
+        threshold (float): Минимальное сходство для нечёткого совпадения
+        fuzzy (bool): Искать нечёткие совпадения
+        overwrite (bool): Заменять уже заданный tvg-id
+        counts (dict): Сюда добавляются счётчики exact, fuzzy, missing, skipped
+    """
+    if counts is None:
+        counts = {}
+    for key in ('exact', 'fuzzy', 'missing', 'skipped'):
+        counts.setdefault(key, 0)
+    # Одинаковые названия у провайдеров встречаются часто, результат поиска запоминается
+    matches = {}
+    for channel in channels:
+        if not overwrite and channel.get_attr('tvg-id'):
+            counts['skipped'] += 1
+            yield channel
+            continue
+        title = channel.name
+        if title in matches:
+            found = matches[title]
+        else:
+            found = matches[title] = index.match(title, threshold, fuzzy)
+        if found is None:
+            counts['missing'] += 1
+        else:
+            channel_id, name, score = found
+            counts['exact' if score == 1.0 else 'fuzzy'] += 1
+            channel.set_attr('tvg-id', channel_id)
+            channel.set_attr('tvg-name', name)
+        yield channel
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заполнение tvg-id и tvg-name каналов по программе передач XMLTV')
+    parser.add_argument('playlist', help='Плейлист (M3U, .gz, .zst или снимок)')
+    parser.add_argument('epg', help='Файл XMLTV (.xml, .gz, .zst) или URL http(s)')
+    parser.add_argument('-o', '--output', help='Выходной файл (по умолчанию перезаписывается плейлист)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Минимальное сходство названий для нечёткого совпадения (по умолчанию {DEFAULT_THRESHOLD:g})')
+    parser.add_argument('--no-fuzzy', action='store_true', help='Только точные совпадения нормализованных названий')
+    parser.add_argument('--overwrite', action='store_true', help='Заменять уже заданный tvg-id')
+    parser.add_argument('--scan-all', action='store_true',
+                        help='Читать файл EPG до конца (если <channel> встречаются после <programme>)')
+    parser.add_argument('--cache', metavar='FILE', help=f'Файл кеша каналов EPG (по умолчанию <epg>{CACHE_SUFFIX})')
+    parser.add_argument('--no-cache', action='store_true', help='Не использовать кеш каналов EPG')
+    add_stats_arguments(parser)
+
+    args = parser.parse_args()
+
+    with instrument(args, 'epg_match'):
+        try:
+            epg_channels = load_epg_channels(args.epg, not args.no_cache, args.cache, args.scan_all)
+        except FileNotFoundError:
+            print(f"Ошибка: Файл '{args.epg}' не найден")
+            sys.exit(1)
+        except (ET.ParseError, OSError) as e:
+            print(f"Ошибка при чтении EPG: {e}")
+            sys.exit(1)
+        with stage('process'):
+            index = EpgIndex(epg_channels)
+        print(f"Каналов EPG: {len(epg_channels)}, названий: {len(index)}")
+
+        output = args.output or args.playlist
+        header = []
+        counts = {}
+        try:
+            channels = assign_epg(read_channels(args.playlist, header), index, args.threshold,
+                                  not args.no_fuzzy, args.overwrite, counts)
+            total = save_playlist(output, channels, header)
+        except FileNotFoundError:
+            print(f"Ошибка: Файл '{args.playlist}' не найден")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Ошибка при обработке плейлиста: {e}")
+            sys.exit(1)
+
+    print(f"Записано {total} каналов в {output}")
+    print(f"Точных совпадений: {counts['exact']}, нечётких: {counts['fuzzy']}, "
+          f"не найдено: {counts['missing']}, пропущено (tvg-id уже задан): {counts['skipped']}")
+
+if __name__ == "__main__":
+    main()
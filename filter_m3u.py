@@ -1,133 +1,192 @@
 #!/usr/bin/env python3
 import sys
 import argparse
-import re
+import json
+from contextlib import nullcontext
+from operator import itemgetter
+
+from m3u_parallel import read_channels_parallel
+from m3u_parser import Extinf, is_snapshot, iter_channels, open_playlist
+from m3u_query import Condition, Router, matches
+from m3u_snapshot import Snapshot
+from m3u_stats import add_stats_arguments, instrument, stage
+from m3u_writer import PlaylistWriter
 
 def extract_channel_name(extinf_line):
     """Извлекает название канала из строки #EXTINF"""
-    # Ищем название канала после последней запятой
-    if ',' in extinf_line:
-        channel_name = extinf_line.split(',')[-1].strip()
-        return channel_name
-    return ""
+    # Название идёт после первой запятой вне кавычек и само может содержать запятые
+    return Extinf(extinf_line.strip()).title
 
 def add_group_title_to_extinf(extinf_line, group_title):
     """Добавляет group-title к строке #EXTINF"""
-    # Проверяем, есть ли уже group-title
-    if 'group-title=' in extinf_line:
-        # Заменяем существующий group-title
-        pattern = r'group-title="[^"]*"'
-        replacement = f'group-title="{group_title}"'
-        return re.sub(pattern, replacement, extinf_line)
-    else:
-        # Добавляем group-title после #EXTINF:
-        # Находим позицию первой запятой
-        comma_pos = extinf_line.find(',')
-        if comma_pos != -1:
-            # Вставляем group-title перед запятой
-            return extinf_line[:comma_pos] + f' group-title="{group_title}"' + extinf_line[comma_pos:]
+    # Существующий group-title заменяется на месте, иначе атрибут добавляется перед запятой
+    extinf = Extinf(extinf_line.strip())
+    extinf.set('group-title', group_title)
+    return str(extinf)
+
+class _FilterOutput:
+    """Выходной файл фильтрации: пишет каналы сразу или копит их для сортировки"""
+    
+    def __init__(self, path, sort_channels):
+        self.path = path
+        self.channels = [] if sort_channels else None  # Список кортежей (ключ_сортировки, блок_канала)
+        # Пустая строка между каналами для читаемости; файл подменяется атомарно при закрытии
+        self.writer = PlaylistWriter(path, separator="\n").open()
+    
+    @property
+    def count(self):
+        return self.writer.count
+    
+    def add(self, channel_name, block):
+        if self.channels is not None:
+            self.channels.append((channel_name.lower(), block))
         else:
-            # Если запятой нет, добавляем в конец
-            return extinf_line.rstrip() + f' group-title="{group_title}"\n'
+            self.writer.write_block(block)
+    
+    def close(self):
+        if self.channels is not None:
+            # Ключ сортировки вычислен заранее, сортировка стабильная
+            with stage('sort'):
+                self.channels.sort(key=itemgetter(0))
+            for _, block in self.channels:
+                self.writer.write_block(block)
+            self.channels = None
+        self.writer.close()
+    
+    def abort(self):
+        """Отменяет запись, существующий выходной файл не меняется"""
+        self.channels = None
+        self.writer.abort()
 
-def filter_m3u_by_extgrp(input_file, output_file, extgrp_name, group_title, sort_channels=True):
+def filter_m3u_by_extgrp_batch(input_file, routes, sort_channels=True, jobs=1):
     """
-    Фильтрует M3U плейлист по заданной группе через #EXTGRP: и сортирует по названию
+    Раскладывает каналы M3U плейлиста по нескольким файлам за один проход
+    
+    Входной файл читается и парсится один раз, каждый канал направляется
+    в выходной файл своей группы #EXTGRP: (регистр не учитывается).
+    Несколько групп могут направляться в один и тот же файл. Маршрут -
+    частный случай запроса m3u_query: extgrp = ГРУППА.
     
     Args:
         input_file (str): Путь к входному файлу
-        output_file (str): Путь к выходному файлу
-        extgrp_name (str): Название группы для фильтрации (после #EXTGRP:)
-        group_title (str): Название группы для group-title в #EXTINF
-        sort_channels (bool): Сортировать каналы по названию
+        routes (dict): Название группы #EXTGRP: -> (выходной файл, group-title для #EXTINF)
+        sort_channels (bool): Сортировать каналы по названию в каждом файле
+        jobs (int): Число процессов для разбора (0 - по числу ядер)
+    
+    Returns:
+        dict: Количество каналов по выходным файлам или None при ошибке
     """
     
-    # Читаем входной файл
+    # Открываем входной файл; при разборе в нескольких процессах его открывает
+    # read_channels_parallel, иначе URL загружался бы дважды
+    f = None
+    parallel = jobs != 1 and not is_snapshot(input_file)
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        if not parallel:
+            f = open_playlist(input_file)
     except FileNotFoundError:
         print(f"Ошибка: Файл {input_file} не найден")
-        return
+        return None
     except Exception as e:
         print(f"Ошибка при чтении файла: {e}")
-        return
-    
-    # Фильтруем каналы и собираем их в блоки
-    channels = []  # Список кортежей (название_канала, [строки_канала])
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        
-        # Проверяем строку с метаданными канала
-        if line.startswith("#EXTINF:"):
-            channel_lines = []  # Начинаем собирать блок канала
-            channel_name = extract_channel_name(lines[i])  # Извлекаем название
-            
-            # Добавляем #EXTINF с group-title вместо оригинальной строки
-            modified_extinf = add_group_title_to_extinf(lines[i], group_title)
-            channel_lines.append(modified_extinf)
-            
-            # Собираем все строки до следующего канала
-            j = i + 1
-            found_group = False
-            
-            while j < len(lines) and not lines[j].strip().startswith("#EXTINF:") and not lines[j].strip().startswith("#EXTM3U"):
-                # Пропускаем #EXTGRP: строки и пустые строки
-                if lines[j].strip():  # Проверяем, что строка не пустая
-                    if lines[j].strip().startswith("#EXTGRP:"):
-                        group_value = lines[j].strip()[8:]  # Убираем "#EXTGRP:"
-                        if group_value.lower() == extgrp_name.lower():
-                            found_group = True
-                        # Не добавляем #EXTGRP: в результат
-                    else:
-                        # Добавляем все остальные строки
-                        channel_lines.append(lines[j])
-                j += 1
-            
-            # Если группа найдена, добавляем канал
-            if found_group:
-                channels.append((channel_name, channel_lines))
-            
-            i = j
-        else:
-            i += 1
-    
-    # Сортируем каналы по названию, если нужно
-    if sort_channels:
-        channels.sort(key=lambda x: x[0].lower())
+        return None
     
-    # Подготавливаем выходные строки
-    output_lines = ["#EXTM3U\n"]  # Добавляем заголовок
+    # Открываем выходные файлы и строим маршруты: запрос extgrp = ГРУППА -> (файл, group-title)
+    outputs = {}
+    route_list = []
+    try:
+        for extgrp_name, (output_file, group_title) in routes.items():
+            if output_file not in outputs:
+                outputs[output_file] = _FilterOutput(output_file, sort_channels)
+            route_list.append((Condition('extgrp', '=', extgrp_name), (outputs[output_file], group_title)))
+    except Exception as e:
+        print(f"Ошибка при записи файла: {e}")
+        if f is not None:
+            f.close()
+        for output in outputs.values():
+            output.abort()
+        return None
     
-    # Добавляем отсортированные каналы
-    for channel_name, channel_lines in channels:
-        output_lines.extend(channel_lines)
-        # Добавляем пустую строку между каналами для читаемости
-        output_lines.append("\n")
+    # Потоково раскладываем каналы по выходным файлам
+    router = Router(route_list)
+    try:
+        with f if f is not None else nullcontext():
+            if parallel:
+                # Отбор по запросу выполняется в рабочих процессах
+                channels = read_channels_parallel(input_file, jobs, select=(matches, (router.query,)))
+            elif isinstance(f, Snapshot):
+                # В снимке отбор идёт по колонке #EXTGRP, остальные каналы не читаются
+                channels = f.select_extgrp(router.equality_values('extgrp'))
+            else:
+                channels = iter_channels(f)
+            for channel in channels:
+                route = router.route(channel)
+                if route is None:
+                    continue
+                output, group_title = route
+                # Заменяем #EXTINF на вариант с group-title, #EXTGRP: в результат не попадает
+                channel.set_attr('group-title', group_title)
+                output.add(channel.name, channel.to_m3u(keep_extgrp=False))
+    except FileNotFoundError:
+        print(f"Ошибка: Файл {input_file} не найден")
+        for output in outputs.values():
+            output.abort()
+        return None
+    except Exception as e:
+        print(f"Ошибка при чтении файла: {e}")
+        for output in outputs.values():
+            output.abort()
+        return None
     
-    # Убираем последнюю пустую строку, если она есть
-    if output_lines and output_lines[-1] == "\n":
-        output_lines.pop()
+    # Дописываем отсортированные каналы и закрываем файлы
+    counts = {}
+    for output in outputs.values():
+        try:
+            output.close()
+        except Exception as e:
+            print(f"Ошибка при записи файла {output.path}: {e}")
+            continue
+        counts[output.path] = output.count
+        print(f"Успешно создан файл {output.path} с {output.count} каналами")
+    return counts
+
+def filter_m3u_by_extgrp(input_file, output_file, extgrp_name, group_title, sort_channels=True, jobs=1):
+    """
+    Фильтрует M3U плейлист по заданной группе через #EXTGRP: и сортирует по названию
     
-    # Записываем отфильтрованный плейлист
-    try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.writelines(output_lines)
-        print(f"Успешно создан файл {output_file} с {len(channels)} каналами")
+    Args:
+        input_file (str): Путь к входному файлу
+        output_file (str): Путь к выходному файлу
+        extgrp_name (str): Название группы для фильтрации (после #EXTGRP:)
+        group_title (str): Название группы для group-title в #EXTINF
+        sort_channels (bool): Сортировать каналы по названию
+        jobs (int): Число процессов для разбора (0 - по числу ядер)
+    """
+    counts = filter_m3u_by_extgrp_batch(input_file, {extgrp_name: (output_file, group_title)}, sort_channels, jobs)
+    if counts and output_file in counts:
         print(f"Исходная группа: '{extgrp_name}'")
         print(f"Целевая группа: '{group_title}'")
         if sort_channels:
             print("Каналы отсортированы по названию")
-    except Exception as e:
-        print(f"Ошибка при записи файла: {e}")
+
+def load_routes(spec_file):
+    """
+    Загружает маршруты пакетной фильтрации из JSON файла вида
+    {"EXTGRP": ["выходной_файл.m3u", "group-title"], ...}
+    """
+    with open(spec_file, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    return {extgrp_name: (route[0], route[1]) for extgrp_name, route in spec.items()}
 
 def show_groups(input_file):
     """Показывает все доступные группы в плейлисте"""
+    # Собираем все значения #EXTGRP: потоково, не загружая файл целиком
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        with open_playlist(input_file) as f:
+            if isinstance(f, Snapshot):
+                groups = {extgrp for extgrp in f.extgrp_values() if extgrp}
+            else:
+                groups = {channel.extgrp for channel in iter_channels(f) if channel.extgrp}
     except FileNotFoundError:
         print(f"Ошибка: Файл {input_file} не найден")
         return
@@ -135,15 +194,6 @@ def show_groups(input_file):
         print(f"Ошибка при чтении файла: {e}")
         return
     
-    # Ищем все #EXTGRP: теги
-    groups = set()
-    lines = content.split('\n')
-    
-    for line in lines:
-        if line.strip().startswith("#EXTGRP:"):
-            group_name = line.strip()[8:]  # Убираем "#EXTGRP:"
-            groups.add(group_name)
-    
     if groups:
         print("Доступные группы:")
         for group in sorted(groups):
@@ -159,6 +209,14 @@ def main():
     parser.add_argument('group_title', nargs='?', help='Название группы для group-title в #EXTINF')
     parser.add_argument('--list-groups', '-l', action='store_true', help='Показать все доступные группы')
     parser.add_argument('--no-sort', action='store_true', help='Отключить сортировку по названию')
+    parser.add_argument('--route', '-r', nargs=3, action='append', metavar=('EXTGRP', 'OUTPUT', 'GROUP_TITLE'),
+                        help='Пакетный режим: направить группу EXTGRP в файл OUTPUT с group-title GROUP_TITLE '
+                             '(можно указать несколько раз, входной файл читается один раз)')
+    parser.add_argument('--batch', '-b', metavar='SPEC',
+                        help='Пакетный режим: JSON файл вида {"EXTGRP": ["выход.m3u", "group-title"], ...}')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Число процессов для разбора больших файлов (0 - по числу ядер, по умолчанию 1)')
+    add_stats_arguments(parser)
     
     args = parser.parse_args()
     
@@ -167,7 +225,28 @@ def main():
         if not args.input:
             print("Ошибка: Укажите входной файл для показа групп")
             return
-        show_groups(args.input)
+        with instrument(args, 'filter_m3u'):
+            show_groups(args.input)
+        return
+    
+    sort_channels = not args.no_sort
+    
+    # Пакетный режим: несколько групп за один проход по входному файлу
+    if args.route or args.batch:
+        if not args.input or args.output:
+            print("Ошибка: В пакетном режиме укажите только входной файл")
+            return
+        routes = {}
+        if args.batch:
+            try:
+                routes.update(load_routes(args.batch))
+            except Exception as e:
+                print(f"Ошибка при чтении файла маршрутов: {e}")
+                return
+        for extgrp_name, output_file, group_title in args.route or []:
+            routes[extgrp_name] = (output_file, group_title)
+        with instrument(args, 'filter_m3u'):
+            filter_m3u_by_extgrp_batch(args.input, routes, sort_channels, args.jobs)
         return
     
     # Проверяем обязательные аргументы
@@ -175,8 +254,8 @@ def main():
         parser.print_help()
         return
     
-    sort_channels = not args.no_sort
-    filter_m3u_by_extgrp(args.input, args.output, args.extgrp, args.group_title, sort_channels)
+    with instrument(args, 'filter_m3u'):
+        filter_m3u_by_extgrp(args.input, args.output, args.extgrp, args.group_title, sort_channels, args.jobs)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Генератор синтетических плейлистов для бенчмарков
+
+При одинаковых параметрах и seed результат побайтно совпадает. Плейлист
+похож на настоящий: кириллические названия с суффиксами качества,
+группы с неравномерным числом каналов, #EXTGRP: и group-title в разных
+написаниях, директивы #EXTVLCOPT, каналы без URL и доля дубликатов
+(тот же URL, другое качество, транслитерация, другой регистр).
+"""
+import argparse
+import random
+import zlib
+
+from m3u_writer import PlaylistWriter
+
+GROUP_NAMES = (
+    'Эфирные', 'Спорт', 'Кино', 'Новости', 'Детские', 'Музыка', 'Познавательные', 'Развлекательные',
+    'Сериалы', 'Региональные', 'Документальные', 'Религиозные', 'Кухня', 'Путешествия', 'Наука', 'Юмор',
+)
+_ADJECTIVES = (
+    'Первый', 'Русский', 'Домашний', 'Новый', 'Большой', 'Наш', 'Мир', 'Звезда', 'Родной', 'Live',
+    'Светлый', 'Общественный', 'Столичный', 'Ретро', 'Мужской', 'Женский', 'Детский', 'Северный',
+)
+_NOUNS = (
+    'канал', 'Футбол', 'Кинохит', 'Новости', 'Мультик', 'Хит', 'Открытие', 'Дом', 'Театр', 'Спорт',
+    'Сериал', 'Время', 'Путь', 'Планета', 'Семья', 'Регион', 'Кухня', 'Драйв', 'Наука', 'Юмор',
+)
+_QUALITY = ('', '', '', ' HD', ' FHD', ' 4K', ' SD', ' HD 50fps')
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y',
+    'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+
+def group_names(count):
+    """Названия групп: сначала типичные, дальше нумерованные"""
+    names = list(GROUP_NAMES[:count])
+    names.extend(f'Группа {i}' for i in range(len(names) + 1, count + 1))
+    return names
+
+
+def _translit(title):
+    return ''.join(ch.lower().translate(_TRANSLIT).capitalize() if ch.isupper() else ch.translate(_TRANSLIT)
+                   for ch in title)
+
+
+def _variant(rng, name):
+    # Написание группы у разных провайдеров отличается регистром и пробелами
+    roll = rng.random()
+    if roll < 0.1:
+        return name.lower()
+    if roll < 0.15:
+        return name.upper()
+    if roll < 0.2:
+        return f' {name} '
+    return name
+
+
+def generate_blocks(count, groups=12, seed=1, dup_rate=0.05, extgrp_rate=0.9, group_title_rate=0.85):
+    """
+    Выдаёт блоки каналов в текстовом виде M3U
+
+    Args:
+        count (int): Число каналов
+        groups (int): Число групп
+        seed (int): Начальное значение генератора случайных чисел
+        dup_rate (float): Доля дубликатов ранее выданных каналов
+        extgrp_rate (float): Доля каналов со строкой #EXTGRP:
+        group_title_rate (float): Доля каналов с атрибутом group-title
+    """
+    rng = random.Random(seed)
+    names = group_names(groups)
+    # Размеры групп неравномерны, как у настоящих провайдеров
+    weights = [1 / (i + 1) ** 0.8 for i in range(len(names))]
+    recent = []  # Последние каналы для дубликатов: (название, группа, URL, tvg-id)
+
+    for i in range(count):
+        if recent and rng.random() < dup_rate:
+            title, group, url, tvg_id = rng.choice(recent)
+            kind = rng.random()
+            if kind < 0.3:
+                pass  # Точный дубликат: тот же URL
+            elif kind < 0.6:
+                title = title.rsplit(' ', 1)[0] + rng.choice(_QUALITY[3:])
+                url = f'{url}?q={i}'
+            elif kind < 0.8:
+                title = _translit(title)
+                url = f'{url}?alt={i}'
+            else:
+                title = title.upper()
+                url = f'{url}?b={i}'
+        else:
+            group = rng.choices(names, weights)[0]
+            title = f'{rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)}'
+            if rng.random() < 0.6:
+                title += f' {rng.randrange(1, 400)}'
+            title += rng.choice(_QUALITY)
+            url = f'http://s{rng.randrange(1, 64)}.provider{rng.randrange(1, 6)}.tv/live/{i}.m3u8'
+            tvg_id = f'ch{i}' if rng.random() < 0.8 else None
+            recent.append((title, group, url, tvg_id))
+            if len(recent) > 1000:
+                recent.pop(rng.randrange(len(recent)))
+
+        attrs = []
+        if tvg_id:
+            attrs.append(f'tvg-id="{tvg_id}"')
+        if rng.random() < group_title_rate:
+            attrs.append(f'group-title="{_variant(rng, group)}"')
+        if rng.random() < 0.5:
+            attrs.append(f'tvg-logo="http://logo.example.com/{zlib.crc32(title.encode()) % 10007}.png"')
+        if rng.random() < 0.1:
+            attrs.append('catchup="default" catchup-days=7')
+        lines = [f'#EXTINF:-1 {" ".join(attrs)},{title}' if attrs else f'#EXTINF:-1,{title}']
+        if rng.random() < extgrp_rate:
+            lines.append(f'#EXTGRP:{_variant(rng, group).strip()}')
+        if rng.random() < 0.05:
+            lines.append('#EXTVLCOPT:http-user-agent=Mozilla/5.0')
+        # Изредка встречаются битые записи без URL потока
+        if rng.random() >= 0.002:
+            lines.append(url)
+        yield '\n'.join(lines) + '\n'
+
+
+def generate_playlist(path, count, groups=12, seed=1, dup_rate=0.05, extgrp_rate=0.9, group_title_rate=0.85):
+    """Записывает синтетический плейлист (параметры как у generate_blocks), возвращает число каналов"""
+    with PlaylistWriter(path, '#EXTM3U url-tvg="http://epg.example.com/epg.xml.gz"') as writer:
+        for block in generate_blocks(count, groups, seed, dup_rate, extgrp_rate, group_title_rate):
+            writer.write_block(block)
+        return writer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генератор детерминированных синтетических M3U плейлистов')
+    parser.add_argument('output', help='Выходной файл (.gz, .zst - со сжатием)')
+    parser.add_argument('-n', '--channels', type=int, default=10_000, help='Число каналов (по умолчанию 10000)')
+    parser.add_argument('-g', '--groups', type=int, default=12, help='Число групп (по умолчанию 12)')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора (по умолчанию 1)')
+    parser.add_argument('--dup-rate', type=float, default=0.05, help='Доля дубликатов (по умолчанию 0.05)')
+    parser.add_argument('--extgrp-rate', type=float, default=0.9,
+                        help='Доля каналов с #EXTGRP: (по умолчанию 0.9)')
+    parser.add_argument('--group-title-rate', type=float, default=0.85,
+                        help='Доля каналов с group-title (по умолчанию 0.85)')
+
+    args = parser.parse_args()
+
+    count = generate_playlist(args.output, args.channels, args.groups, args.seed, args.dup_rate,
+                              args.extgrp_rate, args.group_title_rate)
+    print(f"Создан плейлист {args.output}: {count} каналов")
+
+if __name__ == "__main__":
+    main()
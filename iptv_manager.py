@@ -1,113 +1,279 @@
 #!/usr/bin/env python3
 import argparse
-import re
 import sys
 from collections import OrderedDict
 
-def parse_m3u_playlist(content):
+from channel_dedup import best_channel_index, find_duplicate_clusters, keep_best, normalize_title
+from m3u_index import load_index
+from m3u_parallel import has_url, read_channels_parallel
+from m3u_parser import compression_for, is_snapshot, is_url, iter_channels, open_playlist
+from m3u_query import ChannelIndex, any_of
+from m3u_snapshot import Snapshot, save_playlist, wants_snapshot
+from m3u_stats import add_stats_arguments, instrument, stage
+from probe_cache import ProbeCache
+from stream_check import (DEFAULT_CONCURRENCY, DEFAULT_PER_HOST, DEFAULT_TIMEOUT, HEALTH_ATTR, STATUS_DEAD,
+                          STATUS_OK, STATUS_SKIPPED, apply_results, check_urls, summarize)
+
+def parse_m3u_playlist(lines, header=None):
     """Парсит M3U плейлист и возвращает список каналов с их группами"""
-    lines = content.strip().split('\n')
-    channels = []
-    current_channel = None
-    
-    for line in lines:
-        line = line.strip()
-        if line.startswith('#EXTINF:'):
-            # Извлекаем group-title
-            group_match = re.search(r'group-title="([^"]*)"', line)
-            group_title = group_match.group(1) if group_match else "Без группы"
-            
-            current_channel = {
-                'extinf': line,
-                'group': group_title
-            }
-        elif line.startswith('http') and current_channel:
-            current_channel['url'] = line
-            channels.append(current_channel)
-            current_channel = None
-    
-    return channels
+    # Каналы без URL потока в плейлист не попадают
+    return [channel for channel in iter_channels(lines, header) if channel.url]
 
 def group_channels(channels):
     """Группирует каналы по названию группы"""
     groups = OrderedDict()
     for channel in channels:
-        group = channel['group']
+        group = channel.group
         if group not in groups:
             groups[group] = []
         groups[group].append(channel)
     return groups
 
-def list_groups(channels):
-    """Выводит список всех групп"""
-    groups = group_channels(channels)
+def print_groups(group_counts, dead_counts=None):
+    """Выводит список групп с количеством каналов (и недоступных каналов, если известно)"""
     print("Список доступных групп:")
     print("-" * 50)
-    for i, (group, channel_list) in enumerate(groups.items(), 1):
-        print(f"{i:2d}. {group} ({len(channel_list)} каналов)")
+    for i, (group, count) in enumerate(group_counts, 1):
+        if dead_counts is None:
+            print(f"{i:2d}. {group} ({count} каналов)")
+        else:
+            print(f"{i:2d}. {group} ({count} каналов, недоступно: {dead_counts.get(group, 0)})")
 
-def swap_groups(channels, group1, group2):
-    """Меняет местами две группы"""
+def list_groups(channels, cache=None, max_age=None):
+    """
+    Выводит список всех групп; с кешем проверок - и число недоступных каналов по группам
+
+    Учитываются только свежие результаты: не старше TTL статуса или max_age секунд.
+    """
     groups = group_channels(channels)
-    
-    if group1 not in groups:
+    dead_counts = None
+    if cache is not None:
+        results = cache.lookup([channel.url for channel in channels], max_age=max_age)
+        dead_counts = {}
+        for group, channel_list in groups.items():
+            dead_counts[group] = sum(1 for channel in channel_list
+                                     if channel.url in results and results[channel.url].status == STATUS_DEAD)
+    print_groups(((group, len(channel_list)) for group, channel_list in groups.items()), dead_counts)
+
+def swap_group_order(group_order, group1, group2):
+    """Меняет местами две группы в списке порядка групп (None, если группа не найдена)"""
+    if group1 not in group_order:
         print(f"Ошибка: Группа '{group1}' не найдена")
-        return channels
+        return None
     
-    if group2 not in groups:
+    if group2 not in group_order:
         print(f"Ошибка: Группа '{group2}' не найдена")
-        return channels
+        return None
     
     # Создаем новый порядок групп
-    group_order = list(groups.keys())
+    group_order = list(group_order)
     idx1 = group_order.index(group1)
     idx2 = group_order.index(group2)
     
     # Меняем местами
     group_order[idx1], group_order[idx2] = group_order[idx2], group_order[idx1]
     
+    print(f"Группы '{group1}' и '{group2}' успешно поменялись местами")
+    return group_order
+
+def swap_groups(channels, group1, group2):
+    """Меняет местами две группы"""
+    groups = group_channels(channels)
+    group_order = swap_group_order(groups.keys(), group1, group2)
+    if group_order is None:
+        return channels
+    
     # Пересобираем плейлист в новом порядке
     new_channels = []
     for group_name in group_order:
         new_channels.extend(groups[group_name])
-    
-    print(f"Группы '{group1}' и '{group2}' успешно поменялись местами")
     return new_channels
 
-def remove_groups(channels, groups_to_remove):
-    """Удаляет указанные группы"""
-    original_count = len(channels)
-    groups = group_channels(channels)
-    
+def remove_group_order(group_order, groups_to_remove):
+    """Исключает группы из списка порядка групп, возвращает (оставшиеся, число найденных)"""
     # Проверяем существование групп
     not_found = []
     for group in groups_to_remove:
-        if group not in groups:
+        if group not in group_order:
             not_found.append(group)
     
     if not_found:
         print(f"Предупреждение: Следующие группы не найдены: {', '.join(not_found)}")
     
-    # Фильтруем каналы
-    remaining_groups = [group for group in groups.keys() if group not in groups_to_remove]
-    new_channels = []
-    removed_count = 0
+    remaining_groups = [group for group in group_order if group not in groups_to_remove]
+    return remaining_groups, len(groups_to_remove) - len(not_found)
+
+def remove_groups(channels, groups_to_remove):
+    """Удаляет указанные группы (запрос m3u_query: group == ГРУППА по индексу каналов)"""
+    index = ChannelIndex(channels)
+    group_order = index.distinct('group')
+    remaining_groups, found_count = remove_group_order(group_order, groups_to_remove)
+    removed = index.find(any_of('group', groups_to_remove, exact=True))
     
-    for group_name in remaining_groups:
-        new_channels.extend(groups[group_name])
+    # Оставшиеся каналы выдаются по группам в порядке их появления
+    new_channels = [channels[position] for group_name in remaining_groups
+                    for position in index.positions('group', group_name)]
     
-    removed_count = original_count - len(new_channels)
-    print(f"Удалено {removed_count} каналов из {len(groups_to_remove) - len(not_found)} групп")
+    print(f"Удалено {len(removed)} каналов из {found_count} групп")
     
     return new_channels
 
-def channels_to_m3u(channels):
-    """Преобразует список каналов обратно в M3U формат"""
-    result = ["#EXTM3U"]
-    for channel in channels:
-        result.append(channel['extinf'])
-        result.append(channel['url'])
-    return '\n'.join(result)
+def report_duplicates(channels, threshold=0.8):
+    """Выводит кластеры дубликатов каналов (нечёткое совпадение названий)"""
+    clusters = find_duplicate_clusters(channels, threshold)
+    if not clusters:
+        print("Дубликаты не найдены")
+        return clusters
+    print(f"Найдено {len(clusters)} групп дубликатов:")
+    print("-" * 50)
+    for i, members in enumerate(clusters, 1):
+        best = best_channel_index(channels, members)
+        print(f"{i:2d}. {normalize_title(channels[members[0]].name)}")
+        for index in members:
+            channel = channels[index]
+            marker = '*' if index == best else ' '
+            print(f"   {marker} {channel.name} [{channel.group}] {channel.url}")
+    return clusters
+
+def remove_duplicates(channels, threshold=0.8):
+    """Оставляет по одному лучшему каналу из каждой группы дубликатов"""
+    clusters = find_duplicate_clusters(channels, threshold)
+    new_channels = keep_best(channels, clusters)
+    print(f"Удалено {len(channels) - len(new_channels)} дубликатов из {len(clusters)} групп дубликатов")
+    return new_channels
+
+def check_channels(channels, action='remove', cache=None, **options):
+    """
+    Проверяет доступность потоков и удаляет или помечает недоступные каналы
+    
+    С кешем проверок по сети проверяются только URL без свежего результата в кеше.
+    """
+    urls = [channel.url for channel in channels]
+    if cache is not None:
+        stale_count = len(cache.stale(urls))
+        print(f"Проверка {stale_count} URL (ещё {len(set(urls)) - stale_count} взято из кеша)...")
+    else:
+        print(f"Проверка {len(set(urls))} URL...")
+    results = check_urls(urls, cache, **options)
+    return _apply_health(channels, results, action)
+
+def apply_cached_health(channels, cache, action='remove', max_age=None):
+    """
+    Удаляет или помечает недоступные каналы по кешу проверок, без обращения к сети
+
+    Устаревшие результаты (старше TTL статуса или max_age секунд) не применяются:
+    такие каналы остаются без изменений до новой проверки.
+    """
+    results = cache.lookup([channel.url for channel in channels], max_age=max_age)
+    print(f"В кеше проверок найдено {len(results)} свежих результатов для URL из {len(set(channel.url for channel in channels))}")
+    return _apply_health(channels, results, action)
+
+def _apply_health(channels, results, action):
+    counts = summarize(results)
+    print(f"Доступно: {counts[STATUS_OK]}, недоступно: {counts[STATUS_DEAD]}, "
+          f"не проверено (не HTTP): {counts[STATUS_SKIPPED]}")
+    new_channels = apply_results(channels, results, action)
+    if action == 'remove':
+        print(f"Удалено {len(channels) - len(new_channels)} недоступных каналов")
+    else:
+        print(f"Недоступные каналы помечены атрибутом {HEALTH_ATTR}=\"{STATUS_DEAD}\"")
+    return new_channels
+
+def run_with_index(args):
+    """
+    Выполняет операции по индексу групп (<файл>.idx) без разбора плейлиста
+    
+    Список групп берётся из индекса, а перестановка и удаление групп
+    записывают результат копированием диапазонов байтов исходного файла.
+    """
+    try:
+        with stage('parse'):
+            index = load_index(args.input_file)
+    except FileNotFoundError:
+        print(f"Ошибка: Файл '{args.input_file}' не найден")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Ошибка при чтении файла: {e}")
+        sys.exit(1)
+    
+    if not index.groups:
+        print("Ошибка: Не найдено каналов в плейлисте")
+        sys.exit(1)
+    
+    print(f"Загружено: {index.channel_count} каналов")
+    
+    if args.list:
+        print_groups(index.group_counts())
+    
+    group_order = list(index.groups)
+    
+    if args.swap:
+        group_order = swap_group_order(group_order, args.swap[0], args.swap[1]) or group_order
+    
+    if args.remove:
+        original_count = sum(index.groups[group][0] for group in group_order)
+        group_order, found_count = remove_group_order(group_order, args.remove)
+        removed_count = original_count - sum(index.groups[group][0] for group in group_order)
+        print(f"Удалено {removed_count} каналов из {found_count} групп")
+    
+    # Сохраняем результат, если были выполнены модифицирующие операции
+    if args.swap or args.remove:
+        output_file = args.output if args.output else args.input_file
+        try:
+            with stage('write'):
+                count = index.write_groups(output_file, group_order)
+            print(f"Плейлист успешно сохранен в '{output_file}'")
+            print(f"Итого: {count} каналов")
+        except Exception as e:
+            print(f"Ошибка при сохранении файла: {e}")
+            sys.exit(1)
+
+def run_with_snapshot(args):
+    """
+    Выполняет операции по индексу групп бинарного снимка (m3u_snapshot)
+    
+    Список групп и количество каналов берутся из индекса снимка без
+    декодирования каналов, а при сохранении читаются только каналы
+    оставшихся групп.
+    """
+    try:
+        with stage('parse'):
+            snapshot = Snapshot(args.input_file)
+            group_counts = snapshot.group_counts()
+    except Exception as e:
+        print(f"Ошибка при чтении файла: {e}")
+        sys.exit(1)
+    
+    with snapshot:
+        group_order = list(group_counts)
+        if not group_order:
+            print("Ошибка: Не найдено каналов в плейлисте")
+            sys.exit(1)
+        
+        print(f"Загружено: {sum(group_counts.values())} каналов")
+        
+        if args.list:
+            print_groups(group_counts.items())
+        
+        if args.swap:
+            group_order = swap_group_order(group_order, args.swap[0], args.swap[1]) or group_order
+        
+        if args.remove:
+            original_count = sum(group_counts[group] for group in group_order)
+            group_order, found_count = remove_group_order(group_order, args.remove)
+            removed_count = original_count - sum(group_counts[group] for group in group_order)
+            print(f"Удалено {removed_count} каналов из {found_count} групп")
+        
+        # Сохраняем результат, если были выполнены модифицирующие операции
+        if args.swap or args.remove:
+            output_file = args.output if args.output else args.input_file
+            try:
+                count = save_playlist(output_file, snapshot.group_channels(group_order), snapshot.header)
+                print(f"Плейлист успешно сохранен в '{output_file}'")
+                print(f"Итого: {count} каналов")
+            except Exception as e:
+                print(f"Ошибка при сохранении файла: {e}")
+                sys.exit(1)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -121,16 +287,26 @@ def main():
   %(prog)s playlist.m3u -s "Группа1" "Группа2" -r "Удалить" -o output.m3u
                                                        Комбинированная операция
   %(prog)s playlist.m3u --list --output new.m3u        Альтернативный синтаксис
+  %(prog)s playlist.m3u -d                            Найти дубликаты каналов
+  %(prog)s playlist.m3u --dedup -o clean.m3u           Оставить лучший канал из дубликатов
+  %(prog)s playlist.m3u -c --per-host 4 -o alive.m3u   Удалить недоступные каналы
+  %(prog)s playlist.m3u -c --health-cache probes.db    Проверить только устаревшие URL
+  %(prog)s playlist.m3u -H --health-cache probes.db --check-action annotate
+                                                       Пометить недоступные каналы по кешу
 
 Важные замечания:
   - Названия групп чувствительны к регистру
   - Если выходной файл не указан, входной файл будет перезаписан
+    (атомарно: при ошибке записи исходный файл не меняется)
+  - Файлы .gz и .zst читаются и записываются со сжатием
   - При использовании пробелов в названиях групп заключайте их в кавычки
+  - Группы и диапазоны байтов кешируются в файле <плейлист>.idx и
+    перестраиваются автоматически при изменении плейлиста
         '''
     )
     
     parser.add_argument('input_file', 
-                       help='Входной M3U файл для обработки')
+                       help='Входной M3U файл или URL http(s) для обработки')
     
     parser.add_argument('-o', '--output', 
                        help='Выходной файл (по умолчанию: перезаписывает входной файл)')
@@ -149,19 +325,124 @@ def main():
                        metavar='ГРУППА',
                        help='Удалить одну или несколько групп из плейлиста')
     
+    parser.add_argument('-d', '--duplicates', 
+                       action='store_true',
+                       help='Найти дубликаты каналов («Первый канал», «Первый канал HD», «Perviy kanal FHD»)')
+    
+    parser.add_argument('--dedup', 
+                       action='store_true',
+                       help='Удалить дубликаты, оставив лучший канал из каждой группы дубликатов')
+    
+    parser.add_argument('--similarity', 
+                       type=float,
+                       default=0.8,
+                       help='Порог сходства названий для дубликатов от 0 до 1 (по умолчанию 0.8)')
+    
+    parser.add_argument('-c', '--check', 
+                       action='store_true',
+                       help='Проверить доступность потоков и удалить (или пометить) недоступные каналы')
+    
+    parser.add_argument('-H', '--apply-health', 
+                       action='store_true',
+                       help='Удалить (или пометить) недоступные каналы по кешу проверок, без обращения к сети')
+    
+    parser.add_argument('--health-cache', 
+                       metavar='FILE',
+                       help='Файл кеша результатов проверки потоков (SQLite): -c проверяет только устаревшие URL, '
+                            '-l показывает число недоступных каналов, -H применяет кеш без сети')
+    
+    parser.add_argument('--health-max-age', 
+                       type=float,
+                       metavar='HOURS',
+                       help='Для -l и -H учитывать результаты из кеша проверок не старше HOURS часов '
+                            '(по умолчанию - TTL по статусу: недоступные 1 ч, доступные 6 ч)')
+    
+    parser.add_argument('--check-action', 
+                       choices=('remove', 'annotate'),
+                       default='remove',
+                       help='Что делать с недоступными каналами: remove - удалить, '
+                            f'annotate - пометить атрибутом {HEALTH_ATTR}="{STATUS_DEAD}" (по умолчанию remove)')
+    
+    parser.add_argument('--concurrency', 
+                       type=int,
+                       default=DEFAULT_CONCURRENCY,
+                       help=f'Максимум одновременных проверок (по умолчанию {DEFAULT_CONCURRENCY})')
+    
+    parser.add_argument('--per-host', 
+                       type=int,
+                       default=DEFAULT_PER_HOST,
+                       help=f'Максимум одновременных запросов к одному хосту (по умолчанию {DEFAULT_PER_HOST})')
+    
+    parser.add_argument('--rate', 
+                       type=float,
+                       help='Максимум запросов в секунду к одному хосту (по умолчанию без ограничения)')
+    
+    parser.add_argument('--timeout', 
+                       type=float,
+                       default=DEFAULT_TIMEOUT,
+                       help=f'Таймаут проверки одного URL в секундах (по умолчанию {DEFAULT_TIMEOUT:g})')
+    
+    parser.add_argument('--no-index', 
+                       action='store_true',
+                       help='Не использовать индекс групп (<файл>.idx), а каждый раз разбирать плейлист')
+    
+    parser.add_argument('-j', '--jobs', 
+                       type=int,
+                       default=1,
+                       help='Число процессов для разбора плейлиста с --no-index (0 - по числу ядер, по умолчанию 1)')
+    
+    add_stats_arguments(parser)
+    
     # Добавляем примеры в help
-    parser.usage = '%(prog)s input_file [-h] [-l] [-s ГРУППА1 ГРУППА2] [-r ГРУППА [ГРУППА ...]] [-o output_file]'
+    parser.usage = '%(prog)s input_file [-h] [-l] [-s ГРУППА1 ГРУППА2] [-r ГРУППА [ГРУППА ...]] [-d] [--dedup] [-c] [-H] [-o output_file]'
     
     args = parser.parse_args()
     
     # Проверяем, что хотя бы одна операция указана
-    if not any([args.list, args.swap, args.remove]):
-        parser.error('Необходимо указать хотя бы одну операцию: -l, -s, или -r. Используйте -h для помощи.')
+    if not any([args.list, args.swap, args.remove, args.duplicates, args.dedup, args.check, args.apply_health]):
+        parser.error('Необходимо указать хотя бы одну операцию: -l, -s, -r, -d, --dedup, -c или -H. Используйте -h для помощи.')
+    
+    if args.apply_health and not args.health_cache:
+        parser.error('Для -H укажите файл кеша проверок: --health-cache FILE')
+    
+    with instrument(args, 'iptv_manager'):
+        run(args)
+
+def health_max_age(args):
+    """Предельный возраст результатов кеша проверок в секундах (None - TTL по статусу)"""
+    return None if args.health_max_age is None else args.health_max_age * 3600
+
+def run(args):
+    """Выполняет операции над плейлистом по разобранным аргументам командной строки"""
+    # По умолчанию работаем через индекс групп, который перестраивается при изменении файла;
+    # поиск дубликатов и операции с доступностью потоков требуют разбора каналов
+    # сжатый входной файл (.gz, .zst) и URL индексировать нельзя, а у снимка индекс групп свой
+    if not args.no_index and not (args.duplicates or args.dedup or args.check or args.health_cache):
+        if is_snapshot(args.input_file):
+            run_with_snapshot(args)
+            return
+        # Индекс копирует байты текстового файла, поэтому снимок на выходе так не записать
+        if not (is_url(args.input_file) or compression_for(args.input_file)
+                or wants_snapshot(args.output or args.input_file)):
+            run_with_index(args)
+            return
+    
+    cache = None
+    if args.health_cache:
+        try:
+            cache = ProbeCache(args.health_cache)
+        except Exception as e:
+            print(f"Ошибка при открытии кеша проверок: {e}")
+            sys.exit(1)
     
-    # Читаем входной файл
+    # Читаем и парсим входной файл
+    header = []
     try:
-        with open(args.input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if args.jobs == 1:
+            with open_playlist(args.input_file) as f:
+                channels = parse_m3u_playlist(f, header)
+        else:
+            channels = list(read_channels_parallel(args.input_file, args.jobs, select=(has_url, ()), header=header))
     except FileNotFoundError:
         print(f"Ошибка: Файл '{args.input_file}' не найден")
         sys.exit(1)
@@ -169,9 +450,6 @@ def main():
         print(f"Ошибка при чтении файла: {e}")
         sys.exit(1)
     
-    # Парсим плейлист
-    channels = parse_m3u_playlist(content)
-    
     if not channels:
         print("Ошибка: Не найдено каналов в плейлисте")
         sys.exit(1)
@@ -182,27 +460,48 @@ def main():
     operations_performed = False
     
     if args.list:
-        list_groups(channels)
+        list_groups(channels, cache, health_max_age(args))
         operations_performed = True
     
     if args.swap:
-        channels = swap_groups(channels, args.swap[0], args.swap[1])
+        with stage('process'):
+            channels = swap_groups(channels, args.swap[0], args.swap[1])
         operations_performed = True
     
     if args.remove:
-        channels = remove_groups(channels, args.remove)
+        with stage('process'):
+            channels = remove_groups(channels, args.remove)
+        operations_performed = True
+    
+    if args.duplicates:
+        with stage('dedup'):
+            report_duplicates(channels, args.similarity)
+        operations_performed = True
+    
+    if args.dedup:
+        with stage('dedup'):
+            channels = remove_duplicates(channels, args.similarity)
+        operations_performed = True
+    
+    if args.apply_health:
+        with stage('check'):
+            channels = apply_cached_health(channels, cache, args.check_action, health_max_age(args))
+        operations_performed = True
+    
+    if args.check:
+        with stage('check'):
+            channels = check_channels(channels, args.check_action, cache, concurrency=args.concurrency,
+                                      per_host=args.per_host, rate=args.rate, timeout=args.timeout)
         operations_performed = True
     
     # Сохраняем результат, если были выполнены модифицирующие операции
-    if args.swap or args.remove:
+    if args.swap or args.remove or args.dedup or args.check or args.apply_health:
         # Определяем выходной файл
         output_file = args.output if args.output else args.input_file
         
-        # Сохраняем результат
+        # Сохраняем результат: потоково во временный файл, который затем подменяет выходной
         try:
-            m3u_content = channels_to_m3u(channels)
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(m3u_content)
+            save_playlist(output_file, channels, header)
             print(f"Плейлист успешно сохранен в '{output_file}'")
             print(f"Итого: {len(channels)} каналов")
         except Exception as e:
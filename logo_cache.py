@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Локальное зеркало логотипов каналов (tvg-logo)
+
+Из плейлиста собираются различные URL логотипов и загружаются параллельно
+через stream_check.HttpClient (keep-alive, ограничение соединений на хост).
+Файлы хранятся в каталоге кеша по хешу содержимого
+(objects/ab/<sha256>.png), поэтому одинаковые логотипы с разных URL и от
+разных провайдеров занимают место один раз. manifest.json связывает URL
+с хешем и хранит ETag и Last-Modified: при повторном запуске загружаются
+только новые URL, а известные проверяются условным запросом (не чаще
+--max-age), так что передаются только изменившиеся логотипы.
+
+С --base-url атрибуты tvg-logo переписываются на адреса зеркала
+(<base-url>/objects/ab/<sha256>.png) в отдельном выходном файле (-o):
+исходный плейлист с настоящими URL логотипов остаётся источником для
+повторных запусков. Логотипы, которые загрузить не удалось, сохраняют
+исходный URL.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urljoin, urlsplit
+
+from m3u_parser import is_url, read_channels
+from m3u_remote import conditional_headers
+from m3u_snapshot import save_playlist
+from m3u_stats import add_stats_arguments, instrument, stage
+from m3u_writer import atomic_output
+from stream_check import DEFAULT_PER_HOST, MAX_REDIRECTS, HttpClient
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+OBJECTS_DIR = 'objects'
+
+DEFAULT_CACHE_DIR = 'logos'
+DEFAULT_CONCURRENCY = 32
+DEFAULT_MAX_AGE_HOURS = 24.0
+# Таймаут подключения и каждого чтения ответа (очередь хоста не учитывается)
+LOGO_TIMEOUT = 30.0
+MAX_LOGO_BYTES = 5 * 1024 * 1024
+
+STATUS_NEW = 'new'
+STATUS_CHANGED = 'changed'
+STATUS_NOT_MODIFIED = 'not-modified'
+STATUS_FRESH = 'fresh'
+STATUS_FAILED = 'failed'
+
+_CONTENT_TYPES = {
+    'image/png': '.png', 'image/jpeg': '.jpg', 'image/jpg': '.jpg', 'image/gif': '.gif', 'image/webp': '.webp',
+    'image/svg+xml': '.svg', 'image/x-icon': '.ico', 'image/vnd.microsoft.icon': '.ico', 'image/bmp': '.bmp',
+}
+_EXTENSIONS = {ext: ext for ext in _CONTENT_TYPES.values()}
+_EXTENSIONS['.jpeg'] = '.jpg'
+_REDIRECT_CODES = frozenset((301, 302, 303, 307, 308))
+
+
+def collect_logo_urls(channels):
+    """Различные URL http(s) из атрибутов tvg-logo в порядке первого появления"""
+    urls = {}
+    for channel in channels:
+        url = channel.get_attr('tvg-logo')
+        if url and is_url(url.strip()):
+            urls[url.strip()] = None
+    return list(urls)
+
+
+def logo_extension(url, content_type):
+    """Расширение файла логотипа по Content-Type, иначе по URL"""
+    ext = _CONTENT_TYPES.get(content_type.split(';', 1)[0].strip().lower())
+    if ext is None:
+        ext = _EXTENSIONS.get(os.path.splitext(urlsplit(url).path)[1].lower(), '')
+    return ext
+
+
+class LogoCache:
+    """Каталог логотипов: файлы по хешу содержимого и manifest.json (URL -> хеш, ETag, Last-Modified)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.logos = {}
+        try:
+            with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.logos = data['logos']
+        except (OSError, ValueError):
+            pass
+
+    def path(self, url):
+        """Путь к файлу логотипа относительно каталога кеша или None, если файла нет"""
+        entry = self.logos.get(url)
+        if entry is None or not os.path.exists(os.path.join(self.directory, entry['object'])):
+            return None
+        return entry['object']
+
+    def is_fresh(self, url, max_age, now):
+        """Логотип проверялся не раньше max_age секунд назад"""
+        entry = self.logos.get(url)
+        return entry is not None and now - entry['checked'] < max_age and self.path(url) is not None
+
+    def open_temp(self):
+        """Временный файл для загружаемого логотипа: (файл, путь)"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        return open(fd, 'wb'), tmp_path
+
+    def store(self, url, tmp_path, digest, ext, headers):
+        """
+        Переносит загруженный логотип в кеш
+
+        Если файл с таким содержимым уже есть (тот же логотип по другому
+        URL), загруженная копия удаляется.
+
+        Returns:
+            bool: Содержимое логотипа по этому URL изменилось
+        """
+        obj = os.path.join(OBJECTS_DIR, digest[:2], digest + ext)
+        target = os.path.join(self.directory, obj)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, target)
+        previous = self.logos.get(url)
+        self.logos[url] = {
+            'object': obj,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'checked': time.time(),
+        }
+        return previous is not None and previous['object'] != obj
+
+    def mark_checked(self, url):
+        self.logos[url]['checked'] = time.time()
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_output(os.path.join(self.directory, MANIFEST_NAME)) as f:
+            json.dump({'version': MANIFEST_VERSION, 'logos': self.logos}, f, ensure_ascii=False, indent=1)
+
+    def prune(self):
+        """Удаляет файлы, на которые не ссылается ни один URL; возвращает их число"""
+        referenced = {os.path.normpath(entry['object']) for entry in self.logos.values()}
+        removed = 0
+        root = os.path.join(self.directory, OBJECTS_DIR)
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if os.path.relpath(path, self.directory) not in referenced:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+class _LogoSink:
+    """Запись тела ответа во временный файл кеша с подсчётом sha256"""
+
+    def __init__(self, cache, url):
+        self.cache = cache
+        self.url = url
+        self._file = None
+
+    def open(self, headers):
+        content_type = headers.get('content-type', '')
+        if content_type.lower().startswith('text/'):
+            raise ValueError(f"не изображение ({content_type})")
+        self.ext = logo_extension(self.url, content_type)
+        self._file, self._tmp_path = self.cache.open_temp()
+        self._hash = hashlib.sha256()
+        self._size = 0
+        return self.write
+
+    def write(self, data):
+        self._size += len(data)
+        if self._size > MAX_LOGO_BYTES:
+            raise ValueError(f"логотип больше {MAX_LOGO_BYTES // (1024 * 1024)} МБ")
+        self._hash.update(data)
+        self._file.write(data)
+
+    def commit(self, headers):
+        self._file.close()
+        self._file = None
+        return self.cache.store(self.url, self._tmp_path, self._hash.hexdigest(), self.ext, headers)
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._tmp_path)
+
+
+async def _fetch_logo(client, cache, url):
+    known = cache.path(url) is not None
+    headers = conditional_headers(cache.logos.get(url)) if known else None
+    target = url
+    for _ in range(MAX_REDIRECTS + 1):
+        sink = _LogoSink(cache, url)
+        try:
+            response = await client.request('GET', target, headers, sink=sink.open)
+            location = response.headers.get('location')
+            if response.code in _REDIRECT_CODES and location:
+                target = urljoin(target, location)
+                continue
+            if response.code == 304 and known:
+                cache.mark_checked(url)
+                return STATUS_NOT_MODIFIED
+            if response.code != 200:
+                raise ValueError(f"HTTP {response.code}")
+            changed = sink.commit(response.headers)
+            if not known:
+                return STATUS_NEW
+            return STATUS_CHANGED if changed else STATUS_NOT_MODIFIED
+        finally:
+            sink.discard()
+    raise ValueError("Слишком много перенаправлений")
+
+
+async def _fetch_all(urls, cache, concurrency, per_host):
+    client = HttpClient(per_host, timeout=LOGO_TIMEOUT)
+    limit = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def worker(url):
+        async with limit:
+            try:
+                results[url] = (await _fetch_logo(client, cache, url), '')
+            except asyncio.TimeoutError:
+                results[url] = (STATUS_FAILED, 'таймаут')
+            except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                results[url] = (STATUS_FAILED, str(e) or type(e).__name__)
+
+    try:
+        await asyncio.gather(*(worker(url) for url in urls))
+    finally:
+        await client.close()
+    return results
+
+
+def fetch_logos(urls, cache, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                max_age=DEFAULT_MAX_AGE_HOURS * 3600, refresh=False):
+    """
+    Загружает логотипы в кеш и сохраняет manifest.json
+
+    Недавно проверенные логотипы (моложе max_age секунд) не запрашиваются,
+    если не задан refresh.
+
+    Returns:
+        dict: URL -> (статус STATUS_*, описание ошибки)
+    """
+    now = time.time()
+    results = {}
+    pending = []
+    for url in urls:
+        if not refresh and cache.is_fresh(url, max_age, now):
+            results[url] = (STATUS_FRESH, '')
+        else:
+            pending.append(url)
+    if pending:
+        with stage('fetch'):
+            results.update(asyncio.run(_fetch_all(pending, cache, concurrency, per_host)))
+    cache.save()
+    return results
+
+
+def rewrite_logos(channels, cache, base_url):
+    """Потоково заменяет tvg-logo на адреса зеркала для логотипов, которые есть в кеше"""
+    base_url = base_url.rstrip('/')
+    mirrored = {}
+    for channel in channels:
+        url = channel.get_attr('tvg-logo')
+        if url:
+            url = url.strip()
+            if url not in mirrored:
+                path = cache.path(url)
+                mirrored[url] = None if path is None else f"{base_url}/{path.replace(os.sep, '/')}"
+            if mirrored[url] is not None:
+                channel.set_attr('tvg-logo', mirrored[url])
+        yield channel
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Загрузка логотипов каналов (tvg-logo) в локальный кеш-зеркало')
+    parser.add_argument('playlist', help='Плейлист (M3U, .gz, .zst, снимок или URL http(s))')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Каталог логотипов (по умолчанию {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--base-url', help='Переписать tvg-logo на адреса зеркала: BASE_URL/objects/...')
+    parser.add_argument('-o', '--output',
+                        help='Выходной файл для --base-url (обязателен и не может совпадать с плейлистом)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Одновременных загрузок (по умолчанию {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help=f'Соединений на хост (по умолчанию {DEFAULT_PER_HOST})')
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE_HOURS, metavar='HOURS',
+                        help=f'Не перепроверять логотипы, проверенные за последние HOURS часов '
+                             f'(по умолчанию {DEFAULT_MAX_AGE_HOURS:g})')
+    parser.add_argument('--refresh', action='store_true', help='Перепроверить все логотипы условным запросом')
+    parser.add_argument('--prune', action='store_true', help='Удалить файлы, на которые не ссылается ни один URL')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Показать логотипы, которые не удалось загрузить')
+    add_stats_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.output and not args.base_url:
+        parser.error('Выходной файл имеет смысл только с --base-url')
+    if args.base_url:
+        # Плейлист с адресами зеркала не годится для повторного запуска: в нём нет исходных URL логотипов
+        if not args.output:
+            parser.error('Для --base-url укажите выходной файл: -o FILE')
+        if not is_url(args.playlist) and os.path.abspath(args.output) == os.path.abspath(args.playlist):
+            parser.error('Выходной файл должен отличаться от плейлиста: исходные URL логотипов нужны для обновления')
+
+    with instrument(args, 'logo_cache'):
+        try:
+            urls = collect_logo_urls(read_channels(args.playlist))
+        except FileNotFoundError:
+            print(f"Ошибка: Файл '{args.playlist}' не найден")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Ошибка при чтении файла: {e}")
+            sys.exit(1)
+
+        cache = LogoCache(args.cache_dir)
+        try:
+            results = fetch_logos(urls, cache, args.concurrency, args.per_host, args.max_age * 3600, args.refresh)
+        except OSError as e:
+            print(f"Ошибка при записи в каталог {args.cache_dir}: {e}")
+            sys.exit(1)
+
+        counts = {}
+        for status, _ in results.values():
+            counts[status] = counts.get(status, 0) + 1
+        objects = {cache.path(url) for url in urls} - {None}
+        print(f"Логотипов: {len(urls)} различных URL, {len(objects)} различных файлов в {args.cache_dir}")
+        print(f"  Загружено новых: {counts.get(STATUS_NEW, 0)}, изменилось: {counts.get(STATUS_CHANGED, 0)}, "
+              f"не изменилось: {counts.get(STATUS_NOT_MODIFIED, 0)}, "
+              f"проверены недавно: {counts.get(STATUS_FRESH, 0)}, ошибок: {counts.get(STATUS_FAILED, 0)}")
+        if args.verbose:
+            for url, (status, detail) in results.items():
+                if status == STATUS_FAILED:
+                    print(f"    {url}: {detail}")
+
+        if args.prune:
+            print(f"  Удалено файлов без ссылок: {cache.prune()}")
+
+        if args.base_url:
+            output = args.output
+            header = []
+            try:
+                count = save_playlist(output, rewrite_logos(read_channels(args.playlist, header), cache, args.base_url),
+                                      header)
+            except Exception as e:
+                print(f"Ошибка при сохранении файла: {e}")
+                sys.exit(1)
+            print(f"Записано {count} каналов в {output}, tvg-logo указывают на {args.base_url}")
+
+if __name__ == "__main__":
+    main()
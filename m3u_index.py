@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Индекс групп плейлиста в файле-спутнике <плейлист>.idx
+
+Индекс хранит для каждой группы количество каналов и диапазоны байтов
+их блоков в исходном файле. Список групп выдаётся без разбора плейлиста,
+а перестановка и удаление групп сводятся к копированию диапазонов байтов.
+Индекс привязан к размеру, времени изменения и хешу содержимого файла
+и перестраивается автоматически, если файл изменился.
+"""
+import hashlib
+import json
+import mmap
+import os
+from collections import OrderedDict
+
+import m3u_stats
+from m3u_parser import BUFFER_SIZE, DEFAULT_GROUP, EXTINF, Extinf, compression_for
+from m3u_writer import atomic_output
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 1
+
+_EXTINF_BYTES = EXTINF.encode()
+_HASH_CHUNK = 1024 * 1024
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def file_digest(path):
+    """Хеш содержимого файла"""
+    digest = _new_hash()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PlaylistIndex:
+    """Группы плейлиста с количеством каналов и диапазонами байтов"""
+
+    def __init__(self, path, size, mtime_ns, digest, header_end, tail_newline, groups):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest = digest
+        self.header_end = header_end
+        self.tail_newline = tail_newline
+        self.groups = groups  # OrderedDict: группа -> [количество, [[начало, конец], ...]]
+
+    @property
+    def channel_count(self):
+        return sum(count for count, _ in self.groups.values())
+
+    def group_counts(self):
+        """Пары (группа, количество каналов) в порядке появления групп"""
+        return [(group, count) for group, (count, _) in self.groups.items()]
+
+    def to_json(self):
+        return {
+            'version': INDEX_VERSION,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'digest': self.digest,
+            'header_end': self.header_end,
+            'tail_newline': self.tail_newline,
+            'groups': [[group, count, ranges] for group, (count, ranges) in self.groups.items()],
+        }
+
+    @classmethod
+    def from_json(cls, path, data):
+        groups = OrderedDict((group, [count, ranges]) for group, count, ranges in data['groups'])
+        return cls(path, data['size'], data['mtime_ns'], data['digest'],
+                   data['header_end'], data['tail_newline'], groups)
+
+    def write_groups(self, output_path, group_order):
+        """
+        Записывает плейлист из групп в заданном порядке, копируя диапазоны
+        байтов исходного файла без разбора каналов. Запись идёт во временный
+        файл, поэтому выходной файл может совпадать с исходным; в файл .gz
+        или .zst диапазоны копируются через сжатие.
+
+        Returns:
+            int: Количество записанных каналов
+        """
+        ranges = [(0, self.header_end)] if self.header_end else []
+        count = 0
+        for group in group_order:
+            group_count, group_ranges = self.groups[group]
+            ranges.extend(group_ranges)
+            count += group_count
+
+        # sendfile пишет прямо в дескриптор, поэтому только в несжатый файл без буфера
+        use_sendfile = hasattr(os, 'sendfile') and compression_for(output_path) is None
+        with open(self.path, 'rb') as src, \
+                atomic_output(output_path, binary=True, buffering=0 if use_sendfile else BUFFER_SIZE) as dst:
+            _copy_ranges(src, dst, ranges, self.size, self.tail_newline, use_sendfile)
+        if m3u_stats.current is not None:
+            m3u_stats.current.bytes_read += sum(end - start for start, end in ranges)
+            m3u_stats.count('channels_written', count)
+        return count
+
+
+def _copy_ranges(src, dst, ranges, size, tail_newline, use_sendfile):
+    """Копирует диапазоны байтов через sendfile или через mmap"""
+    if not ranges:
+        return
+    mm = None if use_sendfile else mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        for start, end in ranges:
+            if use_sendfile:
+                offset = start
+                while offset < end:
+                    sent = os.sendfile(dst.fileno(), src.fileno(), offset, end - offset)
+                    if not sent:
+                        raise OSError(f"Неожиданный конец файла {src.name}")
+                    offset += sent
+            else:
+                dst.write(mm[start:end])
+            # Последний блок файла может быть без перевода строки
+            if end == size and not tail_newline:
+                dst.write(b'\n')
+    finally:
+        if mm is not None:
+            mm.close()
+
+
+def build_index(path):
+    """Строит индекс групп за один проход по файлу в бинарном режиме"""
+    digest = _new_hash()
+    groups = OrderedDict()
+    header_end = None
+    offset = 0
+    last_line = b''
+
+    # Текущий блок канала: начало, группа и признак наличия URL
+    block_start = None
+    block_group = None
+    block_has_url = False
+
+    def close_block(end):
+        if block_start is None or not block_has_url:
+            return  # Каналы без URL в плейлист не попадают
+        entry = groups.get(block_group)
+        if entry is None:
+            entry = groups[block_group] = [0, []]
+        entry[0] += 1
+        ranges = entry[1]
+        if ranges and ranges[-1][1] == block_start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([block_start, end])
+
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        for line in f:
+            digest.update(line)
+            stripped = line.strip()
+            if stripped.startswith(_EXTINF_BYTES):
+                close_block(offset)
+                if header_end is None:
+                    header_end = offset
+                block_start = offset
+                group_title = Extinf(stripped.decode('utf-8', errors='replace')).get('group-title')
+                block_group = DEFAULT_GROUP if group_title is None else group_title
+                block_has_url = False
+            elif stripped and block_start is not None and not stripped.startswith(b'#'):
+                block_has_url = True
+            offset += len(line)
+            last_line = line
+        close_block(offset)
+
+    if m3u_stats.current is not None:
+        m3u_stats.current.bytes_read += offset
+        m3u_stats.count('channels_parsed', sum(entry[0] for entry in groups.values()))
+    return PlaylistIndex(
+        path, stat.st_size, stat.st_mtime_ns, digest.hexdigest(),
+        offset if header_end is None else header_end,
+        last_line.endswith(b'\n') or not last_line, groups)
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def save_index(index):
+    """Сохраняет индекс в файл-спутник (ошибки записи не критичны)"""
+    sidecar = index_path(index.path)
+    tmp_path = sidecar + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index.to_json(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, sidecar)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_index(path):
+    """
+    Возвращает актуальный индекс плейлиста.
+
+    Если размер и время изменения совпадают с сохранёнными, индекс
+    используется сразу. Если изменилось только время, сверяется хеш
+    содержимого. В остальных случаях индекс перестраивается и сохраняется.
+    """
+    stat = os.stat(path)
+    try:
+        with open(index_path(path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_VERSION:
+            data = None
+    except (OSError, ValueError):
+        data = None
+
+    if data is not None and data['size'] == stat.st_size:
+        index = PlaylistIndex.from_json(path, data)
+        if data['mtime_ns'] == stat.st_mtime_ns:
+            return index
+        if file_digest(path) == index.digest:
+            index.mtime_ns = stat.st_mtime_ns
+            save_index(index)
+            return index
+
+    index = build_index(path)
+    save_index(index)
+    return index
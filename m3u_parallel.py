@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Параллельный разбор больших плейлистов по ядрам процессора
+
+Файл делится на куски по границам строк #EXTINF, куски разбираются и
+фильтруются в отдельных процессах, а результаты выдаются в исходном
+порядке. Поскольку каждый блок канала целиком попадает в один кусок,
+результат совпадает с последовательным разбором через iter_channels.
+"""
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import m3u_stats
+from m3u_parser import EXTINF, compression_for, is_snapshot, is_url, iter_channels, read_channels
+
+# Файлы меньше порога разбираются в одном процессе: запуск пула дороже разбора
+PARALLEL_THRESHOLD = 16 * 1024 * 1024
+
+# Кусков больше, чем процессов, чтобы процессы загружались равномерно
+CHUNKS_PER_JOB = 4
+
+_EXTINF_BYTES = EXTINF.encode()
+
+
+def has_url(channel):
+    """Фильтр: канал с URL потока"""
+    return channel.url is not None
+
+
+def extgrp_in(channel, extgrp_keys):
+    """Фильтр: #EXTGRP канала (в нижнем регистре) входит в набор"""
+    return channel.extgrp is not None and channel.extgrp.lower() in extgrp_keys
+
+
+def resolve_jobs(jobs):
+    """Число процессов: 0 или None означает все доступные ядра"""
+    if not jobs:
+        return os.cpu_count() or 1
+    return max(1, jobs)
+
+
+def split_chunks(path, count):
+    """
+    Делит файл на count кусков (или меньше), начало каждого куска,
+    кроме первого, приходится на начало строки #EXTINF
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, count):
+            target = max(size * i // count, bounds[-1])
+            f.seek(target)
+            if target:
+                f.readline()  # Дочитываем строку, в середину которой попали
+            boundary = None
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                if line.lstrip().startswith(_EXTINF_BYTES):
+                    boundary = offset
+                    break
+            if boundary is None:
+                break
+            if boundary > bounds[-1]:
+                bounds.append(boundary)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_chunk(task):
+    """Разбирает кусок файла в рабочем процессе"""
+    path, start, end, select, collect = task
+    # Счётчики разбора собираются в процессе и возвращаются вместе с каналами
+    m3u_stats.current = m3u_stats.Stats(None) if collect else None
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Первый кусок может начинаться с BOM, как и при обычном чтении
+    text = data.decode('utf-8-sig' if start == 0 else 'utf-8')
+    header = []
+    channels = iter_channels(io.StringIO(text, newline=None), header)
+    if select is not None:
+        func, args = select
+        channels = [channel for channel in channels if func(channel, *args)]
+    else:
+        channels = list(channels)
+    counters = m3u_stats.current.counters if collect else None
+    return header, channels, counters
+
+
+def read_channels_parallel(path, jobs=None, select=None, header=None, threshold=PARALLEL_THRESHOLD):
+    """
+    Читает каналы плейлиста в нескольких процессах с сохранением порядка
+
+    Args:
+        path (str): Путь к плейлисту
+        jobs (int): Число процессов (0 или None - по числу ядер, 1 - без пула)
+        select (tuple): Фильтр (функция уровня модуля, кортеж аргументов),
+            применяется в рабочих процессах; функция принимает канал и аргументы
+        header (list): Если передан, в него добавляется строка #EXTM3U
+        threshold (int): Файлы меньше этого размера в байтах разбираются
+            в одном процессе
+    """
+    jobs = resolve_jobs(jobs)
+    # Сжатый файл, снимок и URL нельзя разрезать на куски по смещениям
+    if (jobs == 1 or is_url(path) or compression_for(path) or os.path.getsize(path) < threshold
+            or is_snapshot(path)):
+        channels = read_channels(path, header)
+        if select is None:
+            yield from channels
+        else:
+            func, args = select
+            for channel in channels:
+                if func(channel, *args):
+                    yield channel
+        return
+
+    stats = m3u_stats.current
+    if stats is None:
+        yield from _read_pool(path, jobs, select, header, None)
+    else:
+        stats.bytes_read += os.path.getsize(path)
+        # Время ожидания готовых кусков относится к разбору
+        yield from stats.timed(_read_pool(path, jobs, select, header, stats), 'parse')
+
+
+def _read_pool(path, jobs, select, header, stats):
+    collect = stats is not None
+    chunks = split_chunks(path, jobs * CHUNKS_PER_JOB)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Окно из запущенных задач ограничивает число готовых кусков в памяти
+        pending = deque()
+        tasks = iter(chunks)
+        for start, end in tasks:
+            pending.append(executor.submit(_parse_chunk, (path, start, end, select, collect)))
+            if len(pending) >= jobs * 2:
+                break
+        while pending:
+            chunk_header, channels, counters = pending.popleft().result()
+            for start, end in tasks:
+                pending.append(executor.submit(_parse_chunk, (path, start, end, select, collect)))
+                break
+            if header is not None and not header and chunk_header:
+                header.append(chunk_header[0])
+            if counters:
+                stats.merge_counters(counters)
+            yield from channels
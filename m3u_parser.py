@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""Общий потоковый парсер M3U плейлистов, используемый всеми утилитами"""
+import gzip
+import os
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+import m3u_stats
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTM3U = '#EXTM3U'
+EXTINF = '#EXTINF:'
+EXTGRP = '#EXTGRP:'
+DEFAULT_GROUP = 'Без группы'
+
+# Размер буфера чтения/записи: плейлисты провайдеров бывают на сотни мегабайт
+BUFFER_SIZE = 1024 * 1024
+
+# Токен атрибута: ключ и необязательное значение в кавычках или без них
+_ATTR_TOKEN_RE = re.compile(r'([^\s=,"]+)(?:=(?:"([^"]*)"?|([^\s,"]*)))?')
+_SPACE_RE = re.compile(r'\s*')
+# Длительность - только число со знаком: атрибут сразу после неё разбирается как атрибут
+_DURATION_RE = re.compile(r'\s*(?:-?\d+(?:\.\d+)?)?')
+
+# Сжатие плейлиста определяется по расширению файла
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+
+# Сигнатура бинарного снимка (m3u_snapshot): снимок распознаётся по содержимому
+SNAPSHOT_MAGIC = b'\x89M3USNAP'
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443, 'rtmp': 1935, 'rtsp': 554}
+
+
+def normalize_url(url):
+    """Приводит URL к каноническому виду: схема и хост в нижнем регистре, без порта по умолчанию и фрагмента"""
+    try:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        netloc = parts.hostname or ''
+        if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+            netloc = f'{netloc}:{parts.port}'
+        if parts.username is not None:
+            userinfo = parts.username if parts.password is None else f'{parts.username}:{parts.password}'
+            netloc = f'{userinfo}@{netloc}'
+    except ValueError:
+        return url.strip()
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+class Extinf:
+    """
+    Токенизатор строки #EXTINF:<длительность> key="value" ...,Название
+
+    Строка разбирается лениво, за один проход и только при первом
+    обращении к атрибутам или названию. При сериализации исходная строка
+    возвращается как есть, заново собираются только изменённые атрибуты.
+    Название начинается после первой запятой вне кавычек, поэтому
+    запятые внутри названия канала сохраняются.
+    """
+    __slots__ = ('raw', '_duration', '_spans', '_attrs', '_title_pos', '_changes')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._spans = None
+        self._changes = None
+
+    def __str__(self):
+        if not self._changes:
+            return self.raw
+        return self._serialize()
+
+    def __repr__(self):
+        return f'Extinf({str(self)!r})'
+
+    def _parse(self):
+        raw = self.raw
+        end = len(raw)
+        pos = _DURATION_RE.match(raw, len(EXTINF)).end()
+        self._duration = raw[len(EXTINF):pos].strip()
+        spans = []
+        attrs = {}
+        title_pos = end
+        while True:
+            pos = _SPACE_RE.match(raw, pos).end()
+            if pos >= end:
+                break
+            if raw[pos] == ',':
+                title_pos = pos
+                break
+            match = _ATTR_TOKEN_RE.match(raw, pos)
+            if match is None:
+                # Посторонний символ (например, непарная кавычка) пропускаем
+                pos += 1
+                continue
+            key, quoted, bare = match.groups()
+            spans.append((key, pos, match.end()))
+            if key not in attrs:
+                attrs[key] = quoted if quoted is not None else (bare or '')
+            pos = match.end()
+        self._spans = spans
+        self._attrs = attrs
+        self._title_pos = title_pos
+
+    def _serialize(self):
+        raw = self.raw
+        changes = self._changes
+        parts = []
+        written = set()
+        prev = 0
+        for key, start, end in self._spans:
+            if key not in changes:
+                continue
+            value = changes[key]
+            if value is None or key in written:
+                # Удалённый атрибут или повтор уже записанного ключа
+                parts.append(raw[prev:start].rstrip())
+            else:
+                parts.append(raw[prev:start])
+                # Атрибут мог идти вплотную к длительности или предыдущему атрибуту
+                if not raw[start - 1].isspace():
+                    parts.append(' ')
+                parts.append(f'{key}="{value}"')
+                written.add(key)
+            prev = end
+        title_pos = self._title_pos
+        parts.append(raw[prev:title_pos].rstrip())
+        for key, value in changes.items():
+            if value is not None and key not in written:
+                parts.append(f' {key}="{value}"')
+        # В строке без запятой добавляется разделитель перед (пустым) названием
+        parts.append(raw[title_pos:] if title_pos < len(raw) else ',')
+        return ''.join(parts)
+
+    @property
+    def duration(self):
+        """Длительность (для потоков обычно -1)"""
+        if self._spans is None:
+            self._parse()
+        return self._duration
+
+    @property
+    def attrs(self):
+        """Все атрибуты в виде словаря с учётом изменений"""
+        if self._spans is None:
+            self._parse()
+        attrs = dict(self._attrs)
+        if self._changes:
+            for key, value in self._changes.items():
+                if value is None:
+                    attrs.pop(key, None)
+                else:
+                    attrs[key] = value
+        return attrs
+
+    @property
+    def title(self):
+        """Название канала (всё после первой запятой вне кавычек)"""
+        if self._spans is None:
+            self._parse()
+        return self.raw[self._title_pos + 1:].strip()
+
+    def get(self, key, default=None):
+        """Значение атрибута или default, если атрибута нет"""
+        if self._spans is None:
+            self._parse()
+        if self._changes and key in self._changes:
+            value = self._changes[key]
+            return default if value is None else value
+        return self._attrs.get(key, default)
+
+    def set(self, key, value):
+        """Устанавливает значение атрибута; None удаляет атрибут"""
+        if self._spans is None:
+            self._parse()
+        if self._changes is None:
+            self._changes = {}
+        self._changes[key] = value
+
+
+class Channel:
+    """
+    Компактная запись канала плейлиста.
+
+    Хранит строку #EXTINF, значение #EXTGRP, прочие директивы блока
+    (#EXTVLCOPT и т.п.) и URL потока. Благодаря __slots__ объект не несёт
+    словаря атрибутов и занимает минимум памяти. Строка #EXTINF хранится
+    как есть и передаётся токенизатору Extinf только при первом обращении
+    к атрибутам или названию.
+    """
+    __slots__ = ('_extinf', 'extgrp', 'directives', 'url')
+
+    def __init__(self, extinf, extgrp=None, directives=None, url=None):
+        self._extinf = extinf
+        self.extgrp = extgrp
+        self.directives = directives
+        self.url = url
+
+    def __reduce__(self):
+        # Компактная передача между процессами при параллельном разборе
+        return (Channel, (self.extinf, self.extgrp, self.directives, self.url))
+
+    def copy(self):
+        """Независимая копия: изменение атрибутов копии не затрагивает исходный канал"""
+        directives = list(self.directives) if self.directives else None
+        return Channel(self.extinf, self.extgrp, directives, self.url)
+
+    def __repr__(self):
+        return f'Channel({self.name!r}, group={self.group!r}, url={self.url!r})'
+
+    @property
+    def extinf(self):
+        """Строка #EXTINF с учётом изменённых атрибутов"""
+        return str(self._extinf)
+
+    @extinf.setter
+    def extinf(self, value):
+        self._extinf = value
+
+    @property
+    def info(self):
+        """Токенизатор строки #EXTINF"""
+        info = self._extinf
+        if info.__class__ is str:
+            info = self._extinf = Extinf(info)
+        return info
+
+    @property
+    def attrs(self):
+        """Атрибуты строки #EXTINF в виде словаря"""
+        return self.info.attrs
+
+    @property
+    def name(self):
+        """Название канала"""
+        return self.info.title
+
+    @property
+    def group_title(self):
+        """Значение group-title или None, если атрибута нет"""
+        return self.info.get('group-title')
+
+    @property
+    def group(self):
+        """Группа канала для группировки (group-title или «Без группы»)"""
+        group_title = self.info.get('group-title')
+        return DEFAULT_GROUP if group_title is None else group_title
+
+    def get_attr(self, key, default=None):
+        """Значение атрибута #EXTINF или default"""
+        return self.info.get(key, default)
+
+    def set_attr(self, key, value):
+        """Устанавливает атрибут #EXTINF; None удаляет атрибут"""
+        self.info.set(key, value)
+
+    def add_directive(self, line):
+        if self.directives is None:
+            self.directives = [line]
+        else:
+            self.directives.append(line)
+
+    def lines(self, keep_extgrp=True):
+        """Строки блока канала в порядке записи в плейлист (без переводов строк)"""
+        result = [self.extinf]
+        if keep_extgrp and self.extgrp is not None:
+            result.append(EXTGRP + self.extgrp)
+        if self.directives:
+            result.extend(self.directives)
+        if self.url is not None:
+            result.append(self.url)
+        return result
+
+    def to_m3u(self, keep_extgrp=True):
+        """Блок канала в текстовом виде M3U с завершающим переводом строки"""
+        return '\n'.join(self.lines(keep_extgrp)) + '\n'
+
+
+def iter_channels(lines, header=None):
+    """
+    Потоково разбирает строки плейлиста и выдаёт объекты Channel.
+
+    Блок канала начинается со строки #EXTINF и продолжается до следующей
+    #EXTINF. Первая строка без '#' внутри блока считается URL потока.
+    Память расходуется только на текущий канал. Строки вне блока канала
+    и лишние строки после URL пропускаются как некорректные.
+
+    Args:
+        lines: Итерируемый источник строк (например, открытый файл)
+        header (list): Если передан, в него добавляется строка #EXTM3U
+    """
+    # Снимок (m3u_snapshot.Snapshot) выдаёт каналы прямо из своих колонок
+    snapshot_channels = getattr(lines, 'iter_channels', None)
+    if snapshot_channels is not None:
+        channels = snapshot_channels(header)
+    else:
+        channels = _iter_channels(lines, header)
+    stats = m3u_stats.current
+    return channels if stats is None else stats.parsed(channels)
+
+
+def _iter_channels(lines, header):
+    channel = None
+    malformed = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] == '#':
+            if line.startswith(EXTINF):
+                if channel is not None:
+                    yield channel
+                channel = Channel(line)
+            elif line.startswith(EXTM3U):
+                if header is not None and not header:
+                    header.append(line)
+            elif channel is None:
+                continue
+            elif line.startswith(EXTGRP):
+                channel.extgrp = line[8:].strip()
+            else:
+                channel.add_directive(line)
+        elif channel is not None and channel.url is None:
+            channel.url = line
+        else:
+            malformed += 1
+    if channel is not None:
+        yield channel
+    if malformed:
+        m3u_stats.count('malformed_lines', malformed)
+
+
+def compression_for(path):
+    """Вид сжатия по расширению файла: 'gzip', 'zstd' или None"""
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if path.lower().endswith(suffix):
+            return compression
+    return None
+
+
+def require_zstandard():
+    """Модуль zstandard или ImportError с подсказкой по установке"""
+    if zstandard is None:
+        raise ImportError('Для файлов .zst установите zstandard: pip install zstandard')
+    return zstandard
+
+
+def is_url(path):
+    """Источник задан URL http(s), а не путём к файлу"""
+    return path.lower().startswith(('http://', 'https://'))
+
+
+def is_snapshot(path):
+    """Файл является бинарным снимком плейлиста (проверяется сигнатура)"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+    except OSError:
+        return False
+
+
+def open_playlist(path):
+    """
+    Открывает плейлист для чтения с большим буфером (BOM игнорируется),
+    файлы .gz и .zst распаковываются на лету, бинарный снимок
+    открывается как m3u_snapshot.Snapshot, URL http(s) загружается
+    через кеш m3u_remote
+    """
+    if is_url(path):
+        from m3u_remote import open_remote
+        return open_remote(path)
+    compression = compression_for(path)
+    if compression is None and is_snapshot(path):
+        # m3u_snapshot сам импортирует этот модуль, поэтому импорт здесь
+        from m3u_snapshot import Snapshot
+        return Snapshot(path)
+    if m3u_stats.current is not None:
+        m3u_stats.current.bytes_read += os.path.getsize(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8-sig')
+    if compression == 'zstd':
+        return require_zstandard().open(path, 'rt', encoding='utf-8-sig')
+    return open(path, 'r', encoding='utf-8-sig', buffering=BUFFER_SIZE)
+
+
+def read_channels(path, header=None):
+    """Потоково читает каналы из файла плейлиста"""
+    with open_playlist(path) as f:
+        yield from iter_channels(f, header)
+
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Конвейер операций над плейлистом за один проход
+
+Вместо цепочки merge_m3u -> filter_m3u -> rename_group -> sort_iptv ->
+iptv_manager, каждая из которых заново читает и переписывает файл,
+операции выполняются как стадии над одним потоком каналов: плейлисты
+читаются один раз, результат записывается один раз. Буферизуют каналы
+только стадии, которым нужен весь плейлист (sort, swap, нечёткий dedup).
+
+Конвейер задаётся в командной строке (стадии выполняются в порядке
+указания опций) или в файле JSON/YAML:
+
+    inputs: [a.m3u, b.m3u]
+    output: out.m3u
+    stages:
+      - merge: {dedup: [url, tvg-id], prefer: b.m3u}
+      - filter: [Sport, Movies, News]
+      - keep: [Спорт, Кино, Новости]
+      - query: 'not title ~ "тест" and (catchup or host = cdn.example.com)'
+      - remove: [Новости]
+      - swap: [Кино, Спорт]
+      - sort: {max-channels: 100000}
+      - dedup: 0.8
+
+Стадия set-group (например «- set-group: Спорт») устанавливает всем
+каналам одну группу, как rename_group.
+"""
+import argparse
+import json
+import locale
+
+from channel_dedup import find_duplicate_clusters, keep_best
+from iptv_manager import group_channels, remove_group_order, swap_group_order
+from m3u_parallel import has_url, read_channels_parallel
+from m3u_query import QueryError, any_of, compile_query
+from m3u_remote import prefetch_inputs
+from m3u_writer import write_playlist
+from merge_m3u import DEDUP_KEYS, BloomFilter, Deduplicator, HashSet
+from sort_iptv import collation_key, locale_collation_key, sort_channels
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class PipelineError(Exception):
+    """Ошибка в описании конвейера"""
+
+
+def _key_dedup(channels, keys, seen, label):
+    # Побеждает первый канал, запоминаются только ключи пропущенных дальше каналов
+    duplicates = Deduplicator(keys, seen)
+    dropped = 0
+    for channel in channels:
+        if duplicates.is_duplicate(channel):
+            dropped += 1
+            continue
+        yield channel
+    print(f"{label}: отброшено дубликатов: {dropped}")
+
+
+def _check_keys(keys):
+    keys = (keys,) if isinstance(keys, str) else tuple(keys or ())
+    unknown = [key for key in keys if key not in DEDUP_KEYS]
+    if unknown:
+        raise PipelineError(f"Неизвестные ключи дедупликации: {', '.join(unknown)}")
+    return keys
+
+
+def merge_stage(dedup=('url',), prefer=None, bloom=None, bloom_error=0.001):
+    """
+    Объединение: удаление дубликатов по URL и/или tvg-id среди всех входных плейлистов
+
+    prefer обрабатывается конвейером: этот источник читается первым
+    """
+    keys = _check_keys(dedup)
+    if not keys:
+        return None
+
+    def run(channels):
+        seen = BloomFilter(bloom, bloom_error) if bloom else HashSet()
+        return _key_dedup(channels, keys, seen, 'merge')
+    return run
+
+
+def filter_stage(extgrp, group_title=None):
+    """Отбор каналов по #EXTGRP: (регистр не учитывается), при group_title - с заменой группы"""
+    query = any_of('extgrp', extgrp)
+
+    def run(channels):
+        for channel in channels:
+            if not query.matches(channel):
+                continue
+            if group_title is not None:
+                # Как в filter_m3u: group-title в #EXTINF, #EXTGRP: в результат не попадает
+                channel.set_attr('group-title', group_title)
+                channel.extgrp = None
+            yield channel
+    return run
+
+
+def set_group_stage(title):
+    """Установка всем каналам одной группы (как rename_group)"""
+    def run(channels):
+        for channel in channels:
+            channel.set_attr('group-title', title)
+            yield channel
+    return run
+
+
+def keep_stage(groups):
+    """Отбор каналов указанных групп (потоково)"""
+    query = any_of('group', groups, exact=True)
+
+    def run(channels):
+        for channel in channels:
+            if query.matches(channel):
+                yield channel
+    return run
+
+
+def query_stage(query):
+    """Отбор каналов по запросу m3u_query (потоково)"""
+    try:
+        query = compile_query(query)
+    except QueryError as e:
+        raise PipelineError(f"Некорректный запрос '{query}': {e}")
+
+    def run(channels):
+        for channel in channels:
+            if query.matches(channel):
+                yield channel
+    return run
+
+
+def remove_stage(groups):
+    """Удаление групп целиком (потоково, совпадение групп как в iptv_manager -r)"""
+    groups = [groups] if isinstance(groups, str) else list(groups)
+    query = any_of('group', groups, exact=True)
+
+    def run(channels):
+        seen = {}  # группы в порядке появления
+        removed = 0
+        for channel in channels:
+            seen.setdefault(channel.group, None)
+            if query.matches(channel):
+                removed += 1
+                continue
+            yield channel
+        _, found_count = remove_group_order(list(seen), groups)
+        print(f"Удалено {removed} каналов из {found_count} групп")
+    return run
+
+
+def swap_stage(group1, group2):
+    """Обмен местами двух групп (буферизует плейлист)"""
+    def run(channels):
+        groups = group_channels(channels)
+        group_order = swap_group_order(groups.keys(), group1, group2) or groups.keys()
+        for group in group_order:
+            yield from groups[group]
+    return run
+
+
+def sort_stage(locale_name=None, max_channels=None, tmp_dir=None):
+    """Сортировка каналов по названию внутри групп (буферизует плейлист или сливает участки с диска)"""
+    key = collation_key
+    if locale_name is not None:
+        try:
+            locale.setlocale(locale.LC_COLLATE, locale_name)
+        except locale.Error as e:
+            raise PipelineError(f"Не удалось установить локаль '{locale_name}': {e}")
+        key = locale_collation_key
+
+    def run(channels):
+        return sort_channels(channels, key, max_channels, tmp_dir)
+    return run
+
+
+def dedup_stage(similarity=0.8, keys=None):
+    """
+    Удаление дубликатов каналов: по ключам (url, tvg-id) - потоково,
+    иначе по похожим названиям с выбором лучшего канала (буферизует плейлист)
+    """
+    if keys:
+        keys = _check_keys(keys)
+        return lambda channels: _key_dedup(channels, keys, HashSet(), 'dedup')
+
+    def run(channels):
+        channels = list(channels)
+        kept = keep_best(channels, find_duplicate_clusters(channels, similarity))
+        print(f"dedup: удалено дубликатов: {len(channels) - len(kept)}")
+        yield from kept
+    return run
+
+
+# Стадия -> (фабрика, параметр, которому соответствует краткая запись «стадия: значение»)
+STAGES = {
+    'merge': (merge_stage, 'dedup'),
+    'filter': (filter_stage, 'extgrp'),
+    'set-group': (set_group_stage, 'title'),
+    'keep': (keep_stage, 'groups'),
+    'query': (query_stage, 'query'),
+    'remove': (remove_stage, 'groups'),
+    'swap': (swap_stage, None),
+    'sort': (sort_stage, None),
+    'dedup': (dedup_stage, 'similarity'),
+}
+
+# Имена параметров в описании, которые не совпадают с аргументами фабрик
+_PARAM_ALIASES = {'locale': 'locale_name'}
+
+
+def build_stage(name, value):
+    """
+    Создаёт стадию по описанию
+
+    Args:
+        name (str): Имя стадии из STAGES
+        value: Параметры: словарь, краткая запись (значение главного параметра),
+            для swap - пара групп, None - параметры по умолчанию
+
+    Returns:
+        tuple: (имя, функция поток каналов -> поток каналов или None, параметры)
+    """
+    if name not in STAGES:
+        raise PipelineError(f"Неизвестная стадия '{name}' (доступны: {', '.join(STAGES)})")
+    factory, main_param = STAGES[name]
+    if value is None:
+        params = {}
+    elif isinstance(value, dict):
+        params = {_PARAM_ALIASES.get(key, key.replace('-', '_')): item for key, item in value.items()}
+    elif name == 'swap' and isinstance(value, (list, tuple)) and len(value) == 2:
+        params = {'group1': value[0], 'group2': value[1]}
+    elif main_param is not None:
+        params = {main_param: value}
+    else:
+        raise PipelineError(f"Некорректные параметры стадии '{name}': {value!r}")
+    try:
+        return name, factory(**params), params
+    except TypeError as e:
+        raise PipelineError(f"Некорректные параметры стадии '{name}': {e}")
+
+
+def load_spec(spec_file):
+    """Читает описание конвейера из JSON или YAML (для YAML нужен PyYAML)"""
+    with open(spec_file, 'r', encoding='utf-8') as f:
+        if spec_file.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise PipelineError('Для описания в YAML установите PyYAML: pip install pyyaml')
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise PipelineError(f"Описание конвейера в {spec_file} должно быть словарём")
+    return spec
+
+
+def parse_stages(stage_specs):
+    """Стадии из описания: список словарей вида {имя: параметры} или строк с именем"""
+    stages = []
+    for stage_spec in stage_specs or ():
+        if isinstance(stage_spec, str):
+            stages.append(build_stage(stage_spec, None))
+        elif isinstance(stage_spec, dict) and len(stage_spec) == 1:
+            (name, value), = stage_spec.items()
+            stages.append(build_stage(name, value))
+        else:
+            raise PipelineError(f"Некорректное описание стадии: {stage_spec!r}")
+    return stages
+
+
+def run_pipeline(inputs, output, stages, jobs=1):
+    """
+    Выполняет конвейер: один проход чтения входных плейлистов и одна запись результата
+
+    Args:
+        inputs (list): Пути к входным плейлистам или URL http(s) (заголовок #EXTM3U берётся из первого)
+        output (str): Путь к выходному файлу (может совпадать с входным; .gz/.zst - со сжатием)
+        stages (list): Стадии из build_stage/parse_stages в порядке выполнения
+        jobs (int): Число процессов для разбора больших файлов (0 - по числу ядер)
+
+    Returns:
+        int: Число записанных каналов или None при ошибке
+    """
+    order = list(inputs)
+    for name, _, params in stages:
+        prefer = params.get('prefer') if name == 'merge' else None
+        if prefer is not None:
+            if prefer not in order:
+                print(f"Ошибка: Источник '{prefer}' не входит в список плейлистов")
+                return None
+            order.remove(prefer)
+            order.insert(0, prefer)
+
+    prefetch_inputs(order)
+    header = []
+
+    def source():
+        # Каналы без URL потока пропускаются
+        for i, path in enumerate(order):
+            yield from read_channels_parallel(path, jobs, select=(has_url, ()), header=header if i == 0 else None)
+
+    channels = source()
+    for _, run, _ in stages:
+        if run is not None:
+            channels = run(channels)
+
+    # Вход может совпадать с выходом: запись идёт во временный файл, который затем подменяет результат
+    try:
+        count = write_playlist(output, channels, header)
+    except FileNotFoundError as e:
+        print(f"Ошибка: Файл {e.filename} не найден")
+        return None
+    except Exception as e:
+        print(f"Ошибка при выполнении конвейера: {e}")
+        return None
+    print(f"Конвейер выполнен: записано {count} каналов в {output}")
+    return count
+
+
+class _StageAction(argparse.Action):
+    """Добавляет стадию в общий список, сохраняя порядок опций в командной строке"""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        # Имя стадии - имя опции без «--»
+        namespace.stages = namespace.stages + [(option_string[2:], values)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Конвейер операций над плейлистом (merge, filter, set-group, keep, remove, swap, sort, dedup) '
+                    'за одно чтение и одну запись',
+        epilog='Стадии выполняются в порядке указания опций, после стадий из --spec')
+    parser.add_argument('--spec', metavar='FILE', help='Описание конвейера в JSON или YAML')
+    parser.add_argument('-i', '--input', action='append', metavar='PLAYLIST',
+                        help='Входной плейлист (можно указать несколько раз, заменяет inputs из описания)')
+    parser.add_argument('-o', '--output', help='Выходной файл (заменяет output из описания)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Число процессов для разбора больших файлов (0 - по числу ядер, по умолчанию 1)')
+    parser.set_defaults(stages=[])
+    parser.add_argument('--merge', action=_StageAction, nargs='?', const='url', metavar='KEYS',
+                        help='Удалять дубликаты между плейлистами по ключам через запятую: url, tvg-id; '
+                             'none - без дедупликации (по умолчанию url)')
+    parser.add_argument('--filter', action=_StageAction, nargs='+', metavar='EXTGRP',
+                        help='Оставить каналы с указанными #EXTGRP:')
+    parser.add_argument('--set-group', action=_StageAction, metavar='GROUP_TITLE',
+                        help='Установить всем каналам group-title')
+    parser.add_argument('--keep', action=_StageAction, nargs='+', metavar='GROUP',
+                        help='Оставить только указанные группы')
+    parser.add_argument('--query', action=_StageAction, metavar='QUERY',
+                        help='Оставить каналы, подходящие под запрос (язык запросов m3u_query)')
+    parser.add_argument('--remove', action=_StageAction, nargs='+', metavar='GROUP',
+                        help='Удалить указанные группы')
+    parser.add_argument('--swap', action=_StageAction, nargs=2, metavar=('GROUP1', 'GROUP2'),
+                        help='Поменять местами две группы')
+    parser.add_argument('--sort', action=_StageAction, nargs=0,
+                        help='Сортировать каналы по названию внутри групп')
+    parser.add_argument('--dedup', action=_StageAction, nargs='?', type=float, const=0.8, metavar='THRESHOLD',
+                        help='Удалить похожие каналы, оставив лучший (порог сходства, по умолчанию 0.8)')
+    parser.add_argument('-m', '--max-channels', type=int, metavar='N',
+                        help='Для --sort: не более N каналов в памяти, остальное во временных файлах')
+    parser.add_argument('--tmp-dir', help='Для --sort: каталог для временных файлов')
+
+    args = parser.parse_args()
+
+    try:
+        spec = load_spec(args.spec) if args.spec else {}
+        stages = parse_stages(spec.get('stages'))
+        for name, value in args.stages:
+            if name == 'merge':
+                value = [] if value == 'none' else [key.strip() for key in value.split(',')]
+            elif name == 'sort':
+                value = {'max-channels': args.max_channels, 'tmp-dir': args.tmp_dir}
+            stages.append(build_stage(name, value))
+    except FileNotFoundError:
+        print(f"Ошибка: Файл {args.spec} не найден")
+        return
+    except (PipelineError, ValueError) as e:
+        print(f"Ошибка: {e}")
+        return
+
+    inputs = args.input or spec.get('inputs')
+    output = args.output or spec.get('output')
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if not inputs:
+        parser.error('Укажите входные плейлисты: -i PLAYLIST или inputs в описании')
+    if not output:
+        parser.error('Укажите выходной файл: -o OUTPUT или output в описании')
+    jobs = args.jobs if args.jobs is not None else spec.get('jobs', 1)
+
+    run_pipeline(inputs, output, stages, jobs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+"""
+Язык запросов для отбора и изменения каналов
+
+Запрос состоит из условий «поле оператор значение», объединённых через
+and, or, not и скобки (and связывает сильнее or):
+
+    extgrp = Спорт and not title ~ "тест|test"
+    group == "Кино HD" or tvg-id ^ ru.
+    host = cdn.example.com and catchup
+
+Поля: title (название), url, host (хост URL), extgrp, group (group-title
+или «Без группы»), catchup (поддержка архива: атрибут catchup либо
+catchup-days, timeshift или tvg-rec) и любой атрибут #EXTINF по имени
+(tvg-id, tvg-name, group-title, tvg-logo...).
+
+Операторы:
+    =   равенство без учёта регистра
+    ==  точное равенство
+    !=  неравенство без учёта регистра (канал без значения тоже подходит)
+    ~   регулярное выражение (re.search без учёта регистра)
+    ^   начинается с (без учёта регистра)
+Поле без оператора означает, что значение есть и не пустое. Значение
+с пробелами, скобками, кавычками или символами операторов пишется
+в двойных кавычках (внутри кавычек \\" и \\\\).
+
+Поток каналов проверяется условием по одному (метод matches). Для
+загруженного плейлиста ChannelIndex по требованию строит хеш-индекс
+значений и индекс префиксов по каждому полю из запросов, поэтому
+повторные запросы не перебирают каналы: равенство и префикс ищутся
+по индексу, а регулярное выражение проверяется только на различных
+значениях поля.
+"""
+import argparse
+import bisect
+import re
+import sys
+from operator import methodcaller
+from urllib.parse import urlsplit
+
+from m3u_parser import read_channels
+from m3u_snapshot import save_playlist
+
+OPERATORS = ('=', '==', '!=', '~', '^')
+KEYWORDS = ('and', 'or', 'not')
+
+# Атрибуты, наличие которых означает поддержку архива
+_CATCHUP_ATTRS = ('catchup-days', 'timeshift', 'tvg-rec')
+
+_TOKEN_RE = re.compile(r'\s*(?:(==|!=|=|~|\^)|([()])|"((?:[^"\\]|\\.)*)"|([^\s()="!~^]+))')
+_ESCAPE_RE = re.compile(r'\\(.)')
+
+
+class QueryError(ValueError):
+    """Ошибка в тексте запроса"""
+
+
+def _title(channel):
+    return channel.name
+
+
+def _url(channel):
+    return channel.url
+
+
+def _host(channel):
+    if channel.url is None:
+        return None
+    try:
+        return urlsplit(channel.url.strip()).hostname
+    except ValueError:
+        return None
+
+
+def _extgrp(channel):
+    return channel.extgrp
+
+
+def _group(channel):
+    return channel.group
+
+
+def _catchup(channel):
+    value = channel.get_attr('catchup')
+    if value:
+        return value
+    for key in _CATCHUP_ATTRS:
+        if channel.get_attr(key) not in (None, '', '0'):
+            return 'default'
+    return None
+
+
+FIELDS = {
+    'title': _title,
+    'url': _url,
+    'host': _host,
+    'extgrp': _extgrp,
+    'group': _group,
+    'catchup': _catchup,
+}
+
+
+def field_getter(field):
+    """Функция, возвращающая значение поля канала (строку или None)"""
+    getter = FIELDS.get(field)
+    # Остальные имена - атрибуты #EXTINF; methodcaller передаётся в рабочие процессы
+    return getter if getter is not None else methodcaller('get_attr', field)
+
+
+class Condition:
+    """Условие «поле оператор значение» или проверка наличия значения (op=None)"""
+    __slots__ = ('field', 'op', 'value', 'get', '_key', '_pattern')
+
+    def __init__(self, field, op=None, value=None):
+        if op is not None and op not in OPERATORS:
+            raise QueryError(f"Неизвестный оператор '{op}'")
+        self.field = field
+        self.op = op
+        self.value = value
+        self.get = field_getter(field)
+        self._key = value.lower() if value is not None else None
+        self._pattern = None
+        if op == '~':
+            try:
+                self._pattern = re.compile(value, re.IGNORECASE)
+            except re.error as e:
+                raise QueryError(f"Неверное регулярное выражение '{value}': {e}") from None
+
+    def __repr__(self):
+        if self.op is None:
+            return self.field
+        return f'{self.field} {self.op} {_quote(self.value)}'
+
+    def test(self, value):
+        """Проверяет значение поля"""
+        op = self.op
+        if op is None:
+            return bool(value)
+        if op == '!=':
+            return value is None or value.lower() != self._key
+        if value is None:
+            return False
+        if op == '=':
+            return value.lower() == self._key
+        if op == '==':
+            return value == self.value
+        if op == '^':
+            return value.lower().startswith(self._key)
+        return self._pattern.search(value) is not None
+
+    def matches(self, channel):
+        return self.test(self.get(channel))
+
+    def evaluate(self, index):
+        if self.op == '=':
+            return index.equal(self.field, self._key)
+        if self.op == '^':
+            return index.prefix(self.field, self._key)
+        if self.op == '!=':
+            return index.all - index.equal(self.field, self._key)
+        if self.op == '==':
+            return index.exact(self.field, self.value)
+        return index.where(self.field, self.test)
+
+    def equality_values(self, field):
+        if self.op == '=' and self.field == field:
+            return frozenset((self._key,))
+        return None
+
+
+class In:
+    """Значение поля входит в набор (без учёта регистра или точно)"""
+    __slots__ = ('field', 'values', 'exact', 'get', '_keys')
+
+    def __init__(self, field, values, exact=False):
+        self.field = field
+        self.values = tuple(values)
+        self.exact = exact
+        self.get = field_getter(field)
+        self._keys = frozenset(self.values if exact else (value.lower() for value in self.values))
+
+    def __repr__(self):
+        op = '==' if self.exact else '='
+        return '(' + ' or '.join(f'{self.field} {op} {_quote(value)}' for value in self.values) + ')'
+
+    def matches(self, channel):
+        value = self.get(channel)
+        if value is None:
+            return False
+        return (value if self.exact else value.lower()) in self._keys
+
+    def evaluate(self, index):
+        lookup = index.exact if self.exact else index.equal
+        result = set()
+        for key in self._keys:
+            result |= lookup(self.field, key)
+        return result
+
+    def equality_values(self, field):
+        if not self.exact and self.field == field:
+            return self._keys
+        return None
+
+
+class Not:
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+
+    def __repr__(self):
+        return f'not {self.node!r}'
+
+    def matches(self, channel):
+        return not self.node.matches(channel)
+
+    def evaluate(self, index):
+        return index.all - self.node.evaluate(index)
+
+    def equality_values(self, field):
+        return None
+
+
+class And:
+    __slots__ = ('nodes',)
+
+    def __init__(self, nodes):
+        self.nodes = tuple(nodes)
+
+    def __repr__(self):
+        return '(' + ' and '.join(map(repr, self.nodes)) + ')'
+
+    def matches(self, channel):
+        return all(node.matches(channel) for node in self.nodes)
+
+    def evaluate(self, index):
+        result = None
+        for node in self.nodes:
+            positions = node.evaluate(index)
+            result = positions if result is None else result & positions
+            if not result:
+                break
+        return set(result)
+
+    def equality_values(self, field):
+        return None
+
+
+class Or:
+    __slots__ = ('nodes',)
+
+    def __init__(self, nodes):
+        self.nodes = tuple(nodes)
+
+    def __repr__(self):
+        return '(' + ' or '.join(map(repr, self.nodes)) + ')'
+
+    def matches(self, channel):
+        return any(node.matches(channel) for node in self.nodes)
+
+    def evaluate(self, index):
+        result = set()
+        for node in self.nodes:
+            result |= node.evaluate(index)
+        return result
+
+    def equality_values(self, field):
+        keys = set()
+        for node in self.nodes:
+            values = node.equality_values(field)
+            if values is None:
+                return None
+            keys |= values
+        return frozenset(keys)
+
+
+def _quote(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def any_of(field, values, exact=False):
+    """Запрос «поле равно одному из значений»"""
+    return In(field, [values] if isinstance(values, str) else values, exact)
+
+
+def matches(channel, query):
+    """Фильтр для read_channels_parallel: канал подходит под запрос"""
+    return query.matches(channel)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    end = len(text.rstrip())
+    while pos < end:
+        match = _TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            rest = text[pos:].lstrip()
+            raise QueryError(f"Неожиданный символ в запросе на позиции {end - len(rest.rstrip()) + 1}: '{rest[:20]}'")
+        op, paren, quoted, word = match.groups()
+        if op is not None:
+            tokens.append(('op', op))
+        elif paren is not None:
+            tokens.append((paren, paren))
+        elif quoted is not None:
+            tokens.append(('value', _ESCAPE_RE.sub(r'\1', quoted)))
+        elif word.lower() in KEYWORDS:
+            tokens.append((word.lower(), word))
+        else:
+            tokens.append(('word', word))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError('Пустой запрос')
+        node = self.parse_or()
+        if self.pos < len(self.tokens):
+            raise QueryError(f"Лишний элемент в запросе: '{self.tokens[self.pos][1]}'")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == 'or':
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else Or(nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() == 'and':
+            self.take()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else And(nodes)
+
+    def parse_not(self):
+        kind = self.peek()
+        if kind == 'not':
+            self.take()
+            return Not(self.parse_not())
+        if kind == '(':
+            self.take()
+            node = self.parse_or()
+            if self.peek() != ')':
+                raise QueryError('Не закрыта скобка в запросе')
+            self.take()
+            return node
+        if kind != 'word':
+            raise QueryError('Ожидалось имя поля' + (f", а не '{self.tokens[self.pos][1]}'" if kind else ' в конце запроса'))
+        field = self.take()[1]
+        if self.peek() != 'op':
+            return Condition(field)
+        op = self.take()[1]
+        if self.peek() not in ('word', 'value'):
+            raise QueryError(f"Ожидалось значение после '{field} {op}'")
+        return Condition(field, op, self.take()[1])
+
+
+def compile_query(text):
+    """Разбирает текст запроса, возвращает условие с методами matches и evaluate"""
+    return _Parser(text).parse()
+
+
+class ChannelIndex:
+    """
+    Загруженный список каналов с индексами по полям, которые строятся при первом запросе
+
+    Если каналы изменены после запросов (например, set_attr), индексы
+    нужно сбросить через invalidate().
+    """
+
+    def __init__(self, channels):
+        self.channels = channels if isinstance(channels, list) else list(channels)
+        self.all = frozenset(range(len(self.channels)))
+        self._values = {}  # поле -> {значение: [номера каналов]}
+        self._lower = {}  # поле -> {значение в нижнем регистре: [номера каналов]}
+        self._prefix = {}  # поле -> отсортированные значения в нижнем регистре
+
+    def invalidate(self):
+        """Сбрасывает индексы после изменения каналов"""
+        self._values.clear()
+        self._lower.clear()
+        self._prefix.clear()
+
+    def values(self, field):
+        """Хеш-индекс: значение поля (или None) -> номера каналов по порядку"""
+        index = self._values.get(field)
+        if index is None:
+            get = field_getter(field)
+            index = {}
+            for position, channel in enumerate(self.channels):
+                value = get(channel)
+                positions = index.get(value)
+                if positions is None:
+                    index[value] = [position]
+                else:
+                    positions.append(position)
+            self._values[field] = index
+        return index
+
+    def _lowered(self, field):
+        index = self._lower.get(field)
+        if index is None:
+            index = {}
+            for value, positions in self.values(field).items():
+                if value is None:
+                    continue
+                key = value.lower()
+                if key in index:
+                    index[key] = sorted(index[key] + positions)
+                else:
+                    index[key] = positions
+            self._lower[field] = index
+        return index
+
+    def distinct(self, field):
+        """Различные значения поля в порядке первого появления"""
+        return [value for value in self.values(field) if value is not None]
+
+    def positions(self, field, value):
+        """Номера каналов с точным значением поля"""
+        return self.values(field).get(value, [])
+
+    def exact(self, field, value):
+        return set(self.values(field).get(value, ()))
+
+    def equal(self, field, key):
+        return set(self._lowered(field).get(key, ()))
+
+    def prefix(self, field, prefix):
+        keys = self._prefix.get(field)
+        if keys is None:
+            keys = self._prefix[field] = sorted(self._lowered(field))
+        lowered = self._lowered(field)
+        result = set()
+        for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            result.update(lowered[keys[i]])
+        return result
+
+    def where(self, field, test):
+        """Номера каналов, значение поля которых проходит проверку (перебираются различные значения)"""
+        result = set()
+        for value, positions in self.values(field).items():
+            if test(value):
+                result.update(positions)
+        return result
+
+    def find(self, query):
+        """Номера подходящих каналов (множество)"""
+        if isinstance(query, str):
+            query = compile_query(query)
+        return query.evaluate(self)
+
+    def select(self, query):
+        """Подходящие каналы в исходном порядке"""
+        return [self.channels[position] for position in sorted(self.find(query))]
+
+
+class Router:
+    """
+    Направляет канал по первому подходящему запросу из списка маршрутов
+
+    Если все запросы - равенства (=) по одному полю, маршрут выбирается
+    по словарю за одно обращение, без проверки каждого запроса.
+    """
+
+    def __init__(self, routes):
+        """
+        Args:
+            routes: Список пар (запрос, назначение)
+        """
+        self.routes = list(routes)
+        self.query = Or([query for query, _ in self.routes])
+        self._table = None
+        field = getattr(self.routes[0][0], 'field', None) if self.routes else None
+        if field is not None:
+            table = {}
+            for query, target in self.routes:
+                keys = query.equality_values(field)
+                if keys is None:
+                    break
+                for key in keys:
+                    table.setdefault(key, target)
+            else:
+                self.field = field
+                self._get = field_getter(field)
+                self._table = table
+
+    def route(self, channel):
+        """Назначение канала или None"""
+        if self._table is not None:
+            value = self._get(channel)
+            return None if value is None else self._table.get(value.lower())
+        for query, target in self.routes:
+            if query.matches(channel):
+                return target
+        return None
+
+    def equality_values(self, field):
+        """Значения поля в нижнем регистре, если маршруты - только равенства по этому полю"""
+        return self.query.equality_values(field)
+
+
+def transform(channels, query, set_attrs=None, delete=False):
+    """
+    Потоково изменяет или удаляет подходящие под запрос каналы, остальные проходят как есть
+
+    Args:
+        channels: Итерируемый набор объектов Channel
+        query: Запрос (compile_query)
+        set_attrs (dict): Атрибуты #EXTINF для подходящих каналов (None в значении удаляет атрибут)
+        delete (bool): Удалить подходящие каналы
+    """
+    for channel in channels:
+        if query.matches(channel):
+            if delete:
+                continue
+            for key, value in (set_attrs or {}).items():
+                channel.set_attr(key, value)
+        yield channel
+
+
+def _parse_assignment(text):
+    key, sep, value = text.partition('=')
+    if not sep or not key.strip():
+        raise argparse.ArgumentTypeError(f"ожидалось КЛЮЧ=ЗНАЧЕНИЕ: '{text}'")
+    return key.strip(), value
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Отбор и изменение каналов по запросу',
+        epilog='Пример запроса: \'extgrp = Спорт and (title ~ "hd$" or catchup) and not host ^ test.\'. '
+               'Поля: title, url, host, extgrp, group, catchup и любые атрибуты #EXTINF; '
+               'операторы: = (без учёта регистра), ==, !=, ~ (регулярное выражение), ^ (префикс)')
+    parser.add_argument('input', help='Входной плейлист (M3U, .gz, .zst или снимок)')
+    parser.add_argument('-q', '--query', action='append', required=True,
+                        help='Запрос (можно несколько: без -o каждый выполняется по одному загруженному индексу, '
+                             'с -o выбираются каналы, подходящие хотя бы под один)')
+    parser.add_argument('-o', '--output', help='Записать результат в файл (.m3us - снимком)')
+    parser.add_argument('--set', action='append', type=_parse_assignment, metavar='KEY=VALUE',
+                        help='Установить атрибут #EXTINF подходящим каналам; в файл пишутся все каналы')
+    parser.add_argument('--unset', action='append', metavar='KEY',
+                        help='Удалить атрибут #EXTINF у подходящих каналов; в файл пишутся все каналы')
+    parser.add_argument('--delete', action='store_true', help='Удалить подходящие каналы, остальные записать')
+    parser.add_argument('--count', action='store_true', help='Показать только количество подходящих каналов')
+
+    args = parser.parse_args()
+
+    try:
+        queries = [compile_query(text) for text in args.query]
+    except QueryError as e:
+        print(f"Ошибка в запросе: {e}")
+        sys.exit(2)
+
+    modify = args.set or args.unset or args.delete
+    if modify and not args.output:
+        parser.error('Для --set, --unset и --delete укажите выходной файл: -o FILE')
+
+    header = []
+    try:
+        channels = list(read_channels(args.input, header))
+    except FileNotFoundError:
+        print(f"Ошибка: Файл '{args.input}' не найден")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Ошибка при чтении файла: {e}")
+        sys.exit(1)
+
+    if not args.output:
+        index = ChannelIndex(channels)
+        for text, query in zip(args.query, queries):
+            found = index.select(query)
+            print(f"{text}: {len(found)} каналов")
+            if not args.count:
+                for channel in found:
+                    print(f"  {channel.name} [{channel.group}] {channel.url or ''}")
+        return
+
+    query = queries[0] if len(queries) == 1 else Or(queries)
+    if modify:
+        set_attrs = dict(args.set or [])
+        set_attrs.update((key, None) for key in args.unset or [])
+        result = transform(channels, query, set_attrs, args.delete)
+    else:
+        result = (channel for channel in channels if query.matches(channel))
+    try:
+        count = save_playlist(args.output, result, header)
+    except Exception as e:
+        print(f"Ошибка при сохранении файла: {e}")
+        sys.exit(1)
+    print(f"Записано {count} каналов в {args.output}")
+
+if __name__ == "__main__":
+    main()
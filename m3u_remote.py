@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Удалённые плейлисты: загрузка по http(s) через дисковый кеш
+
+Все утилиты принимают URL вместо пути к входному файлу: open_playlist
+открывает его через open_remote. Копии хранятся в каталоге кеша
+(~/.cache/iptv_toolbox или IPTV_CACHE_DIR) вместе с ETag и Last-Modified
+ответа. Повторный запрос условный: при ответе 304 плейлист читается из
+кеша, при недоступности сервера тоже используется копия из кеша. Ответ
+со сжатием gzip распаковывается на лету.
+
+Тело нового ответа не накапливается в памяти: парсер читает его по мере
+загрузки, а копия параллельно пишется во временный файл и попадает в кеш
+только после полной загрузки. Размер кеша ограничен (IPTV_CACHE_MAX_MB,
+по умолчанию 1024 МБ): при превышении удаляются давно не использованные
+записи.
+
+Несколько источников (merge_m3u, m3u_pipeline) загружаются заранее
+параллельно функцией prefetch_inputs через пул keep-alive соединений
+stream_check.HttpClient с ограничением числа соединений на хост.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import zlib
+from urllib.parse import urljoin, urlsplit
+
+import m3u_stats
+from m3u_parser import BUFFER_SIZE, COMPRESSION_SUFFIXES, compression_for, is_url, open_playlist, require_zstandard
+from stream_check import DEFAULT_PER_HOST, MAX_REDIRECTS, HttpClient
+
+CACHE_DIR_ENV = 'IPTV_CACHE_DIR'
+CACHE_SIZE_ENV = 'IPTV_CACHE_MAX_MB'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'iptv_toolbox')
+DEFAULT_MAX_MB = 1024
+
+USER_AGENT = 'IPTV_ToolBox m3u_remote'
+# Таймаут подключения и каждой операции чтения; ожидание свободного соединения хоста не учитывается
+REQUEST_TIMEOUT = 30.0
+
+STATUS_UPDATED = 'updated'
+STATUS_NOT_MODIFIED = 'not-modified'
+STATUS_FAILED = 'failed'
+
+_REDIRECT_CODES = frozenset((301, 302, 303, 307, 308))
+_KEY_LENGTH = 32
+
+# URL -> путь к копии, уже проверенной в этом процессе (повторно не запрашивается)
+_validated = {}
+_default_cache = None
+
+
+class RemoteCache:
+    """
+    Дисковый кеш удалённых плейлистов
+
+    Для каждого URL хранятся тело (<ключ>[.gz|.zst]) и сведения об ответе
+    (<ключ>.json); ключ - начало sha256 от URL. Давность использования
+    записи определяется временем изменения тела.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get(CACHE_SIZE_ENV, DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()[:_KEY_LENGTH]
+
+    def body_path(self, url):
+        """Путь к копии; расширение сжатия берётся из URL, чтобы копия открывалась open_playlist"""
+        suffix = os.path.splitext(urlsplit(url).path)[1].lower()
+        return os.path.join(self.directory, self._key(url) + (suffix if suffix in COMPRESSION_SUFFIXES else ''))
+
+    def _meta_path(self, url):
+        return os.path.join(self.directory, self._key(url) + '.json')
+
+    def lookup(self, url):
+        """Путь к копии и сведения об ответе (etag, last_modified) или (None, None)"""
+        try:
+            with open(self._meta_path(url), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        body = self.body_path(url)
+        if meta.get('url') != url or not os.path.exists(body):
+            return None, None
+        return body, meta
+
+    def open_temp(self, url):
+        """Временный файл для загружаемой копии: (файл, путь)"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=self._key(url) + '.', suffix='.tmp', dir=self.directory)
+        return open(fd, 'wb', buffering=BUFFER_SIZE), tmp_path
+
+    def commit(self, url, tmp_path, headers):
+        """Переносит загруженную копию в кеш, сохраняет ETag и Last-Modified; возвращает путь к копии"""
+        body = self.body_path(url)
+        os.replace(tmp_path, body)
+        meta = {
+            'url': url,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+            'size': os.path.getsize(body),
+            'fetched': time.time(),
+        }
+        meta_path = self._meta_path(url)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_path + '.tmp', meta_path)
+        self.evict(keep=self._key(url))
+        return body
+
+    def touch(self, path):
+        """Отмечает использование копии"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _groups(self):
+        # Файлы записей по ключам: ключ -> [время использования, размер, пути]
+        groups = {}
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return groups
+        for name in names:
+            # Временные файлы принадлежат незавершённым загрузкам
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            group = groups.setdefault(name[:_KEY_LENGTH], [0, 0, []])
+            group[0] = max(group[0], stat.st_mtime)
+            group[1] += stat.st_size
+            group[2].append(path)
+        return groups
+
+    def evict(self, keep=None):
+        """Удаляет давно не использованные записи, пока кеш больше max_bytes"""
+        groups = self._groups()
+        total = sum(size for _, size, _ in groups.values())
+        for key, (_, size, paths) in sorted(groups.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def entries(self):
+        """Сведения о записях кеша в порядке давности использования"""
+        result = []
+        for key, (used, size, _) in sorted(self._groups().items(), key=lambda item: item[1][0]):
+            try:
+                with open(os.path.join(self.directory, key + '.json'), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                meta = {}
+            result.append({'url': meta.get('url'), 'size': size, 'used': used, 'etag': meta.get('etag'),
+                           'last_modified': meta.get('last_modified')})
+        return result
+
+    def clear(self):
+        """Удаляет все записи, возвращает их число"""
+        groups = self._groups()
+        for _, _, paths in groups.values():
+            for path in paths:
+                os.remove(path)
+        return len(groups)
+
+
+def default_cache():
+    """Кеш по переменным окружения IPTV_CACHE_DIR и IPTV_CACHE_MAX_MB"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RemoteCache()
+    return _default_cache
+
+
+def conditional_headers(meta):
+    """Заголовки условного запроса по сохранённым ETag и Last-Modified"""
+    headers = {}
+    if meta:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+
+def _use_cached(url, body, cache):
+    cache.touch(body)
+    _validated[url] = body
+    return body
+
+
+class _CacheTee(io.RawIOBase):
+    """
+    Тело ответа для парсера с одновременной записью копии в кеш
+
+    Копия переносится в кеш, когда тело прочитано до конца; при закрытии
+    до конца загрузки неполная копия удаляется. Ошибки записи кеша не
+    прерывают чтение.
+    """
+
+    def __init__(self, url, response, cache):
+        self.url = url
+        self.cache = cache
+        self.headers = response.headers
+        self._response = response
+        if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+            self._source = gzip.GzipFile(fileobj=response)
+        else:
+            self._source = response
+        self._done = False
+        self._size = 0
+        try:
+            self._file, self._tmp_path = cache.open_temp(url)
+        except OSError:
+            self._file = self._tmp_path = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._done:
+            return 0
+        data = self._source.read(len(buffer))
+        if not data:
+            self._finish()
+            return 0
+        size = len(data)
+        buffer[:size] = data
+        self._size += size
+        if self._file is not None:
+            try:
+                self._file.write(data)
+            except OSError:
+                self._discard()
+        return size
+
+    def _finish(self):
+        self._done = True
+        if m3u_stats.current is not None:
+            m3u_stats.current.bytes_read += self._size
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+            self._file = None
+            _validated[self.url] = self.cache.commit(self.url, self._tmp_path, self.headers)
+        except OSError:
+            self._discard()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp_path is not None and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def close(self):
+        if not self.closed:
+            # Загрузка не завершена: неполная копия в кеш не попадает
+            self._discard()
+            self._response.close()
+        super().close()
+
+
+class _RemoteStream(io.TextIOWrapper):
+    """Текстовый поток удалённого плейлиста; при закрытии закрывает и загрузку"""
+
+    def __init__(self, stream, tee):
+        super().__init__(stream, encoding='utf-8-sig')
+        self._tee = tee
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._tee.close()
+
+
+def _request(url, cache):
+    """
+    Условный запрос URL
+
+    Returns:
+        tuple: (путь к актуальной копии, None) или (None, ответ с новым телом)
+    """
+    path = _validated.get(url)
+    if path is not None and os.path.exists(path):
+        return path, None
+    body, meta = cache.lookup(url)
+    headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip', **conditional_headers(meta)}
+    try:
+        return None, urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=REQUEST_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        e.close()
+        if e.code == 304 and body is not None:
+            return _use_cached(url, body, cache), None
+        if e.code < 500 or body is None:
+            raise
+        error = e
+    except OSError as e:
+        if body is None:
+            raise
+        error = e
+    print(f"Предупреждение: {url} недоступен ({error}), используется копия из кеша")
+    return _use_cached(url, body, cache), None
+
+
+def open_remote(url, cache=None):
+    """Открывает удалённый плейлист для чтения (как open_playlist)"""
+    cache = cache or default_cache()
+    path, response = _request(url, cache)
+    if path is not None:
+        return open_playlist(path)
+    tee = _CacheTee(url, response, cache)
+    stream = io.BufferedReader(tee, BUFFER_SIZE)
+    compression = compression_for(cache.body_path(url))
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream)
+    elif compression == 'zstd':
+        stream = require_zstandard().open(stream, 'rb')
+    return _RemoteStream(stream, tee)
+
+
+def fetch(url, cache=None):
+    """Обновляет копию URL в кеше (условным запросом) и возвращает путь к ней"""
+    cache = cache or default_cache()
+    path, response = _request(url, cache)
+    if path is not None:
+        return path
+    with _CacheTee(url, response, cache) as tee:
+        while tee.read(BUFFER_SIZE):
+            pass
+    path = _validated.get(url)
+    if path is None:
+        raise OSError(f"Не удалось сохранить {url} в кеш {cache.directory}")
+    return path
+
+
+class _BodySink:
+    """Запись тела ответа HttpClient во временный файл кеша с распаковкой gzip"""
+
+    def __init__(self, cache, url):
+        self.cache = cache
+        self.url = url
+        self._file = None
+        self._decoder = None
+
+    def open(self, headers):
+        self._file, self._tmp_path = self.cache.open_temp(self.url)
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return self.write
+
+    def write(self, data):
+        if self._decoder is not None:
+            data = self._decoder.decompress(data)
+        self._file.write(data)
+
+    def commit(self, headers):
+        if self._decoder is not None:
+            self._file.write(self._decoder.flush())
+        self._file.close()
+        self._file = None
+        return self.cache.commit(self.url, self._tmp_path, headers)
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._tmp_path)
+
+
+async def _fetch(client, cache, url):
+    body, meta = cache.lookup(url)
+    headers = {'Accept-Encoding': 'gzip', **conditional_headers(meta)}
+    target = url
+    for _ in range(MAX_REDIRECTS + 1):
+        sink = _BodySink(cache, url)
+        try:
+            response = await client.request('GET', target, headers, sink=sink.open)
+            location = response.headers.get('location')
+            if response.code in _REDIRECT_CODES and location:
+                target = urljoin(target, location)
+                continue
+            if response.code == 304 and body is not None:
+                _use_cached(url, body, cache)
+                return STATUS_NOT_MODIFIED
+            if response.code != 200:
+                raise ValueError(f"HTTP {response.code}")
+            _validated[url] = sink.commit(response.headers)
+            return STATUS_UPDATED
+        finally:
+            sink.discard()
+    raise ValueError("Слишком много перенаправлений")
+
+
+async def _fetch_all(urls, cache, per_host, timeout):
+    client = HttpClient(per_host, timeout=timeout)
+    results = {}
+
+    async def worker(url):
+        try:
+            results[url] = (await _fetch(client, cache, url), '')
+        except asyncio.TimeoutError:
+            results[url] = (STATUS_FAILED, 'таймаут')
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            results[url] = (STATUS_FAILED, str(e) or type(e).__name__)
+
+    try:
+        await asyncio.gather(*(worker(url) for url in urls))
+    finally:
+        await client.close()
+    return results
+
+
+def prefetch(urls, cache=None, per_host=DEFAULT_PER_HOST, timeout=REQUEST_TIMEOUT):
+    """
+    Параллельно обновляет копии URL в кеше
+
+    timeout ограничивает подключение и каждое чтение ответа, а не всю
+    загрузку: большой плейлист на медленном канале не прерывается, пока
+    данные идут.
+
+    Returns:
+        dict: URL -> (STATUS_UPDATED, STATUS_NOT_MODIFIED или STATUS_FAILED, описание ошибки)
+    """
+    urls = list(dict.fromkeys(urls))
+    cache = cache or default_cache()
+    with m3u_stats.stage('fetch'):
+        return asyncio.run(_fetch_all(urls, cache, per_host, timeout))
+
+
+def prefetch_inputs(paths, cache=None):
+    """
+    Заранее загружает удалённые входные плейлисты, если их несколько
+
+    Одиночный источник заранее не загружается: парсер читает его тело по
+    мере загрузки. Источник, который не удалось загрузить заранее,
+    открывается обычным образом и сообщает об ошибке сам.
+    """
+    urls = [path for path in dict.fromkeys(paths) if is_url(path) and path not in _validated]
+    if len(urls) > 1:
+        prefetch(urls, cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Кеш удалённых плейлистов (загрузка по http(s) с условными запросами)')
+    parser.add_argument('--cache-dir', help=f'Каталог кеша (по умолчанию ${CACHE_DIR_ENV} или {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--max-mb', type=float,
+                        help=f'Предельный размер кеша в МБ (по умолчанию ${CACHE_SIZE_ENV} или {DEFAULT_MAX_MB})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fetch_parser = subparsers.add_parser('fetch', help='Загрузить или обновить плейлисты в кеше')
+    fetch_parser.add_argument('urls', nargs='+', help='URL плейлистов')
+    fetch_parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                              help=f'Соединений на хост (по умолчанию {DEFAULT_PER_HOST})')
+    subparsers.add_parser('list', help='Показать содержимое кеша')
+    subparsers.add_parser('clear', help='Очистить кеш')
+
+    args = parser.parse_args()
+
+    max_bytes = int(args.max_mb * 1024 * 1024) if args.max_mb is not None else None
+    cache = RemoteCache(args.cache_dir, max_bytes)
+
+    if args.command == 'fetch':
+        bad = [url for url in args.urls if not is_url(url)]
+        if bad:
+            print(f"Ошибка: Не URL http(s): {', '.join(bad)}")
+            sys.exit(2)
+        results = prefetch(args.urls, cache, args.per_host)
+        labels = {STATUS_UPDATED: 'загружен', STATUS_NOT_MODIFIED: 'не изменился'}
+        for url, (status, detail) in results.items():
+            print(f"  {url}: {labels.get(status) or f'ошибка: {detail}'}")
+        if any(status == STATUS_FAILED for status, _ in results.values()):
+            sys.exit(1)
+    elif args.command == 'list':
+        entries = cache.entries()
+        for entry in entries:
+            used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['used']))
+            print(f"  {entry['url'] or '?'}: {entry['size'] / (1024 * 1024):.1f} МБ, использован {used}")
+        total = sum(entry['size'] for entry in entries)
+        print(f"Записей: {len(entries)}, всего {total / (1024 * 1024):.1f} МБ из "
+              f"{cache.max_bytes / (1024 * 1024):.0f} МБ ({cache.directory})")
+    else:
+        print(f"Удалено записей: {cache.clear()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+HTTP сервер, отдающий представления плейлиста по запросу
+
+Исходный плейлист загружается в память один раз, а представления
+(«группы X,Y с новым group-title, отсортированные») строятся по
+параметрам запроса стадиями m3u_pipeline и кешируются (LRU). Кеш
+сбрасывается, когда меняется исходный файл. Ответы несут ETag и
+поддерживают If-None-Match (304), сжатие gzip и chunked передачу.
+
+Параметры запроса (можно комбинировать):
+    extgrp=Sport,Movies   каналы с указанными #EXTGRP:
+    group=Спорт,Кино      только указанные группы
+    remove=Новости        без указанных групп
+    q=catchup and host=x  каналы, подходящие под запрос (язык запросов m3u_query)
+    title=Детям           установить всем каналам group-title
+    sort=1                сортировать каналы по названию внутри групп
+    dedup=0.8             удалить похожие каналы
+
+Пример: http://host:8080/playlist.m3u?group=Спорт,Кино&title=Для%20папы&sort=1
+Именованные представления (--view papa="group=Спорт&sort=1") доступны
+по адресу /papa.m3u.
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from m3u_parser import read_channels
+from m3u_pipeline import PipelineError, build_stage
+
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_ENTRIES = 256
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Параметр запроса -> стадия конвейера; представление строится в этом порядке
+VIEW_PARAMS = (
+    ('extgrp', 'filter'),
+    ('group', 'keep'),
+    ('remove', 'remove'),
+    ('q', 'query'),
+    ('title', 'set-group'),
+    ('sort', 'sort'),
+    ('dedup', 'dedup'),
+)
+_LIST_PARAMS = frozenset(('extgrp', 'group', 'remove'))
+_FALSE_VALUES = frozenset(('', '0', 'no', 'false'))
+
+
+def view_key(query):
+    """
+    Нормализованный ключ представления из параметров запроса
+
+    Порядок групп в списке и повторы параметров не важны:
+    group=A,B и group=B&group=A дают одно представление.
+    """
+    params = parse_qs(query, keep_blank_values=True)
+    key = []
+    for param, _ in VIEW_PARAMS:
+        values = params.pop(param, None)
+        if values is None:
+            continue
+        if param in _LIST_PARAMS:
+            items = sorted({item.strip() for value in values for item in value.split(',') if item.strip()})
+            key.append((param, tuple(items)))
+        elif param == 'sort':
+            if values[-1].strip().lower() not in _FALSE_VALUES:
+                key.append((param, True))
+        elif param == 'dedup':
+            try:
+                key.append((param, float(values[-1]) if values[-1] else 0.8))
+            except ValueError:
+                raise PipelineError(f"Некорректный порог dedup: {values[-1]!r}")
+        else:
+            key.append((param, values[-1]))
+    if params:
+        raise PipelineError(f"Неизвестные параметры: {', '.join(sorted(params))}")
+    return tuple(key)
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Принимает ли клиент gzip по заголовку Accept-Encoding
+
+    Учитываются q-значения: gzip;q=0 означает отказ от gzip, "*" действует
+    только для не названных явно кодировок. Некорректное q считается нулём.
+    """
+    wildcard = None
+    for item in accept_encoding.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        coding = coding.lower()
+        if coding in ('gzip', 'x-gzip'):
+            return quality > 0
+        if coding == '*':
+            wildcard = quality > 0
+    return bool(wildcard)
+
+
+def build_view(key):
+    """Стадии конвейера для представления; второе значение - меняет ли оно каналы"""
+    stage_names = dict(VIEW_PARAMS)
+    stages = []
+    for param, value in key:
+        stages.append(build_stage(stage_names[param], None if param == 'sort' else value))
+    return stages, any(param == 'title' for param, _ in key)
+
+
+class _View:
+    """
+    Отрисованное представление: тело ответа и сжатый вариант со своими ETag
+
+    Сильный ETag относится к конкретным байтам ответа, поэтому у сжатого
+    варианта он другой (с суффиксом -gzip), иначе кеш мог бы отдать на
+    условный запрос не ту кодировку.
+    """
+    __slots__ = ('body', 'etag', 'gzip_etag', 'count', '_gzip', '_lock')
+
+    def __init__(self, body, count):
+        self.body = body
+        self.count = count
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+        self._gzip = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return len(self.body) + (len(self._gzip) if self._gzip else 0)
+
+    def gzip_body(self):
+        # Сжимается один раз, при первом запросе с Accept-Encoding: gzip
+        with self._lock:
+            if self._gzip is None:
+                self._gzip = gzip.compress(self.body, compresslevel=6, mtime=0)
+            return self._gzip
+
+
+class PlaylistSource:
+    """
+    Исходный плейлист в памяти и LRU кеш его представлений
+
+    Файл перечитывается, когда меняются его размер или время изменения;
+    одновременно одно и то же представление строится только один раз.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_CACHE_ENTRIES, max_bytes=DEFAULT_CACHE_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.header = None
+        self.channels = []
+        self._version = None
+        self._views = OrderedDict()  # (версия, ключ) -> _View
+        self._cached_bytes = 0
+        self._rendering = {}  # (версия, ключ) -> threading.Lock
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _current_version(self):
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def refresh(self):
+        """Перечитывает источник, если файл изменился; возвращает текущую версию"""
+        version = self._current_version()
+        if version == self._version:
+            return version
+        with self._load_lock:
+            version = self._current_version()
+            if version != self._version:
+                header = []
+                # Каналы без URL потока пропускаются
+                channels = [channel for channel in read_channels(self.path, header) if channel.url]
+                with self._lock:
+                    self.header = header[0] if header else None
+                    self.channels = channels
+                    self._version = version
+                    self._views.clear()
+                    self._cached_bytes = 0
+                print(f"Загружен {self.path}: {len(channels)} каналов")
+        return version
+
+    def view(self, key):
+        """Представление по ключу view_key: из кеша или построенное заново"""
+        version = self.refresh()
+        cache_key = (version, key)
+        with self._lock:
+            view = self._views.get(cache_key)
+            if view is not None:
+                self._views.move_to_end(cache_key)
+                return view
+            render_lock = self._rendering.setdefault(cache_key, threading.Lock())
+            channels, header = self.channels, self.header
+
+        # Остальные запросы того же представления ждут окончания построения
+        with render_lock:
+            with self._lock:
+                view = self._views.get(cache_key)
+                if view is not None:
+                    return view
+            try:
+                view = self._render(key, channels, header)
+                with self._lock:
+                    if version == self._version:
+                        self._store(cache_key, view)
+            finally:
+                with self._lock:
+                    self._rendering.pop(cache_key, None)
+        return view
+
+    def _render(self, key, channels, header):
+        stages, mutates = build_view(key)
+        # Стадии, меняющие атрибуты, работают с копиями, чтобы не портить источник
+        stream = (channel.copy() for channel in channels) if mutates else iter(channels)
+        for _, run, _ in stages:
+            if run is not None:
+                stream = run(stream)
+        parts = [(header or '#EXTM3U') + '\n']
+        for channel in stream:
+            parts.append(channel.to_m3u())
+        return _View(''.join(parts).encode('utf-8'), len(parts) - 1)
+
+    def _store(self, cache_key, view):
+        self._views[cache_key] = view
+        self._cached_bytes += view.size
+        while self._views and (len(self._views) > self.max_entries or self._cached_bytes > self.max_bytes):
+            _, old = self._views.popitem(last=False)
+            self._cached_bytes -= old.size
+
+
+class PlaylistHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов представлений плейлиста"""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'm3u_server'
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        url = urlsplit(self.path)
+        name = unquote(url.path).strip('/')
+        if name.endswith('.m3u') or name.endswith('.m3u8'):
+            name = name.rsplit('.', 1)[0]
+        query = url.query
+        if name in self.server.views:
+            preset = self.server.views[name]
+            query = f'{preset}&{query}' if query else preset
+        elif name not in ('', self.server.default_name):
+            self.send_error(HTTPStatus.NOT_FOUND, explain='Неизвестное представление')
+            return
+
+        try:
+            view = self.server.source.view(view_key(query))
+        except PipelineError as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, explain=str(e))
+            return
+        except FileNotFoundError:
+            self.send_error(HTTPStatus.SERVICE_UNAVAILABLE, explain='Исходный плейлист не найден')
+            return
+
+        # Условный запрос сравнивается с ETag той кодировки, которую получил бы клиент
+        use_gzip = accepts_gzip(self.headers.get('Accept-Encoding', ''))
+        etag = view.gzip_etag if use_gzip else view.etag
+        if etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        body = view.gzip_body() if use_gzip else view.body
+        chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'audio/x-mpegurl; charset=utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('X-Channel-Count', str(view.count))
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not send_body:
+            return
+
+        data = memoryview(body)
+        if not chunked:
+            self.wfile.write(data)
+            return
+        for offset in range(0, len(data), CHUNK_SIZE):
+            chunk = data[offset:offset + CHUNK_SIZE]
+            self.wfile.write(b'%x\r\n' % len(chunk))
+            self.wfile.write(chunk)
+            self.wfile.write(b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class PlaylistServer(ThreadingHTTPServer):
+    """Многопоточный HTTP сервер представлений одного исходного плейлиста"""
+    daemon_threads = True
+
+    def __init__(self, address, source, views=None, quiet=False):
+        super().__init__(address, PlaylistHandler)
+        self.source = source
+        self.views = views or {}
+        self.quiet = quiet
+        self.default_name = os.path.splitext(os.path.basename(source.path))[0]
+
+
+def parse_views(specs):
+    """Именованные представления из строк ИМЯ=ПАРАМЕТРЫ; параметры проверяются сразу"""
+    views = {}
+    for spec in specs or ():
+        name, sep, query = spec.partition('=')
+        if not sep or not name:
+            raise PipelineError(f"Некорректное представление '{spec}', ожидается ИМЯ=ПАРАМЕТРЫ")
+        build_view(view_key(query))
+        views[name] = query
+    return views
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='HTTP сервер, отдающий отфильтрованные, переименованные и отсортированные '
+                    'представления плейлиста с кешированием',
+        epilog='Пример: %(prog)s playlist.m3u --view papa="group=Спорт,Кино&title=Для папы&sort=1", '
+               'затем http://localhost:8080/papa.m3u или http://localhost:8080/playlist.m3u?group=Спорт&sort=1')
+    parser.add_argument('playlist', help='Исходный M3U плейлист (перечитывается при изменении)')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес для прослушивания (по умолчанию 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                        help=f'Порт (по умолчанию {DEFAULT_PORT})')
+    parser.add_argument('--view', action='append', metavar='ИМЯ=ПАРАМЕТРЫ',
+                        help='Именованное представление, доступное по адресу /ИМЯ.m3u (можно несколько)')
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help=f'Максимум представлений в кеше (по умолчанию {DEFAULT_CACHE_ENTRIES})')
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help=f'Максимальный объём кеша в МБ (по умолчанию {DEFAULT_CACHE_BYTES // (1024 * 1024)})')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Не выводить журнал запросов')
+
+    args = parser.parse_args()
+
+    try:
+        views = parse_views(args.view)
+    except PipelineError as e:
+        print(f"Ошибка: {e}")
+        return
+
+    source = PlaylistSource(args.playlist, args.cache_entries, args.cache_mb * 1024 * 1024)
+    try:
+        source.refresh()
+    except FileNotFoundError:
+        print(f"Ошибка: Файл {args.playlist} не найден")
+        return
+
+    server = PlaylistServer((args.host, args.port), source, views, args.quiet)
+    print(f"Сервер запущен: http://{args.host}:{args.port}/{server.default_name}.m3u")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Сервер остановлен")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
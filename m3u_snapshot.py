@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Компактный бинарный снимок плейлиста (.m3us) для мгновенной загрузки
+
+Снимок строится из любого разобранного плейлиста и содержит:
+- строки #EXTINF и URL каналов как есть, в UTF-8 через перевод строки,
+  с массивами смещений (атрибуты и название не хранятся отдельно:
+  Extinf разбирает строку #EXTINF при обращении, как и при чтении
+  текста);
+- таблицу общих строк (группы, #EXTGRP, директивы) с массивом смещений;
+- колонки по каналам: номер общей строки #EXTGRP и директивы с массивом
+  смещений;
+- индекс групп: группы в порядке первого появления и номера их каналов.
+
+Числовые колонки хранятся с наименьшей достаточной шириной элемента
+(1, 2, 4 или 8 байт), поэтому снимок меньше исходного текста. Файл
+открывается через mmap, колонки читаются как memoryview без
+копирования, а строки декодируются только при обращении; при обходе
+всех каналов строки декодируются пачками. Поэтому список
+групп или отбор по #EXTGRP не требуют разбора всех каналов. Экспорт в M3U
+побайтно совпадает с записью тех же каналов через write_playlist (и с
+исходным файлом, если он был записан утилитами пакета).
+
+Снимок распознаётся по сигнатуре в начале файла, поэтому open_playlist,
+read_channels и утилиты на их основе принимают его вместо текстового
+плейлиста. Числа хранятся в порядке байтов little-endian.
+
+Пример:
+    python m3u_snapshot.py build provider.m3u provider.m3us
+    python iptv_manager.py provider.m3us -l
+    python m3u_snapshot.py export provider.m3us provider_copy.m3u
+"""
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+
+import m3u_stats
+from m3u_parser import SNAPSHOT_MAGIC, Channel, Extinf, compression_for, is_snapshot, read_channels
+from m3u_writer import atomic_output, write_playlist
+
+SNAPSHOT_SUFFIX = '.m3us'
+SNAPSHOT_VERSION = 2
+
+# Номер общей строки для отсутствующего значения (строка 0 таблицы зарезервирована)
+NONE = 0
+
+# Секции файла по порядку
+_SECTIONS = (
+    'strings_offsets',
+    'strings_data',
+    'extinf_offsets',
+    'extinf_data',
+    'url_offsets',
+    'url_data',
+    'extgrp',
+    'directive_offsets',
+    'directives',
+    'groups',
+    'group_offsets',
+    'group_members',
+)
+# Заголовок: сигнатура, версия, число каналов, число общих строк, номер общей строки #EXTM3U
+_HEADER = struct.Struct('<8sIQQQ')
+# Таблица секций: смещение и длина каждой секции в байтах, ширина элемента
+_SECTION = struct.Struct('<QQB7x')
+_ALIGN = 8
+_TYPECODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+# Сколько каналов декодируется за раз при обходе всего снимка
+_BATCH = 4096
+
+
+class SnapshotError(ValueError):
+    """Файл не является снимком или повреждён"""
+
+
+def _little_endian(data):
+    if sys.byteorder == 'big' and isinstance(data, array) and data.itemsize > 1:
+        data = array(data.typecode, data)
+        data.byteswap()
+    return data
+
+
+def _narrow(values):
+    """Колонка с наименьшей шириной элемента, вмещающей все значения"""
+    top = max(values, default=0)
+    for typecode in ('B', 'H', 'I'):
+        if top < 1 << (8 * array(typecode).itemsize):
+            break
+    else:
+        typecode = 'Q'
+    return values if values.typecode == typecode else array(typecode, values)
+
+
+class _Blob:
+    """Строки одной колонки в UTF-8 через перевод строки с массивом смещений"""
+
+    def __init__(self, separator=b'\n'):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+        self.separator = separator
+
+    def append(self, value):
+        if value:
+            self.data += value.encode('utf-8')
+        self.data += self.separator
+        self.offsets.append(len(self.data))
+
+
+class _Builder:
+    """Накопление строк и колонок при записи снимка"""
+
+    def __init__(self):
+        self.ids = {None: NONE}
+        # Общие строки читаются только по одной, разделитель им не нужен
+        self.strings = _Blob(b'')
+        self.strings.append(None)
+        self.extinf = _Blob()
+        self.url = _Blob()
+        self.extgrp = array('Q')
+        self.directive_offsets = array('Q', [0])
+        self.directives = array('Q')
+        self.members = OrderedDict()  # номер общей строки группы -> номера каналов
+
+    def intern(self, value):
+        """Номер общей строки: повторяющиеся значения хранятся один раз"""
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.strings.offsets) - 1
+            self.strings.append(value)
+        return string_id
+
+    def add(self, channel):
+        intern = self.intern
+        index = len(self.extgrp)
+        self.extinf.append(channel.extinf)
+        # Канал без URL хранится с пустым URL: в тексте пустая строка тоже не считается URL
+        self.url.append(channel.url)
+        self.extgrp.append(intern(channel.extgrp))
+        for line in channel.directives or ():
+            self.directives.append(intern(line))
+        self.directive_offsets.append(len(self.directives))
+        group_id = intern(channel.group)
+        members = self.members.get(group_id)
+        if members is None:
+            members = self.members[group_id] = array('Q')
+        members.append(index)
+
+    def sections(self):
+        groups = array('Q', self.members)
+        group_offsets = array('Q', [0])
+        group_members = array('Q')
+        for members in self.members.values():
+            group_members.extend(members)
+            group_offsets.append(len(group_members))
+        return {
+            'strings_offsets': _narrow(self.strings.offsets),
+            'strings_data': self.strings.data,
+            'extinf_offsets': _narrow(self.extinf.offsets),
+            'extinf_data': self.extinf.data,
+            'url_offsets': _narrow(self.url.offsets),
+            'url_data': self.url.data,
+            'extgrp': _narrow(self.extgrp),
+            'directive_offsets': _narrow(self.directive_offsets),
+            'directives': _narrow(self.directives),
+            'groups': _narrow(groups),
+            'group_offsets': _narrow(group_offsets),
+            'group_members': _narrow(group_members),
+        }
+
+
+def write_snapshot(path, channels, header=None):
+    """
+    Атомарно записывает каналы в файл снимка
+
+    Args:
+        path (str): Путь к снимку (без сжатия: снимок открывается через mmap)
+        channels: Итерируемый набор объектов Channel
+        header: Строка #EXTM3U или список с ней, заполняемый при чтении входа
+
+    Returns:
+        int: Количество записанных каналов
+    """
+    if compression_for(path):
+        raise SnapshotError(f"Снимок нельзя сжимать: {path}")
+    builder = _Builder()
+    for channel in channels:
+        builder.add(channel)
+    if isinstance(header, list):
+        header = header[0] if header else None
+    header_id = builder.intern(header)
+    sections = builder.sections()
+
+    # Секции выравниваются по 8 байт, чтобы колонки читались напрямую из mmap
+    position = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    table = []
+    for name in _SECTIONS:
+        position += -position % _ALIGN
+        view = memoryview(sections[name])
+        table.append((position, view.nbytes, view.itemsize))
+        position += view.nbytes
+
+    count = len(builder.extgrp)
+    string_count = len(builder.strings.offsets) - 1
+    with m3u_stats.stage('write'), atomic_output(path, binary=True) as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, count, string_count, header_id))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        written = _HEADER.size + _SECTION.size * len(_SECTIONS)
+        for name, (offset, length, _) in zip(_SECTIONS, table):
+            f.write(b'\0' * (offset - written))
+            f.write(_little_endian(sections[name]))
+            written = offset + length
+    m3u_stats.count('channels_written', count)
+    return count
+
+
+class Snapshot:
+    """
+    Снимок плейлиста, открытый через mmap
+
+    Объект ведёт себя как открытый файл плейлиста: его возвращает
+    open_playlist, iter_channels берёт каналы прямо из колонок, а обход
+    по строкам выдаёт текст M3U для остальных потребителей.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError(f"Файл {path} не является снимком плейлиста") from None
+        self._views = []
+        self._strings = {}
+        try:
+            self._load()
+        except BaseException:
+            self.close()
+            raise
+        if m3u_stats.current is not None:
+            m3u_stats.current.bytes_read += len(self._mmap)
+
+    def _load(self):
+        mm = self._mmap
+        table_end = _HEADER.size + _SECTION.size * len(_SECTIONS)
+        if len(mm) < _HEADER.size:
+            raise SnapshotError(f"Файл {self.path} не является снимком плейлиста")
+        magic, version, count, string_count, header_id = _HEADER.unpack_from(mm, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"Файл {self.path} не является снимком плейлиста")
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"Неподдерживаемая версия снимка {version} в файле {self.path}, "
+                                f"постройте его заново: m3u_snapshot.py build")
+        if len(mm) < table_end:
+            raise SnapshotError(f"Снимок {self.path} повреждён")
+        self.count = count
+        self.string_count = string_count
+        self._header_id = header_id
+        view = memoryview(mm)
+        self._views.append(view)
+        for i, name in enumerate(_SECTIONS):
+            offset, length, itemsize = _SECTION.unpack_from(mm, _HEADER.size + _SECTION.size * i)
+            typecode = _TYPECODES.get(itemsize)
+            if typecode is None or offset + length > len(mm) or length % itemsize:
+                raise SnapshotError(f"Снимок {self.path} повреждён: секция {name}")
+            column = view[offset:offset + length]
+            if typecode != 'B':
+                if sys.byteorder == 'big':
+                    column = _little_endian(array(typecode, column.tobytes()))
+                else:
+                    column = column.cast(typecode)
+            self._views.append(column)
+            setattr(self, f'_{name}', column)
+        if (len(self._strings_offsets) != string_count + 1 or len(self._extinf_offsets) != count + 1
+                or len(self._url_offsets) != count + 1 or len(self._extgrp) != count):
+            raise SnapshotError(f"Снимок {self.path} повреждён")
+
+    def close(self):
+        """Освобождает отображение файла; полученные каналы остаются действительными"""
+        for view in reversed(self._views):
+            if isinstance(view, memoryview):
+                view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def string(self, string_id):
+        """Общая строка по номеру (None для отсутствующего значения)"""
+        if string_id == NONE:
+            return None
+        offsets = self._strings_offsets
+        return str(self._strings_data[offsets[string_id]:offsets[string_id + 1]], 'utf-8')
+
+    def _shared(self, string_id):
+        # Повторяющиеся строки (группы, директивы) декодируются один раз и разделяются каналами
+        value = self._strings.get(string_id)
+        if value is None and string_id != NONE:
+            value = self._strings[string_id] = self.string(string_id)
+        return value
+
+    @property
+    def header(self):
+        """Строка #EXTM3U исходного плейлиста или None"""
+        return self.string(self._header_id)
+
+    def extinf(self, index):
+        """Строка #EXTINF канала"""
+        offsets = self._extinf_offsets
+        return str(self._extinf_data[offsets[index]:offsets[index + 1] - 1], 'utf-8')
+
+    def url(self, index):
+        """URL канала или None"""
+        offsets = self._url_offsets
+        start, end = offsets[index], offsets[index + 1] - 1
+        return str(self._url_data[start:end], 'utf-8') if end > start else None
+
+    def _has_url(self, index):
+        offsets = self._url_offsets
+        return offsets[index + 1] - offsets[index] > 1
+
+    def _directives_of(self, index):
+        start, end = self._directive_offsets[index], self._directive_offsets[index + 1]
+        if end == start:
+            return None
+        return [self._shared(string_id) for string_id in self._directives[start:end]]
+
+    def channel(self, index):
+        """Канал по номеру"""
+        return Channel(self.extinf(index), self._shared(self._extgrp[index]), self._directives_of(index),
+                       self.url(index))
+
+    def _channels(self):
+        # Строки пачки каналов декодируются одним вызовом и делятся по переводам строк
+        extinf_offsets, extinf_data = self._extinf_offsets, self._extinf_data
+        url_offsets, url_data = self._url_offsets, self._url_data
+        extgrp = self._extgrp
+        shared = self._shared
+        for start in range(0, self.count, _BATCH):
+            end = min(start + _BATCH, self.count)
+            lines = str(extinf_data[extinf_offsets[start]:extinf_offsets[end]], 'utf-8').split('\n')
+            urls = str(url_data[url_offsets[start]:url_offsets[end]], 'utf-8').split('\n')
+            for index, line, url in zip(range(start, end), lines, urls):
+                yield Channel(line, shared(extgrp[index]), self._directives_of(index), url or None)
+
+    def title(self, index):
+        """Название канала"""
+        return Extinf(self.extinf(index)).title
+
+    def attrs(self, index):
+        """Атрибуты #EXTINF канала"""
+        return Extinf(self.extinf(index)).attrs
+
+    def iter_channels(self, header=None):
+        """Все каналы по порядку (вызывается из m3u_parser.iter_channels)"""
+        if header is not None and not header and self._header_id != NONE:
+            header.append(self.header)
+        return self._channels()
+
+    def _counted(self, channels):
+        # Отбор в обход iter_channels тоже попадает в статистику разбора
+        stats = m3u_stats.current
+        return channels if stats is None else stats.parsed(channels)
+
+    def extgrp_values(self):
+        """Все значения #EXTGRP: по колонке, каждое декодируется один раз"""
+        return {self._shared(string_id) for string_id in set(self._extgrp) if string_id != NONE}
+
+    def select_extgrp(self, extgrp_keys):
+        """Каналы, #EXTGRP которых (в нижнем регистре) входит в набор; остальные не разбираются"""
+        wanted = {string_id for string_id in set(self._extgrp)
+                  if string_id != NONE and self._shared(string_id).lower() in extgrp_keys}
+        return self._counted(self.channel(index) for index, string_id in enumerate(self._extgrp)
+                             if string_id in wanted)
+
+    def groups(self):
+        """Группы в порядке первого появления"""
+        return [self._shared(string_id) for string_id in self._groups]
+
+    def _members(self, position):
+        return self._group_members[self._group_offsets[position]:self._group_offsets[position + 1]]
+
+    def group_counts(self, with_url=True):
+        """
+        Количество каналов по группам (по умолчанию только каналы с URL)
+
+        Группы упорядочены по первому учтённому каналу, как при группировке
+        разобранных каналов; группы без учтённых каналов не выдаются.
+        """
+        has_url = self._has_url
+        found = []
+        for position, group in enumerate(self.groups()):
+            members = self._members(position)
+            if with_url:
+                members = [index for index in members if has_url(index)]
+            if len(members):
+                found.append((members[0], group, len(members)))
+        found.sort()
+        return OrderedDict((group, count) for _, group, count in found)
+
+    def group_channels(self, groups, with_url=True):
+        """Каналы групп в заданном порядке групп (по умолчанию только каналы с URL)"""
+        positions = {group: position for position, group in enumerate(self.groups())}
+
+        def channels():
+            for group in groups:
+                for index in self._members(positions[group]):
+                    if not with_url or self._has_url(index):
+                        yield self.channel(index)
+
+        return self._counted(channels())
+
+    def __iter__(self):
+        """Текст плейлиста по строкам, как при чтении файла M3U"""
+        yield (self.header or '#EXTM3U') + '\n'
+        for index in range(self.count):
+            yield from (line + '\n' for line in self.channel(index).lines())
+
+    def export(self, path):
+        """Записывает снимок в текстовый M3U, возвращает число каналов"""
+        return write_playlist(path, self.iter_channels(), self.header)
+
+
+def wants_snapshot(path):
+    """Результат нужно записать снимком: расширение .m3us или на месте уже лежит снимок"""
+    return path.lower().endswith(SNAPSHOT_SUFFIX) or is_snapshot(path)
+
+
+def save_playlist(path, channels, header=None):
+    """Записывает каналы снимком или текстовым M3U (см. wants_snapshot), возвращает число каналов"""
+    if wants_snapshot(path):
+        return write_snapshot(path, channels, header)
+    return write_playlist(path, channels, header)
+
+
+def build_snapshot(input_file, output_file):
+    """Строит снимок из плейлиста (текстового, сжатого или другого снимка)"""
+    header = []
+    return write_snapshot(output_file, read_channels(input_file, header), header)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бинарные снимки M3U плейлистов для быстрой загрузки')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Построить снимок из плейлиста')
+    build.add_argument('input', help='Входной плейлист (.m3u, .gz, .zst)')
+    build.add_argument('output', help=f'Файл снимка (обычно {SNAPSHOT_SUFFIX})')
+
+    export = subparsers.add_parser('export', help='Выгрузить снимок в текстовый M3U')
+    export.add_argument('input', help='Файл снимка')
+    export.add_argument('output', help='Выходной M3U файл (.gz, .zst - со сжатием)')
+
+    info = subparsers.add_parser('info', help='Показать сведения о снимке')
+    info.add_argument('input', help='Файл снимка')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'build':
+            count = build_snapshot(args.input, args.output)
+            print(f"Создан снимок {args.output}: {count} каналов")
+        elif args.command == 'export':
+            with Snapshot(args.input) as snapshot:
+                count = snapshot.export(args.output)
+            print(f"Снимок выгружен в {args.output}: {count} каналов")
+        else:
+            with Snapshot(args.input) as snapshot:
+                print(f"Снимок {args.input}: {len(snapshot)} каналов, "
+                      f"{snapshot.string_count} общих строк (группы, #EXTGRP, директивы)")
+                print(f"Заголовок: {snapshot.header or '(нет)'}")
+                for group, count in snapshot.group_counts(with_url=False).items():
+                    print(f"  {group}: {count}")
+    except FileNotFoundError as e:
+        print(f"Ошибка: Файл {e.filename} не найден")
+        sys.exit(1)
+    except (SnapshotError, OSError) as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Статистика и профилирование утилит (--stats, --stats-json, --profile, --trace-memory)
+
+Пока статистика включена, парсер, параллельное чтение и запись плейлистов
+сами отмечают время этапов, прочитанные и записанные байты и счётчики
+каналов (разобрано, без URL, некорректные строки). Утилиты добавляют
+свои этапы через stage(). Без статистики current равен None, и разбор
+с записью идут без обёрток и замеров.
+"""
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Сборщик статистики текущего запуска или None
+current = None
+
+# Названия этапов и счётчиков для текстового отчёта
+STAGE_NAMES = {
+    'fetch': 'загрузка',
+    'parse': 'чтение и разбор',
+    'process': 'обработка',
+    'sort': 'сортировка',
+    'dedup': 'поиск дубликатов',
+    'check': 'проверка потоков',
+    'write': 'запись',
+    'other': 'прочее',
+}
+COUNTER_NAMES = {
+    'channels_parsed': 'каналов разобрано',
+    'channels_written': 'каналов записано',
+    'channels_without_url': 'без URL',
+    'malformed_lines': 'некорректных строк',
+    'duplicates_dropped': 'отброшено дубликатов',
+}
+
+_PROFILE_TOP = 25
+
+
+class Stats:
+    """Время этапов, счётчики и объём ввода-вывода одного запуска"""
+
+    def __init__(self, tool):
+        self.tool = tool
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.memory_snapshot = None
+        self._snapshot_size = 0
+        # Пик дочерних процессов, унаследованный при exec (например, от скрипта-обёртки)
+        self._children_rss = _max_rss(resource.RUSAGE_CHILDREN) if resource is not None else 0
+
+    def add_time(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, iterable, name):
+        """Обёртка итератора: время, проведённое внутри next(), относится к этапу name"""
+        iterator = iter(iterable)
+        clock = time.perf_counter
+        spent = 0.0
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    spent += clock() - start
+                    return
+                spent += clock() - start
+                yield item
+        finally:
+            self.add_time(name, spent)
+
+    def parsed(self, channels):
+        """Обёртка разбора: время этапа parse, число каналов и каналов без URL"""
+        parsed = without_url = 0
+        try:
+            for channel in self.timed(channels, 'parse'):
+                parsed += 1
+                if channel.url is None:
+                    without_url += 1
+                yield channel
+        finally:
+            self.count('channels_parsed', parsed)
+            if without_url:
+                self.count('channels_without_url', without_url)
+            self.memory_checkpoint()
+
+    def memory_checkpoint(self):
+        """
+        При трассировке tracemalloc запоминает снимок выделений, если сейчас
+        памяти занято больше, чем в прошлом снимке. Вызывается после разбора,
+        когда каналы обычно ещё в памяти, и в конце запуска.
+        """
+        if not tracemalloc.is_tracing():
+            return
+        size, _ = tracemalloc.get_traced_memory()
+        if size > self._snapshot_size:
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            self._snapshot_size = size
+
+    def merge_counters(self, counters):
+        """Добавляет счётчики, собранные в другом процессе"""
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def peak_memory(self, children=False):
+        """
+        Пиковый размер резидентной памяти в байтах (None, если неизвестен)
+
+        С children=True - пик самого крупного из завершённых дочерних
+        процессов (рабочие процессы -j); None, если их не было.
+        """
+        if resource is None:
+            return None
+        if not children:
+            return _max_rss(resource.RUSAGE_SELF)
+        max_rss = _max_rss(resource.RUSAGE_CHILDREN)
+        return max_rss if max_rss > self._children_rss else None
+
+    def to_json(self):
+        seconds = time.perf_counter() - self.started
+        stages = dict(self.stages)
+        # Остаток: разбор атрибутов, сериализация каналов и работа самой утилиты
+        stages['other'] = max(0.0, seconds - sum(stages.values()))
+        return {
+            'tool': self.tool,
+            'seconds': round(seconds, 6),
+            'stages': {name: round(value, 6) for name, value in stages.items()},
+            'counters': dict(self.counters),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'peak_rss_bytes': self.peak_memory(),
+            'peak_rss_children_bytes': self.peak_memory(children=True),
+        }
+
+    def report(self, file=None):
+        """Текстовый отчёт"""
+        data = self.to_json()
+        lines = [f"Статистика {self.tool}:", f"  Время: {data['seconds']:.3f} с"]
+        stages = ', '.join(f"{STAGE_NAMES.get(name, name)} {seconds:.3f} с"
+                           for name, seconds in data['stages'].items())
+        lines.append(f"  Этапы: {stages}")
+        lines.append(f"  Прочитано: {_megabytes(data['bytes_read'])}, записано: {_megabytes(data['bytes_written'])}")
+        if data['counters']:
+            counters = ', '.join(f"{COUNTER_NAMES.get(name, name)}: {value}"
+                                 for name, value in data['counters'].items())
+            lines.append(f"  {counters}")
+        if data['peak_rss_bytes'] is not None:
+            line = f"  Пик памяти: {_megabytes(data['peak_rss_bytes'])}"
+            if data['peak_rss_children_bytes'] is not None:
+                line += f", дочерних процессов: до {_megabytes(data['peak_rss_children_bytes'])} на процесс"
+            lines.append(line)
+        print('\n'.join(lines), file=file)
+
+
+def _max_rss(who):
+    max_rss = resource.getrusage(who).ru_maxrss
+    # В Linux ru_maxrss в килобайтах, в macOS - в байтах
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):.1f} МБ"
+
+
+def stage(name):
+    """Этап текущего запуска (без статистики - пустой контекст)"""
+    return current.stage(name) if current is not None else nullcontext()
+
+
+def count(name, value=1):
+    """Увеличивает счётчик текущего запуска"""
+    if current is not None:
+        current.count(name, value)
+
+
+def add_stats_arguments(parser):
+    """Добавляет общие опции статистики и профилирования"""
+    group = parser.add_argument_group('статистика и профилирование')
+    group.add_argument('--stats', action='store_true',
+                       help='Вывести время этапов, объём ввода-вывода, счётчики каналов и пик памяти')
+    group.add_argument('--stats-json', metavar='FILE',
+                       help='Записать статистику в JSON (- для стандартного потока ошибок)')
+    group.add_argument('--profile', metavar='FILE',
+                       help='Профилировать через cProfile и сохранить результат (pstats) в FILE')
+    group.add_argument('--trace-memory', type=int, nargs='?', const=10, metavar='N',
+                       help='Отследить выделения памяти через tracemalloc и показать N крупнейших мест (по умолчанию 10)')
+
+
+@contextmanager
+def instrument(args, tool):
+    """
+    Включает статистику и профилирование по опциям add_stats_arguments
+
+    Отчёт выводится при выходе из блока, в том числе после sys.exit().
+    """
+    global current
+    enabled = args.stats or args.stats_json or args.trace_memory
+    profiler = cProfile.Profile() if args.profile else None
+    if enabled:
+        current = Stats(tool)
+    if args.trace_memory:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield current
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _dump_profile(profiler, args.profile)
+        stats, current = current, None
+        if stats is not None:
+            _report(stats, args)
+        if args.trace_memory:
+            tracemalloc.stop()
+
+
+def _dump_profile(profiler, path):
+    profiler.dump_stats(path)
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(_PROFILE_TOP)
+    print(f"Профиль сохранён в {path} (просмотр: python -m pstats {path})", file=sys.stderr)
+    print(output.getvalue(), file=sys.stderr)
+
+
+def _report(stats, args):
+    data = stats.to_json()
+    if args.trace_memory:
+        stats.memory_checkpoint()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = stats.memory_snapshot or tracemalloc.take_snapshot()
+        top = snapshot.statistics('lineno')[:args.trace_memory]
+        data['tracemalloc'] = {
+            'peak_bytes': peak,
+            'top': [{'where': str(stat.traceback), 'bytes': stat.size, 'count': stat.count} for stat in top],
+        }
+    if args.stats or args.trace_memory:
+        stats.report()
+        if args.trace_memory:
+            print(f"  Пик по tracemalloc: {_megabytes(data['tracemalloc']['peak_bytes'])}, крупнейшие места:")
+            for item in data['tracemalloc']['top']:
+                print(f"    {item['where']}: {_megabytes(item['bytes'])} ({item['count']} блоков)")
+    if args.stats_json:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+        if args.stats_json == '-':
+            # Стандартный вывод занят сообщениями утилиты
+            print(text, file=sys.stderr)
+        else:
+            with open(args.stats_json, 'w', encoding='utf-8') as f:
+                f.write(text + '\n')
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Режим наблюдения: пересчёт результатов при изменении исходного плейлиста
+
+Источник отслеживается через inotify (если установлен inotify_simple)
+или опросом. При каждом изменении плейлист разбирается заново, каналы
+сравниваются с предыдущим разбором по хешам содержимого, а пересчитываются
+только части результата, каналы которых изменились: группы для sort и
+manage, выходные файлы для filter. Выходной файл, содержимое которого
+не изменилось, не перезаписывается.
+"""
+import argparse
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from operator import itemgetter
+
+from filter_m3u import load_routes
+from iptv_manager import remove_group_order, swap_group_order
+from m3u_parser import EXTM3U, normalize_url, read_channels
+from m3u_writer import PlaylistWriter
+from sort_iptv import collation_key, sorted_output_name
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+DEFAULT_INTERVAL = 5.0
+# Пауза после события, чтобы дождаться окончания серии записей
+DEBOUNCE = 0.5
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def file_digest(path):
+    """Хеш содержимого файла или None, если файла нет"""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.digest()
+
+
+class SortJob:
+    """Как sort_iptv: каналы по названию внутри групп, порядок групп сохраняется"""
+
+    def __init__(self, output):
+        self.output = output
+
+    def unit_of(self, channel):
+        # Каналы без URL потока пропускаются
+        return channel.group if channel.url else None
+
+    def render(self, unit, channels):
+        channels = sorted(channels, key=lambda channel: collation_key(channel.name))
+        return ''.join(channel.to_m3u() for channel in channels)
+
+    def outputs(self, units, header):
+        return {self.output: (header, list(units))}
+
+
+class ManageJob:
+    """Как iptv_manager: перестановка и удаление групп (и по желанию сортировка внутри групп)"""
+
+    def __init__(self, output, swap=None, remove=None, sort=False):
+        self.output = output
+        self.swap = swap
+        self.remove = remove
+        self.sort = sort
+
+    def unit_of(self, channel):
+        # Каналы без URL потока пропускаются
+        return channel.group if channel.url else None
+
+    def render(self, unit, channels):
+        if self.sort:
+            channels = sorted(channels, key=lambda channel: collation_key(channel.name))
+        return ''.join(channel.to_m3u() for channel in channels)
+
+    def outputs(self, units, header):
+        order = list(units)
+        if self.swap:
+            order = swap_group_order(order, *self.swap) or order
+        if self.remove:
+            order, _ = remove_group_order(order, self.remove)
+        return {self.output: (header, order)}
+
+
+class FilterJob:
+    """Как filter_m3u в пакетном режиме: группы #EXTGRP: раскладываются по файлам"""
+
+    def __init__(self, routes, sort=True):
+        self.sort = sort
+        self.route_map = {extgrp_name.lower(): route for extgrp_name, route in routes.items()}
+        self.paths = list(dict.fromkeys(output for output, _ in routes.values()))
+
+    def unit_of(self, channel):
+        # Единица пересчёта - выходной файл, в который направлен канал
+        if channel.extgrp is None:
+            return None
+        route = self.route_map.get(channel.extgrp.lower())
+        return route[0] if route else None
+
+    def render(self, unit, channels):
+        blocks = []
+        for channel in channels:
+            channel = channel.copy()
+            channel.set_attr('group-title', self.route_map[channel.extgrp.lower()][1])
+            blocks.append((channel.name.lower(), channel.to_m3u(keep_extgrp=False)))
+        if self.sort:
+            blocks.sort(key=itemgetter(0))
+        # Пустая строка между каналами, как в filter_m3u
+        return '\n'.join(block for _, block in blocks)
+
+    def outputs(self, units, header):
+        return {path: (EXTM3U, [path] if path in units else []) for path in self.paths}
+
+
+class IncrementalRunner:
+    """Состояние между циклами: хеши каналов, отрисованные части и хеши выходных файлов"""
+
+    def __init__(self, source, job):
+        self.source = source
+        self.job = job
+        self.channel_hashes = {}  # идентификатор канала -> хеш содержимого
+        self.units = {}  # часть -> (хеш части, текст)
+        self.written = {}  # выходной файл -> хеш содержимого
+        self.layouts = {}  # выходной файл -> (заголовок, порядок частей)
+
+    def _identity(self, channel, seen):
+        # Канал опознаётся по URL (повторы URL нумеруются), иначе по названию
+        base = normalize_url(channel.url) if channel.url else channel.name
+        number = seen.get(base, 0)
+        seen[base] = number + 1
+        return base if not number else f'{base}#{number}'
+
+    def run_cycle(self):
+        """Один цикл: разбор, сравнение, пересчёт изменившихся частей и запись изменившихся файлов"""
+        header = []
+        unit_channels = OrderedDict()  # часть -> [каналы]
+        unit_hashes = {}  # часть -> хеш-объект по хешам каналов
+        channel_hashes = {}
+        seen = {}
+        for channel in read_channels(self.source, header):
+            channel_hash = _digest(channel.to_m3u().encode('utf-8'))
+            channel_hashes[self._identity(channel, seen)] = channel_hash
+            unit = self.job.unit_of(channel)
+            if unit is None:
+                continue
+            if unit not in unit_channels:
+                unit_channels[unit] = []
+                unit_hashes[unit] = hashlib.blake2b(digest_size=16)
+            unit_channels[unit].append(channel)
+            unit_hashes[unit].update(channel_hash)
+
+        old = self.channel_hashes
+        added = sum(1 for identity in channel_hashes if identity not in old)
+        removed = sum(1 for identity in old if identity not in channel_hashes)
+        modified = sum(1 for identity, channel_hash in channel_hashes.items()
+                       if identity in old and old[identity] != channel_hash)
+        self.channel_hashes = channel_hashes
+
+        # Пересчитываются только части, набор или содержимое каналов которых изменились
+        units = {}
+        changed_units = set()
+        for unit, channels in unit_channels.items():
+            unit_hash = unit_hashes[unit].digest()
+            cached = self.units.get(unit)
+            if cached is not None and cached[0] == unit_hash:
+                units[unit] = cached
+            else:
+                units[unit] = (unit_hash, self.job.render(unit, channels))
+                changed_units.add(unit)
+        dropped_units = set(self.units) - set(units)
+        self.units = units
+
+        header_line = header[0] if header else EXTM3U
+        stale = changed_units | dropped_units
+        written = unchanged = 0
+        for path, (output_header, order) in self.job.outputs(units, header_line).items():
+            layout = (output_header, tuple(order))
+            if self.layouts.get(path) == layout and not stale.intersection(order):
+                unchanged += 1
+                continue
+            self.layouts[path] = layout
+            digest = hashlib.blake2b(output_header.encode('utf-8') + b'\n', digest_size=16)
+            for unit in order:
+                digest.update(units[unit][1].encode('utf-8'))
+            digest = digest.digest()
+            # При первом цикле сравниваем с уже существующим файлом
+            previous = self.written[path] if path in self.written else file_digest(path)
+            self.written[path] = digest
+            if digest == previous:
+                unchanged += 1
+                continue
+            with PlaylistWriter(path, output_header) as writer:
+                for unit in order:
+                    writer.write_block(units[unit][1])
+            written += 1
+
+        print(f"[{time.strftime('%H:%M:%S')}] каналов: {len(channel_hashes)}, добавлено: {added}, "
+              f"удалено: {removed}, изменено: {modified}; пересчитано частей: {len(changed_units)} "
+              f"из {len(units)}; записано файлов: {written}, без изменений: {unchanged}")
+        return added, removed, modified
+
+
+def _stat_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def poll_changes(path, interval=DEFAULT_INTERVAL):
+    """Выдаёт событие при изменении размера или времени изменения файла (опрос)"""
+    version = _stat_version(path)
+    while True:
+        time.sleep(interval)
+        current = _stat_version(path)
+        if current is None or current == version:
+            continue
+        # Ждём, пока файл перестанет меняться (провайдер может дописывать его частями)
+        while True:
+            time.sleep(DEBOUNCE)
+            settled = _stat_version(path)
+            if settled == current:
+                break
+            current = settled
+        version = current
+        yield
+
+
+def inotify_changes(path):
+    """Выдаёт событие после закрытия записанного файла или его подмены переименованием"""
+    directory = os.path.dirname(os.path.abspath(path))
+    name = os.path.basename(path)
+    flags = inotify_simple.flags
+    with inotify_simple.INotify() as inotify:
+        inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO)
+        while True:
+            if any(event.name == name for event in inotify.read()):
+                # Остальные события серии вычитываются, цикл выполняется один раз
+                while inotify.read(timeout=int(DEBOUNCE * 1000)):
+                    pass
+                yield
+
+
+def watch(source, job, interval=DEFAULT_INTERVAL, once=False, poll=False):
+    """
+    Выполняет задание при запуске и после каждого изменения источника
+
+    Args:
+        source (str): Путь к исходному плейлисту
+        job: Задание (SortJob, ManageJob или FilterJob)
+        interval (float): Период опроса в секундах (без inotify)
+        once (bool): Выполнить один цикл и выйти
+        poll (bool): Использовать опрос даже при наличии inotify_simple
+    """
+    runner = IncrementalRunner(source, job)
+    runner.run_cycle()
+    if once:
+        return runner
+    if inotify_simple is not None and not poll:
+        print(f"Наблюдение за {source} (inotify)")
+        changes = inotify_changes(source)
+    else:
+        print(f"Наблюдение за {source} (опрос каждые {interval:g} с)")
+        changes = poll_changes(source, interval)
+    for _ in changes:
+        try:
+            runner.run_cycle()
+        except FileNotFoundError:
+            print(f"Предупреждение: Файл {source} не найден, ждём его появления")
+        except Exception as e:
+            print(f"Ошибка при обработке {source}: {e}")
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Наблюдение за плейлистом: пересчёт только изменившихся групп при каждом обновлении источника',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='''
+Примеры:
+  %(prog)s source.m3u sort -o sorted.m3u
+  %(prog)s source.m3u filter -r Sport sport.m3u Спорт -r Movies movies.m3u Кино
+  %(prog)s source.m3u manage -o family.m3u -s Спорт Кино -r Новости --sort
+        ''')
+    parser.add_argument('source', help='Исходный M3U плейлист')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f'Период опроса файла в секундах без inotify (по умолчанию {DEFAULT_INTERVAL:g})')
+    parser.add_argument('--poll', action='store_true', help='Опрашивать файл даже при наличии inotify_simple')
+    parser.add_argument('--once', action='store_true', help='Выполнить один цикл и выйти')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sort_parser = commands.add_parser('sort', help='Сортировка каналов внутри групп (как sort_iptv)')
+    sort_parser.add_argument('-o', '--output', help='Выходной файл (по умолчанию <имя>_sorted<расширение>)')
+
+    filter_parser = commands.add_parser('filter', help='Раскладка групп #EXTGRP: по файлам (как filter_m3u -r/-b)')
+    filter_parser.add_argument('-r', '--route', nargs=3, action='append', metavar=('EXTGRP', 'OUTPUT', 'GROUP_TITLE'),
+                               help='Направить группу EXTGRP в файл OUTPUT с group-title GROUP_TITLE')
+    filter_parser.add_argument('-b', '--batch', metavar='SPEC',
+                               help='JSON файл вида {"EXTGRP": ["выход.m3u", "group-title"], ...}')
+    filter_parser.add_argument('--no-sort', action='store_true', help='Отключить сортировку по названию')
+
+    manage_parser = commands.add_parser('manage', help='Перестановка и удаление групп (как iptv_manager -s/-r)')
+    manage_parser.add_argument('-o', '--output', required=True, help='Выходной файл (не может совпадать с источником)')
+    manage_parser.add_argument('-s', '--swap', nargs=2, metavar=('ГРУППА1', 'ГРУППА2'), help='Поменять местами две группы')
+    manage_parser.add_argument('-r', '--remove', nargs='+', metavar='ГРУППА', help='Удалить группы')
+    manage_parser.add_argument('--sort', action='store_true', help='Сортировать каналы по названию внутри групп')
+
+    args = parser.parse_args()
+
+    if args.command == 'sort':
+        output = args.output or sorted_output_name(args.source)
+        job = SortJob(output)
+        outputs = [output]
+    elif args.command == 'filter':
+        routes = {}
+        if args.batch:
+            try:
+                routes.update(load_routes(args.batch))
+            except Exception as e:
+                print(f"Ошибка при чтении файла маршрутов: {e}")
+                return
+        for extgrp_name, output_file, group_title in args.route or []:
+            routes[extgrp_name] = (output_file, group_title)
+        if not routes:
+            parser.error('Укажите маршруты: -r EXTGRP OUTPUT GROUP_TITLE или -b SPEC')
+        job = FilterJob(routes, not args.no_sort)
+        outputs = job.paths
+    else:
+        job = ManageJob(args.output, args.swap, args.remove, args.sort)
+        outputs = [args.output]
+
+    # Запись в наблюдаемый файл запускала бы обработку заново
+    source = os.path.abspath(args.source)
+    if any(os.path.abspath(output) == source for output in outputs):
+        parser.error('Выходной файл не может совпадать с наблюдаемым источником')
+
+    try:
+        watch(args.source, job, args.interval, args.once, args.poll)
+    except FileNotFoundError:
+        print(f"Ошибка: Файл {args.source} не найден")
+    except KeyboardInterrupt:
+        print("Наблюдение остановлено")
+
+if __name__ == "__main__":
+    main()
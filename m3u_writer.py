@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Общий потоковый вывод плейлистов с атомарной заменой файла
+
+Каналы пишутся по одному во временный файл в каталоге назначения
+с большим буфером, затем файл сбрасывается на диск (fsync) и
+переименовывается на место результата. При ошибке или прерывании
+исходный файл не страдает, поэтому выходной файл может совпадать
+с входным. В памяти находится только текущий блок канала.
+Файлы .gz и .zst сжимаются на лету (для .zst нужен zstandard).
+"""
+import gzip
+import io
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import m3u_stats
+from m3u_parser import BUFFER_SIZE, EXTM3U, compression_for, is_url, require_zstandard
+
+
+def _file_mode(path):
+    # Права заменяемого файла сохраняются, новый файл получает права по umask
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _fsync_dir(directory):
+    # Переименование надёжно только после сброса каталога; не везде поддерживается
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_output(path, binary=False, compression=None, buffering=BUFFER_SIZE):
+    """
+    Открывает временный файл рядом с path и атомарно подменяет им path при успешном выходе
+
+    Args:
+        path (str): Путь к результату
+        binary (bool): Выдать бинарный поток вместо текстового (utf-8)
+        compression (str): 'gzip', 'zstd' или None; по умолчанию по расширению path
+        buffering (int): Размер буфера файла (0 - без буфера, для os.sendfile)
+    """
+    if is_url(path):
+        raise ValueError(f"Результат нельзя записать по URL {path}, укажите выходной файл")
+    if compression is None:
+        compression = compression_for(path)
+    zstd = require_zstandard() if compression == 'zstd' else None
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        with open(fd, 'wb', buffering=buffering) as raw:
+            if compression == 'gzip':
+                stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0)
+            elif compression == 'zstd':
+                stream = zstd.ZstdCompressor().stream_writer(raw, closefd=False)
+            else:
+                stream = raw
+            out = stream if binary else io.TextIOWrapper(stream, encoding='utf-8')
+            yield out
+            if out is not stream:
+                out.flush()
+                out.detach()
+            if stream is not raw:
+                # Дописывает конец сжатого потока, сам файл остаётся открытым
+                stream.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+    if m3u_stats.current is not None:
+        m3u_stats.current.bytes_written += os.path.getsize(path)
+
+
+class PlaylistWriter:
+    """
+    Потоковая атомарная запись плейлиста
+
+    Заголовок #EXTM3U записывается перед первым каналом (или при закрытии,
+    если каналов нет), поэтому его можно передать списком, который
+    заполняется при чтении входа (iter_channels(..., header)).
+
+    Пример:
+        with PlaylistWriter(output) as writer:
+            for channel in channels:
+                writer.write(channel)
+    """
+
+    def __init__(self, path, header=None, keep_extgrp=True, separator='', compression=None):
+        """
+        Args:
+            path (str): Путь к результату (может совпадать с входным файлом)
+            header: Строка #EXTM3U с атрибутами или список с ней (по умолчанию #EXTM3U)
+            keep_extgrp (bool): Сохранять строки #EXTGRP:
+            separator (str): Текст между блоками каналов (например '\\n' - пустая строка)
+            compression (str): 'gzip', 'zstd' или None - по расширению path
+        """
+        self.path = path
+        self.header = header
+        self.keep_extgrp = keep_extgrp
+        self.separator = separator
+        self.compression = compression
+        self.count = 0
+        self._context = None
+        self._file = None
+        self._header_written = False
+        self._stats = None
+
+    def open(self):
+        """Создаёт временный файл; вызывается автоматически в with"""
+        self._context = atomic_output(self.path, compression=self.compression)
+        self._file = self._context.__enter__()
+        self._stats = m3u_stats.current
+        if self._stats is not None:
+            # Время записи блоков и закрытия файла относится к этапу write
+            self.write_block = self._timed_write_block
+        return self
+
+    def close(self):
+        """Дописывает заголовок (если каналов не было) и подменяет результат временным файлом"""
+        if self._context is None:
+            return
+        with m3u_stats.stage('write'):
+            self._write_header()
+            context, self._context, self._file = self._context, None, None
+            context.__exit__(None, None, None)
+        m3u_stats.count('channels_written', self.count)
+
+    def abort(self):
+        """Удаляет временный файл, результат остаётся прежним"""
+        if self._context is None:
+            return
+        context, self._context, self._file = self._context, None, None
+        try:
+            context.__exit__(GeneratorExit, GeneratorExit(), None)
+        except GeneratorExit:
+            pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write_header(self):
+        if not self._header_written:
+            header = self.header
+            if isinstance(header, list):
+                header = header[0] if header else None
+            self._file.write((header or EXTM3U) + '\n')
+            self._header_written = True
+
+    def write_block(self, block):
+        """Записывает готовый текстовый блок канала"""
+        self._write_header()
+        if self.count and self.separator:
+            self._file.write(self.separator)
+        self._file.write(block)
+        self.count += 1
+
+    def _timed_write_block(self, block):
+        start = time.perf_counter()
+        PlaylistWriter.write_block(self, block)
+        self._stats.add_time('write', time.perf_counter() - start)
+
+    def write(self, channel):
+        """Записывает канал"""
+        self.write_block(channel.to_m3u(self.keep_extgrp))
+
+    def write_all(self, channels):
+        """Записывает все каналы потока, возвращает общее число записанных каналов"""
+        for channel in channels:
+            self.write(channel)
+        return self.count
+
+
+def write_playlist(path, channels, header=None, keep_extgrp=True, compression=None):
+    """
+    Потоково и атомарно записывает каналы в файл плейлиста
+
+    Returns:
+        int: Количество записанных каналов
+    """
+    with PlaylistWriter(path, header, keep_extgrp, compression=compression) as writer:
+        return writer.write_all(channels)
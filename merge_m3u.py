@@ -1,51 +1,246 @@
 import argparse
+import hashlib
+import math
+import time
 
-def merge_m3u_playlists(playlist1_path, playlist2_path, output_path):
+import m3u_stats
+from m3u_parser import iter_channels, normalize_url, open_playlist
+from m3u_remote import prefetch_inputs
+from m3u_stats import add_stats_arguments, count, instrument
+from m3u_writer import PlaylistWriter
+from probe_cache import ProbeCache
+
+DEDUP_KEYS = ('url', 'tvg-id')
+# Сколько каналов проверяется по кешу проверок одним запросом
+HEALTH_BATCH = 500
+
+def _digest(kind, value):
+    return hashlib.blake2b(f'{kind}\0{value}'.encode('utf-8'), digest_size=16).digest()
+
+class HashSet:
+    """
+    Точное множество ключей: хранит 64-битные хеши (целые числа) вместо строк URL и tvg-id
+
+    Память растёт с числом каналов (около 70 байт на ключ), для фиксированной
+    памяти есть BloomFilter.
+    """
+
+    def __init__(self):
+        self._hashes = set()
+
+    def __contains__(self, digest):
+        return int.from_bytes(digest[:8], 'little') in self._hashes
+
+    def add(self, digest):
+        self._hashes.add(int.from_bytes(digest[:8], 'little'))
+
+class BloomFilter:
+    """
+    Фильтр Блума для очень больших объёмов: память фиксирована,
+    но с вероятностью error уникальный канал может быть принят за дубликат
     """
-    Объединяет два M3U плейлиста, добавляя содержимое второго в конец первого.
-    
-    :param playlist1_path: Путь к первому плейлисту
-    :param playlist2_path: Путь ко второму плейлисту
+
+    def __init__(self, capacity, error=0.001):
+        self.size = max(8, int(-capacity * math.log(error) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Двойное хеширование: k позиций из двух независимых 64-битных хешей
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % self.size
+            yield pos >> 3, 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        bits = self._bits
+        return all(bits[byte] & mask for byte, mask in self._positions(digest))
+
+    def add(self, digest):
+        bits = self._bits
+        for byte, mask in self._positions(digest):
+            bits[byte] |= mask
+
+def channel_keys(channel, dedup):
+    """Ключи дедупликации канала (нормализованный URL и/или tvg-id)"""
+    keys = []
+    if 'url' in dedup and channel.url:
+        keys.append(_digest('url', normalize_url(channel.url)))
+    if 'tvg-id' in dedup:
+        tvg_id = channel.get_attr('tvg-id')
+        if tvg_id:
+            keys.append(_digest('tvg-id', tvg_id.strip().casefold()))
+    return keys
+
+class Deduplicator:
+    """
+    Поиск дубликатов по ключам уже пропущенных каналов
+
+    Запоминаются только ключи пропущенных каналов, поэтому побеждает первый
+    канал. При включённой статистике время проверки относится к этапу dedup.
+    """
+
+    def __init__(self, dedup, seen):
+        self.dedup = dedup
+        self.seen = seen
+        self._stats = m3u_stats.current
+        if self._stats is not None:
+            self.is_duplicate = self._timed_is_duplicate
+
+    def is_duplicate(self, channel):
+        """Канал дублирует пропущенный ранее; иначе его ключи запоминаются"""
+        keys = channel_keys(channel, self.dedup)
+        seen = self.seen
+        if any(key in seen for key in keys):
+            return True
+        for key in keys:
+            seen.add(key)
+        return False
+
+    def _timed_is_duplicate(self, channel):
+        start = time.perf_counter()
+        duplicate = Deduplicator.is_duplicate(self, channel)
+        self._stats.add_time('dedup', time.perf_counter() - start)
+        return duplicate
+
+def with_health(channels, health_cache=None, max_age=None):
+    """
+    Выдаёт пары (канал, недоступен ли поток по кешу проверок)
+
+    Каналы читаются пачками по HEALTH_BATCH, и для каждой пачки кеш
+    запрашивается только по её URL, поэтому поток не накапливается в памяти.
+    """
+    if health_cache is None:
+        for channel in channels:
+            yield channel, False
+        return
+    batch = []
+    for channel in channels:
+        batch.append(channel)
+        if len(batch) == HEALTH_BATCH:
+            yield from _flag_dead(batch, health_cache, max_age)
+            batch = []
+    yield from _flag_dead(batch, health_cache, max_age)
+
+def _flag_dead(batch, health_cache, max_age):
+    dead_keys = health_cache.dead_keys([channel.url for channel in batch if channel.url], max_age)
+    for channel in batch:
+        yield channel, bool(dead_keys) and channel.url is not None and normalize_url(channel.url) in dead_keys
+
+def merge_m3u_playlists(playlist_paths, output_path, dedup=('url',), bloom_capacity=None, bloom_error=0.001, prefer=None,
+                        health_cache=None, health_max_age=None):
+    """
+    Объединяет несколько M3U плейлистов в один с потоковой записью и удалением дубликатов.
+
+    Каналы записываются по мере чтения, в памяти хранятся только хеши ключей.
+    Дубликатом считается канал, у которого совпал хотя бы один ключ с уже
+    записанным каналом. Побеждает первый записанный канал, поэтому источник
+    prefer обрабатывается первым.
+
+    :param playlist_paths: Пути к плейлистам или URL http(s) в порядке объединения
     :param output_path: Путь для сохранения объединенного плейлиста
+    :param dedup: Ключи дедупликации: 'url', 'tvg-id' (пусто - без дедупликации)
+    :param bloom_capacity: Ожидаемое число каналов для режима фильтра Блума (None - точное множество)
+    :param bloom_error: Допустимая доля ложных срабатываний фильтра Блума
+    :param prefer: Путь к источнику, каналы которого имеют приоритет
+    :param health_cache: Кеш проверок (probe_cache.ProbeCache): каналы со свежим результатом «недоступен» пропускаются
+    :param health_max_age: Предельный возраст результата проверки в секундах (None - TTL по статусу)
+    :return: Словарь {путь: (записано, отброшено дубликатов, отброшено недоступных)} или None при ошибке
     """
+    order = list(playlist_paths)
+    if prefer is not None:
+        if prefer not in order:
+            print(f"Ошибка: Источник '{prefer}' не входит в список плейлистов")
+            return None
+        order.remove(prefer)
+        order.insert(0, prefer)
+
+    # Удалённые источники загружаются параллельно до начала объединения
+    prefetch_inputs(order)
+
+    seen = BloomFilter(bloom_capacity, bloom_error) if bloom_capacity else HashSet()
+    duplicates = Deduplicator(dedup, seen) if dedup else None
+    stats = {}
+    # Заголовок первого плейлиста сохраняется вместе с атрибутами (url-tvg и т.п.)
+    first_header = []
+
     try:
-        # Читаем содержимое первого плейлиста
-        with open(playlist1_path, 'r', encoding='utf-8') as f1:
-            playlist1_content = f1.readlines()
-        
-        # Читаем содержимое второго плейлиста
-        with open(playlist2_path, 'r', encoding='utf-8') as f2:
-            playlist2_content = f2.readlines()
-        
-        # Проверяем, является ли файл M3U плейлистом (начинается с #EXTM3U)
-        if not playlist1_content[0].startswith('#EXTM3U'):
-            print("Предупреждение: Первый файл может не быть M3U плейлистом (отсутствует #EXTM3U в начале)")
-        
-        if not playlist2_content[0].startswith('#EXTM3U'):
-            print("Предупреждение: Второй файл может не быть M3U плейлистом (отсутствует #EXTM3U в начале)")
-        
-        # Объединяем плейлисты (пропускаем заголовок второго плейлиста если он есть)
-        merged_content = playlist1_content
-        if playlist2_content[0].startswith('#EXTM3U'):
-            merged_content.extend(playlist2_content[1:])
-        else:
-            merged_content.extend(playlist2_content)
-        
-        # Записываем объединенный плейлист
-        with open(output_path, 'w', encoding='utf-8') as out_file:
-            out_file.writelines(merged_content)
-        
+        with PlaylistWriter(output_path, first_header) as out_file:
+            for i, path in enumerate(order):
+                written = dropped = dead = 0
+                with open_playlist(path) as f:
+                    header = first_header if i == 0 else []
+                    for channel, is_dead in with_health(iter_channels(f, header), health_cache, health_max_age):
+                        if is_dead:
+                            dead += 1
+                            continue
+                        if duplicates is not None and duplicates.is_duplicate(channel):
+                            dropped += 1
+                            continue
+                        out_file.write(channel)
+                        written += 1
+
+                # Проверяем, является ли файл M3U плейлистом (содержит #EXTM3U)
+                if not header:
+                    print(f"Предупреждение: Файл {path} может не быть M3U плейлистом (отсутствует #EXTM3U в начале)")
+                stats[path] = (written, dropped, dead)
+                count('duplicates_dropped', dropped)
+
         print(f"Плейлисты успешно объединены и сохранены в {output_path}")
-    
+        for path in order:
+            written, dropped, dead = stats[path]
+            line = f"  {path}: добавлено {written} каналов, отброшено дубликатов: {dropped}"
+            if health_cache is not None:
+                line += f", недоступных: {dead}"
+            print(line)
+        return stats
+
     except Exception as e:
         print(f"Произошла ошибка: {str(e)}")
+        return None
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Объединяет два M3U плейлиста')
-    parser.add_argument('playlist1', help='Путь к первому плейлисту')
-    parser.add_argument('playlist2', help='Путь ко второму плейлисту')
+    parser = argparse.ArgumentParser(description='Объединяет несколько M3U плейлистов с удалением дубликатов')
+    parser.add_argument('playlists', nargs='+', help='Пути к плейлистам или URL http(s) (не меньше двух)')
     parser.add_argument('output', help='Путь для сохранения объединенного плейлиста')
-    
+    parser.add_argument('--dedup', default='url',
+                        help='Ключи дедупликации через запятую: url, tvg-id; none - сохранить все дубликаты (по умолчанию url)')
+    parser.add_argument('--prefer', metavar='PLAYLIST',
+                        help='Источник с приоритетом: его каналы записываются первыми и побеждают дубликаты')
+    parser.add_argument('--bloom', type=int, metavar='N',
+                        help='Фильтр Блума на N каналов вместо точного множества (экономит память на очень больших объёмах)')
+    parser.add_argument('--bloom-error', type=float, default=0.001,
+                        help='Доля ложных срабатываний фильтра Блума (по умолчанию 0.001)')
+    parser.add_argument('--health-cache', metavar='FILE',
+                        help='Файл кеша результатов проверки потоков (см. iptv_manager.py -c --health-cache)')
+    parser.add_argument('--drop-dead', action='store_true',
+                        help='Пропускать каналы, недоступные по кешу проверок (без обращения к сети)')
+    parser.add_argument('--health-max-age', type=float, metavar='HOURS',
+                        help='Для --drop-dead учитывать результаты не старше HOURS часов '
+                             '(по умолчанию - TTL по статусу, для недоступных 1 ч)')
+    add_stats_arguments(parser)
+
     args = parser.parse_args()
-    
-    merge_m3u_playlists(args.playlist1, args.playlist2, args.output)
\ No newline at end of file
+
+    if len(args.playlists) < 2:
+        parser.error('Укажите не меньше двух плейлистов')
+
+    dedup = () if args.dedup == 'none' else tuple(key.strip() for key in args.dedup.split(','))
+    unknown = [key for key in dedup if key not in DEDUP_KEYS]
+    if unknown:
+        parser.error(f"Неизвестные ключи дедупликации: {', '.join(unknown)}")
+
+    if args.drop_dead and not args.health_cache:
+        parser.error('Для --drop-dead укажите файл кеша проверок: --health-cache FILE')
+    if args.health_cache and not args.drop_dead:
+        parser.error('Кеш проверок используется только с --drop-dead: добавьте --drop-dead')
+    max_age = None if args.health_max_age is None else args.health_max_age * 3600
+
+    with instrument(args, 'merge_m3u'):
+        if args.drop_dead:
+            with ProbeCache(args.health_cache) as cache:
+                merge_m3u_playlists(args.playlists, args.output, dedup, args.bloom, args.bloom_error, args.prefer,
+                                    cache, max_age)
+        else:
+            merge_m3u_playlists(args.playlists, args.output, dedup, args.bloom, args.bloom_error, args.prefer)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Постоянный кеш результатов проверки потоков
+
+Результаты проверки (статус, задержка, время последней успешной проверки,
+отпечаток HLS манифеста) хранятся в SQLite по нормализованному URL.
+Запись считается свежей в течение TTL, который зависит от статуса,
+при превышении лимита записей вытесняются давно не использованные (LRU).
+База открывается в режиме WAL, поэтому её могут одновременно читать и
+обновлять несколько процессов.
+"""
+import sqlite3
+import time
+
+from m3u_parser import normalize_url
+from stream_check import STATUS_DEAD, STATUS_OK, STATUS_SKIPPED, ProbeResult
+
+# Время жизни результата в секундах по статусу
+DEFAULT_TTLS = {
+    STATUS_OK: 6 * 3600,
+    STATUS_DEAD: 3600,
+    STATUS_SKIPPED: 7 * 24 * 3600,
+}
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+# Ограничение SQLite на число параметров в одном запросе
+_BATCH = 500
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS probes (
+    url_key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    code INTEGER,
+    latency REAL,
+    detail TEXT,
+    fingerprint TEXT,
+    checked_at REAL NOT NULL,
+    last_ok REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS probes_accessed ON probes (accessed_at);
+'''
+
+
+class ProbeCache:
+    """Кеш результатов проверки URL с TTL по статусу и LRU вытеснением"""
+
+    def __init__(self, path, ttls=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _is_fresh(self, status, checked_at, now, max_age=None):
+        return now - checked_at < (self.ttls.get(status, 0) if max_age is None else max_age)
+
+    def lookup(self, urls, fresh_only=True, max_age=None):
+        """
+        Возвращает словарь URL -> ProbeResult для найденных в кеше URL
+
+        Args:
+            urls: Набор URL
+            fresh_only (bool): Возвращать только записи, у которых не истёк TTL
+            max_age (float): Предельный возраст записи в секундах вместо TTL по статусу
+        """
+        keys = {}
+        for url in urls:
+            keys.setdefault(normalize_url(url), []).append(url)
+        now = time.time()
+        results = {}
+        found = []
+        key_list = list(keys)
+        for i in range(0, len(key_list), _BATCH):
+            batch = key_list[i:i + _BATCH]
+            rows = self._db.execute(
+                'SELECT url_key, status, code, latency, detail, fingerprint, checked_at FROM probes '
+                f'WHERE url_key IN ({",".join("?" * len(batch))})', batch)
+            for url_key, status, code, latency, detail, fingerprint, checked_at in rows:
+                if fresh_only and not self._is_fresh(status, checked_at, now, max_age):
+                    continue
+                found.append(url_key)
+                for url in keys[url_key]:
+                    results[url] = ProbeResult(url, status, code, latency, detail or '', fingerprint)
+        self._touch(found, now)
+        return results
+
+    def stale(self, urls):
+        """URL, которых нет в кеше или у которых истёк TTL"""
+        fresh = self.lookup(urls)
+        return [url for url in dict.fromkeys(urls) if url not in fresh]
+
+    def dead_keys(self, urls, max_age=None):
+        """
+        Нормализованные URL из urls, свежая проверка которых была неуспешной
+
+        Запрашиваются только переданные URL; запись старше TTL статуса
+        (или max_age секунд) не учитывается.
+        """
+        results = self.lookup(urls, max_age=max_age)
+        return {normalize_url(url) for url, result in results.items() if result.status == STATUS_DEAD}
+
+    def last_ok(self, url):
+        """Время последней успешной проверки URL или None"""
+        row = self._db.execute('SELECT last_ok FROM probes WHERE url_key = ?', (normalize_url(url),)).fetchone()
+        return row[0] if row else None
+
+    def _touch(self, url_keys, now):
+        if not url_keys:
+            return
+        for i in range(0, len(url_keys), _BATCH):
+            batch = url_keys[i:i + _BATCH]
+            self._db.execute(
+                f'UPDATE probes SET accessed_at = ? WHERE url_key IN ({",".join("?" * len(batch))})',
+                [now, *batch])
+
+    def store(self, results):
+        """Сохраняет результаты проверки (итерируемый набор ProbeResult)"""
+        now = time.time()
+        rows = [(normalize_url(result.url), result.status, result.code, result.latency, result.detail,
+                 result.fingerprint, now, now if result.status == STATUS_OK else None, now)
+                for result in results]
+        if not rows:
+            return
+        # Время последней успешной проверки сохраняется, если новая проверка неуспешна
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            self._db.executemany(
+                'INSERT INTO probes (url_key, status, code, latency, detail, fingerprint, checked_at, last_ok, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (url_key) DO UPDATE SET status = excluded.status, code = excluded.code, '
+                'latency = excluded.latency, detail = excluded.detail, fingerprint = excluded.fingerprint, '
+                'checked_at = excluded.checked_at, last_ok = COALESCE(excluded.last_ok, probes.last_ok), '
+                'accessed_at = excluded.accessed_at', rows)
+            self._evict()
+            self._db.execute('COMMIT')
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+
+    def _evict(self):
+        # LRU: удаляем давно не использованные записи сверх лимита
+        count = self._db.execute('SELECT COUNT(*) FROM probes').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                'DELETE FROM probes WHERE url_key IN '
+                '(SELECT url_key FROM probes ORDER BY accessed_at LIMIT ?)', (excess,))
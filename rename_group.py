@@ -1,47 +1,62 @@
-import re
 import argparse
+import sys
+
+from m3u_parser import EXTINF, Extinf, is_snapshot, iter_channels, open_playlist
+from m3u_snapshot import Snapshot, save_playlist
+from m3u_stats import add_stats_arguments, count, instrument
+from m3u_writer import atomic_output
 
 def update_group_title(file_path, new_group_title):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-    
-    new_lines = []
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        if line.startswith('#EXTINF:'):
-            # Обрабатываем строку #EXTINF
-            extinf_line = line.strip()
-            channel_name = lines[i+1].strip() if i+1 < len(lines) else ''
-            
-            # Удаляем старый group-title если есть
-            extinf_line = re.sub(r'group-title=".*?"', '', extinf_line)
-            extinf_line = re.sub(r'\s+', ' ', extinf_line).strip()
-            
-            # Добавляем новый group-title перед запятой и названием
-            if ',' in extinf_line:
-                parts = extinf_line.split(',', 1)
-                extinf_line = f'{parts[0]} group-title="{new_group_title}",{parts[1]}'
-            else:
-                extinf_line = f'{extinf_line} group-title="{new_group_title}"'
-            
-            new_lines.append(extinf_line + '\n')
-            if channel_name:
-                new_lines.append(channel_name + '\n')
-                i += 1
-        else:
-            new_lines.append(line)
-        i += 1
-    
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.writelines(new_lines)
+    """
+    Устанавливает group-title всем каналам плейлиста
+
+    Текстовый плейлист (в том числе .gz и .zst) переписывается построчно:
+    меняются только строки #EXTINF, остальные строки сохраняются как есть.
+    Снимок .m3us записывается снимком через save_playlist, как в iptv_manager.
+    Запись потоковая: временный файл подменяет исходный только после успешной записи.
+
+    Returns:
+        int: Количество каналов
+    """
+    if is_snapshot(file_path):
+        with Snapshot(file_path) as snapshot:
+            channels = iter_channels(snapshot)
+            return save_playlist(file_path, (_with_group(channel, new_group_title) for channel in channels),
+                                 snapshot.header)
+
+    channel_count = 0
+    with open_playlist(file_path) as src, atomic_output(file_path) as dst:
+        for line in src:
+            if line.lstrip().startswith(EXTINF):
+                # Заменяем group-title на месте или дописываем его перед запятой и названием
+                info = Extinf(line.strip())
+                info.set('group-title', new_group_title)
+                line = f'{info}\n'
+                channel_count += 1
+            dst.write(line)
+    count('channels_parsed', channel_count)
+    count('channels_written', channel_count)
+    return channel_count
+
+def _with_group(channel, group_title):
+    channel.set_attr('group-title', group_title)
+    return channel
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Update group-title in M3U file')
     parser.add_argument('file', help='Path to the M3U file')
     parser.add_argument('group_title', help='New group-title value')
+    add_stats_arguments(parser)
     
     args = parser.parse_args()
     
-    update_group_title(args.file, args.group_title)
-    print(f"All channels have been updated with group-title='{args.group_title}'")
\ No newline at end of file
+    with instrument(args, 'rename_group'):
+        try:
+            update_group_title(args.file, args.group_title)
+        except FileNotFoundError:
+            print(f"Ошибка: Файл '{args.file}' не найден")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Ошибка при обработке файла: {e}")
+            sys.exit(1)
+        print(f"All channels have been updated with group-title='{args.group_title}'")
\ No newline at end of file
@@ -1,55 +1,174 @@
-import re
-from collections import defaultdict, OrderedDict
-
-def sort_m3u_playlist(input_file):
-    # Чтение файла
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read().splitlines()
-    
-    # Парсинг плейлиста
-    groups = OrderedDict()  # Сохраняет порядок групп
-    current_group = None
-    current_channel = []
-    
-    for line in content:
-        if line.startswith('#EXTM3U'):
-            continue  # Пропускаем заголовок
-        
-        if line.startswith('#EXTINF'):
-            # Извлекаем группу и название канала
-            group_match = re.search(r'group-title="([^"]+)"', line)
-            if group_match:
-                current_group = group_match.group(1)
-                if current_group not in groups:
-                    groups[current_group] = []
-            
-            channel_match = re.search(r',([^,]+)$', line)
-            if channel_match:
-                channel_name = channel_match.group(1).strip()
-                current_channel = [line, channel_name]
-        elif line and not line.startswith('#'):
-            if current_channel and current_group:
-                current_channel.append(line)
-                groups[current_group].append(current_channel)
-                current_channel = []
-    
-    # Сортировка каналов внутри групп
-    for group in groups:
-        groups[group].sort(key=lambda x: x[1].lower())  # Сортировка по названию канала
-    
-    # Сборка отсортированного плейлиста
-    output_lines = ['#EXTM3U']
-    for group, channels in groups.items():
-        for channel_info in channels:
-            output_lines.append(channel_info[0])  # EXTINF строка
-            output_lines.append(channel_info[2])  # URL
-    
-    # Запись результата
-    output_file = input_file.replace('.txt', '_sorted.txt')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(output_lines))
-    
+#!/usr/bin/env python3
+import argparse
+import heapq
+import locale
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from operator import itemgetter
+
+from m3u_parallel import has_url, read_channels_parallel
+from m3u_parser import COMPRESSION_SUFFIXES
+from m3u_stats import add_stats_arguments, instrument, stage
+from m3u_writer import write_playlist
+
+def collation_key(channel_name):
+    """Ключ сортировки названия: casefold, «ё» приравнивается к «е»"""
+    return channel_name.casefold().replace('ё', 'е')
+
+def locale_collation_key(channel_name):
+    """Ключ сортировки по правилам текущей локали (LC_COLLATE)"""
+    return locale.strxfrm(collation_key(channel_name))
+
+class _SpillFile:
+    """Временный файл с отсортированными участками групп"""
+
+    def __init__(self, tmp_dir):
+        self.file = tempfile.TemporaryFile(dir=tmp_dir)
+        self.segments = {}  # группа -> (смещение, количество записей)
+
+    def write_run(self, group, run):
+        self.segments[group] = (self.file.tell(), len(run))
+        for record in run:
+            pickle.dump(record, self.file, pickle.HIGHEST_PROTOCOL)
+
+    def read_run(self, group):
+        """Читает участок группы потоково, отдельным дескриптором"""
+        offset, count = self.segments[group]
+        with open(os.dup(self.file.fileno()), 'rb') as f:
+            f.seek(offset)
+            for _ in range(count):
+                yield pickle.load(f)
+
+def sort_channels(channels, key=collation_key, max_channels=None, tmp_dir=None):
+    """
+    Сортирует поток каналов по названию внутри групп, не трогая порядок групп
+
+    Args:
+        channels: Итерируемый набор объектов Channel
+        key: Функция ключа сортировки названия канала
+        max_channels (int): Ограничение памяти: если в памяти накопилось столько
+            каналов, отсортированные участки сбрасываются во временные файлы,
+            а в конце сливаются через heapq.merge
+        tmp_dir (str): Каталог для временных файлов
+
+    Yields:
+        Channel: Каналы в порядке групп, внутри группы - по названию
+    """
+    groups = OrderedDict()  # Сохраняет порядок групп: группа -> [(ключ, канал)]
+    spills = []
+    buffered = 0
+
+    def spill():
+        # Сортируем накопленные участки и сбрасываем их во временный файл
+        with stage('sort'):
+            spill_file = _SpillFile(tmp_dir)
+            for group, run in groups.items():
+                if run:
+                    run.sort(key=itemgetter(0))
+                    spill_file.write_run(group, run)
+                    run.clear()
+            spill_file.file.flush()
+            spills.append(spill_file)
+
+    try:
+        for channel in channels:
+            group = channel.group
+            if group not in groups:
+                groups[group] = []
+            # Ключ сортировки вычисляется один раз на канал
+            groups[group].append((key(channel.name), channel))
+            buffered += 1
+            if max_channels and buffered >= max_channels:
+                spill()
+                buffered = 0
+
+        for group, run in groups.items():
+            with stage('sort'):
+                run.sort(key=itemgetter(0))
+            runs = [spill_file.read_run(group) for spill_file in spills if group in spill_file.segments]
+            if runs:
+                # heapq.merge стабилен: при равных ключах раньше идут более ранние участки
+                runs.append(run)
+                run = heapq.merge(*runs, key=itemgetter(0))
+            for _, channel in run:
+                yield channel
+    finally:
+        for spill_file in spills:
+            spill_file.file.close()
+
+def sorted_output_name(input_file):
+    """Имя результата по умолчанию: x.m3u -> x_sorted.m3u, x.m3u.gz -> x_sorted.m3u.gz"""
+    # Суффикс сжатия отрезается до splitext и возвращается после _sorted
+    suffix = ''
+    for compression_suffix in COMPRESSION_SUFFIXES:
+        if input_file.lower().endswith(compression_suffix):
+            input_file, suffix = input_file[:-len(compression_suffix)], input_file[-len(compression_suffix):]
+            break
+    base, ext = os.path.splitext(input_file)
+    return f'{base}_sorted{ext}{suffix}'
+
+def sort_m3u_playlist(input_file, output_file=None, jobs=1, max_channels=None, key=collation_key, tmp_dir=None):
+    """
+    Сортирует каналы по названию внутри групп, не трогая порядок групп
+
+    Args:
+        input_file (str): Путь к входному файлу
+        output_file (str): Путь к выходному файлу (по умолчанию <имя>_sorted<расширение>)
+        jobs (int): Число процессов для разбора (0 - по числу ядер)
+        max_channels (int): Не более стольких каналов в памяти (см. sort_channels)
+        key: Функция ключа сортировки названия канала
+        tmp_dir (str): Каталог для временных файлов
+    """
+    if output_file is None:
+        output_file = sorted_output_name(input_file)
+
+    # Потоковый парсинг плейлиста (при jobs != 1 - в нескольких процессах),
+    # каналы без URL потока пропускаются
+    header = []
+    channels = read_channels_parallel(input_file, jobs, select=(has_url, ()), header=header)
+    ordered = sort_channels(channels, key, max_channels, tmp_dir)
+
+    # Запись результата: группы в исходном порядке, каналы внутри группы по названию.
+    # Заголовок #EXTM3U (url-tvg и т.п.) записывается вместе с первым каналом, когда вход уже прочитан
+    write_playlist(output_file, ordered, header)
+
     print(f"Плейлист успешно отсортирован. Результат сохранен в: {output_file}")
+    return output_file
+
+def main():
+    parser = argparse.ArgumentParser(description='Сортировка каналов по алфавиту внутри групп без изменения порядка групп')
+    parser.add_argument('input', help='Входной M3U файл')
+    parser.add_argument('output', nargs='?', help='Выходной M3U файл (по умолчанию <имя>_sorted<расширение>)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Число процессов для разбора больших файлов (0 - по числу ядер, по умолчанию 1)')
+    parser.add_argument('-m', '--max-channels', type=int, metavar='N',
+                        help='Сортировка с ограничением памяти: не более N каналов в памяти, '
+                             'остальное во временных файлах')
+    parser.add_argument('--tmp-dir', help='Каталог для временных файлов')
+    parser.add_argument('--locale', nargs='?', const='', metavar='LOCALE',
+                        help='Сортировать по правилам локали (например ru_RU.UTF-8; без значения - локаль окружения)')
+    add_stats_arguments(parser)
+
+    args = parser.parse_args()
+
+    key = collation_key
+    if args.locale is not None:
+        try:
+            locale.setlocale(locale.LC_COLLATE, args.locale)
+        except locale.Error as e:
+            print(f"Ошибка: Не удалось установить локаль '{args.locale}': {e}")
+            return
+        key = locale_collation_key
+
+    with instrument(args, 'sort_iptv'):
+        try:
+            sort_m3u_playlist(args.input, args.output, args.jobs, args.max_channels, key, args.tmp_dir)
+        except FileNotFoundError:
+            print(f"Ошибка: Файл {args.input} не найден")
+        except Exception as e:
+            print(f"Ошибка при сортировке плейлиста: {e}")
 
-# Запуск
-sort_m3u_playlist('online.m3u')
\ No newline at end of file
+if __name__ == "__main__":
+    main()
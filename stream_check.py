@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Асинхронная проверка доступности потоков плейлиста
+
+Каждый URL проверяется запросом HEAD (или коротким GET с Range, если
+сервер не поддерживает HEAD), для HLS манифестов дополнительно проверяется
+содержимое. Соединения переиспользуются (HTTP/1.1 keep-alive) в пуле по
+хостам, число одновременных запросов ограничено глобально и для каждого
+хоста, для хоста можно задать ограничение частоты запросов. Таймаут
+отсчитывается только после того, как запрос получил соединение хоста:
+он ограничивает подключение и каждое чтение ответа, а ожидание очереди
+хоста в него не входит. Тот же
+клиент HttpClient загружает удалённые плейлисты (m3u_remote): тело
+ответа при этом передаётся по частям, без накопления в памяти.
+"""
+import asyncio
+import hashlib
+import socket
+import ssl
+import time
+from collections import defaultdict
+from urllib.parse import urljoin, urlsplit
+
+HEALTH_ATTR = 'x-health'
+
+STATUS_OK = 'ok'
+STATUS_DEAD = 'dead'
+STATUS_SKIPPED = 'skipped'
+
+DEFAULT_CONCURRENCY = 200
+DEFAULT_PER_HOST = 8
+DEFAULT_TIMEOUT = 10.0
+
+USER_AGENT = 'IPTV_ToolBox stream_check'
+MAX_REDIRECTS = 5
+# Сколько байт тела ответа читать: для манифеста достаточно начала
+BODY_LIMIT = 64 * 1024
+RANGE_BYTES = 1024
+# Размер части тела при потоковой передаче (sink)
+STREAM_CHUNK = 256 * 1024
+
+_MANIFEST_SUFFIXES = ('.m3u8', '.m3u')
+_MANIFEST_TAGS = (b'#EXTINF', b'#EXT-X-STREAM-INF', b'#EXT-X-TARGETDURATION')
+_REDIRECT_CODES = frozenset((301, 302, 303, 307, 308))
+_NO_HEAD_CODES = frozenset((400, 403, 405, 501))
+
+
+class ProbeResult:
+    """Результат проверки URL"""
+    __slots__ = ('url', 'status', 'code', 'latency', 'detail', 'fingerprint')
+
+    def __init__(self, url, status, code=None, latency=None, detail='', fingerprint=None):
+        self.url = url
+        self.status = status
+        self.code = code
+        self.latency = latency
+        self.detail = detail
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return f'ProbeResult({self.url!r}, {self.status!r}, code={self.code!r}, detail={self.detail!r})'
+
+
+class _Response:
+    __slots__ = ('code', 'headers', 'body', 'reusable')
+
+    def __init__(self, code, headers, body, reusable):
+        self.code = code
+        self.headers = headers
+        self.body = body
+        self.reusable = reusable
+
+
+class _TimedReader:
+    """Чтение из StreamReader с таймаутом на каждую операцию"""
+    __slots__ = ('_reader', '_timeout')
+
+    def __init__(self, reader, timeout):
+        self._reader = reader
+        self._timeout = timeout
+
+    async def readline(self):
+        return await asyncio.wait_for(self._reader.readline(), self._timeout)
+
+    async def readexactly(self, size):
+        return await asyncio.wait_for(self._reader.readexactly(size), self._timeout)
+
+    async def read(self, size):
+        return await asyncio.wait_for(self._reader.read(size), self._timeout)
+
+
+class HttpClient:
+    """
+    Минимальный асинхронный HTTP/1.1 клиент с пулом keep-alive соединений,
+    ограничением числа соединений и частоты запросов на хост
+
+    timeout ограничивает подключение (вместе с DNS) и каждое чтение ответа;
+    время ожидания свободного соединения хоста в него не входит.
+    """
+
+    def __init__(self, per_host=DEFAULT_PER_HOST, rate=None, timeout=DEFAULT_TIMEOUT):
+        self.per_host = per_host
+        self.interval = 1.0 / rate if rate else 0.0
+        self.timeout = timeout
+        self._idle = defaultdict(list)
+        self._host_limits = {}
+        self._host_next = {}
+        self._addresses = {}
+        self._ssl = ssl.create_default_context()
+
+    def _host_limit(self, key):
+        limit = self._host_limits.get(key)
+        if limit is None:
+            limit = self._host_limits[key] = asyncio.Semaphore(self.per_host)
+        return limit
+
+    async def _throttle(self, key):
+        # Равномерное распределение запросов к хосту не чаще rate в секунду
+        if not self.interval:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._host_next.get(key, now))
+        self._host_next[key] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _resolve(self, host, port):
+        # DNS запрашивается один раз на хост, параллельные запросы ждут общий результат
+        future = self._addresses.get((host, port))
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._addresses[(host, port)] = loop.create_task(loop.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        infos = await future
+        return infos[0][4][0]
+
+    async def _connect(self, scheme, host, port):
+        address = await self._resolve(host, port)
+        if scheme == 'https':
+            return await asyncio.open_connection(address, port, ssl=self._ssl, server_hostname=host)
+        return await asyncio.open_connection(address, port)
+
+    async def request(self, method, url, headers=None, body_limit=BODY_LIMIT, sink=None):
+        """
+        Выполняет запрос и возвращает ответ с началом тела (не больше body_limit байт)
+
+        Если передан sink, для ответа 200 он вызывается с заголовками ответа
+        и возвращает функцию записи, в которую по частям передаётся всё тело
+        (в ответе тело тогда пустое).
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        host = parts.hostname
+        if scheme not in ('http', 'https') or not host:
+            raise ValueError(f"Неподдерживаемый URL: {url}")
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, host, port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        host_header = host if parts.port is None else f'{host}:{port}'
+        lines = [f'{method} {target} HTTP/1.1', f'Host: {host_header}', f'User-Agent: {USER_AGENT}',
+                 'Accept: */*', 'Connection: keep-alive']
+        for name, value in (headers or {}).items():
+            lines.append(f'{name}: {value}')
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', errors='replace')
+
+        async with self._host_limit(key):
+            await self._throttle(key)
+            while True:
+                idle = self._idle[key]
+                reused = bool(idle)
+                if reused:
+                    reader, writer = idle.pop()
+                else:
+                    reader, writer = await asyncio.wait_for(self._connect(scheme, host, port), self.timeout)
+                try:
+                    writer.write(request)
+                    await asyncio.wait_for(writer.drain(), self.timeout)
+                    timed_reader = reader if self.timeout is None else _TimedReader(reader, self.timeout)
+                    response = await _read_response(timed_reader, method, body_limit, sink)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        continue  # Сервер закрыл простаивающее соединение - пробуем новое
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if response.reusable:
+                    idle.append((reader, writer))
+                else:
+                    writer.close()
+                return response
+
+    async def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+async def _read_response(reader, method, body_limit, sink=None):
+    while True:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Соединение закрыто сервером")
+        version, _, rest = status_line.decode('latin-1').strip().partition(' ')
+        code = int(rest.split(' ', 1)[0])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Соединение закрыто сервером")
+            if line in (b'\r\n', b'\n'):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if code >= 200:
+            break  # Промежуточные ответы 1xx пропускаем
+
+    reusable = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+    if method == 'HEAD' or code in (204, 304):
+        return _Response(code, headers, b'', reusable)
+
+    if sink is not None and code == 200:
+        complete = await _stream_body(reader, headers, sink(headers))
+        return _Response(code, headers, b'', reusable and complete)
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        chunks = []
+        received = 0
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            if received + size > body_limit:
+                chunks.append(await reader.readexactly(body_limit - received))
+                return _Response(code, headers, b''.join(chunks), False)
+            chunks.append(await reader.readexactly(size))
+            received += size
+            await reader.readline()
+        return _Response(code, headers, b''.join(chunks), reusable)
+
+    length = headers.get('content-length')
+    if length is not None:
+        length = int(length)
+        if length <= body_limit:
+            return _Response(code, headers, await reader.readexactly(length), reusable)
+        return _Response(code, headers, await reader.readexactly(body_limit), False)
+
+    # Длина не указана: тело до закрытия соединения
+    return _Response(code, headers, await reader.read(body_limit), False)
+
+
+async def _stream_body(reader, headers, write):
+    """Передаёт тело ответа в write по частям; False, если тело шло до закрытия соединения"""
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return True
+            while size:
+                data = await reader.readexactly(min(size, STREAM_CHUNK))
+                write(data)
+                size -= len(data)
+            await reader.readline()
+
+    length = headers.get('content-length')
+    if length is not None:
+        remaining = int(length)
+        while remaining:
+            data = await reader.readexactly(min(remaining, STREAM_CHUNK))
+            write(data)
+            remaining -= len(data)
+        return True
+
+    while True:
+        data = await reader.read(STREAM_CHUNK)
+        if not data:
+            return False
+        write(data)
+
+
+def _is_manifest(url, content_type=''):
+    path = urlsplit(url).path.lower()
+    return path.endswith(_MANIFEST_SUFFIXES) or 'mpegurl' in content_type.lower()
+
+
+def check_manifest(body):
+    """Проверяет, что тело похоже на HLS манифест"""
+    text = body.lstrip(b'\xef\xbb\xbf \r\n\t')
+    return text.startswith(b'#EXTM3U') and any(tag in text for tag in _MANIFEST_TAGS)
+
+
+class StreamChecker:
+    """Проверяет доступность URL с глобальным ограничением параллельности"""
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, rate=None,
+                 timeout=DEFAULT_TIMEOUT, use_head=True):
+        self.concurrency = concurrency
+        self.use_head = use_head
+        self.timeout = timeout
+        self.client = HttpClient(per_host, rate, timeout)
+
+    async def _fetch(self, method, url, headers=None):
+        # Запрос с переходом по редиректам
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self.client.request(method, url, headers)
+            location = response.headers.get('location')
+            if response.code not in _REDIRECT_CODES or not location:
+                return response, url
+            url = urljoin(url, location)
+        raise ValueError("Слишком много перенаправлений")
+
+    async def _probe(self, url):
+        manifest = _is_manifest(url)
+        range_headers = {'Range': f'bytes=0-{RANGE_BYTES - 1}'}
+        if manifest or not self.use_head:
+            response, final_url = await self._fetch('GET', url, None if manifest else range_headers)
+        else:
+            response, final_url = await self._fetch('HEAD', url)
+            if response.code in _NO_HEAD_CODES:
+                response, final_url = await self._fetch('GET', url, range_headers)
+
+        if not 200 <= response.code < 300:
+            return STATUS_DEAD, response.code, f'HTTP {response.code}', None
+
+        content_type = response.headers.get('content-type', '')
+        if not manifest and _is_manifest(final_url, content_type):
+            manifest = True
+            if not response.body:
+                response, final_url = await self._fetch('GET', final_url)
+        if manifest:
+            if not check_manifest(response.body):
+                return STATUS_DEAD, response.code, 'некорректный HLS манифест', None
+            fingerprint = hashlib.blake2b(response.body, digest_size=16).hexdigest()
+            return STATUS_OK, response.code, '', fingerprint
+        return STATUS_OK, response.code, '', None
+
+    async def check(self, url):
+        """Проверяет один URL"""
+        scheme = urlsplit(url).scheme.lower()
+        if scheme not in ('http', 'https'):
+            return ProbeResult(url, STATUS_SKIPPED, detail=f'протокол {scheme or "?"} не проверяется')
+        start = time.monotonic()
+        try:
+            # Таймаут действует внутри HttpClient.request: ожидание очереди хоста не считается
+            status, code, detail, fingerprint = await self._probe(url)
+        except asyncio.TimeoutError:
+            return ProbeResult(url, STATUS_DEAD, latency=time.monotonic() - start, detail='таймаут')
+        except (OSError, ssl.SSLError, ValueError, asyncio.IncompleteReadError) as e:
+            return ProbeResult(url, STATUS_DEAD, latency=time.monotonic() - start, detail=str(e) or type(e).__name__)
+        return ProbeResult(url, status, code, time.monotonic() - start, detail, fingerprint)
+
+    async def check_all(self, urls, progress=None):
+        """Проверяет набор URL, возвращает словарь URL -> ProbeResult"""
+        results = {}
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def worker(url):
+            async with limit:
+                results[url] = await self.check(url)
+            if progress is not None:
+                progress(len(results))
+
+        try:
+            await asyncio.gather(*(worker(url) for url in dict.fromkeys(urls)))
+        finally:
+            await self.client.close()
+        return results
+
+
+def check_urls(urls, cache=None, **options):
+    """
+    Синхронная обёртка: проверяет URL и возвращает словарь URL -> ProbeResult
+
+    Если передан кеш (probe_cache.ProbeCache), свежие результаты берутся
+    из него, а по сети проверяются только отсутствующие и устаревшие URL.
+    """
+    urls = list(dict.fromkeys(urls))
+    results = cache.lookup(urls) if cache is not None else {}
+    stale = [url for url in urls if url not in results]
+    if stale:
+        probed = asyncio.run(StreamChecker(**options).check_all(stale))
+        if cache is not None:
+            cache.store(probed.values())
+        results.update(probed)
+    return results
+
+
+def apply_results(channels, results, action='remove'):
+    """
+    Применяет результаты проверки к каналам
+
+    Args:
+        channels (list): Список объектов Channel
+        results (dict): URL -> ProbeResult
+        action (str): 'remove' - удалить мёртвые каналы,
+            'annotate' - пометить их атрибутом x-health="dead"
+
+    Returns:
+        list: Новый список каналов
+    """
+    new_channels = []
+    for channel in channels:
+        result = results.get(channel.url)
+        dead = result is not None and result.status == STATUS_DEAD
+        if action == 'remove':
+            if not dead:
+                new_channels.append(channel)
+            continue
+        if dead:
+            channel.set_attr(HEALTH_ATTR, STATUS_DEAD)
+        elif result is not None and result.status == STATUS_OK and channel.get_attr(HEALTH_ATTR) is not None:
+            channel.set_attr(HEALTH_ATTR, None)
+        new_channels.append(channel)
+    return new_channels
+
+
+def summarize(results):
+    """Количество результатов по статусам"""
+    counts = defaultdict(int)
+    for result in results.values():
+        counts[result.status] += 1
+    return counts
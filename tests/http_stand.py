@@ -0,0 +1,66 @@
+"""Локальный HTTP сервер-заглушка для тестов сетевых утилит"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandServer:
+    """
+    HTTP/1.1 сервер в отдельном потоке
+
+    routes: путь (без query) -> функция(handler) -> (код, заголовки, тело).
+    Считает запросы и наибольшее число одновременно обрабатываемых запросов.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        stand = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                with stand._lock:
+                    stand.requests.append((self.command, self.path, dict(self.headers)))
+                    stand.active += 1
+                    stand.max_active = max(stand.max_active, stand.active)
+                try:
+                    route = stand.routes.get(self.path.split('?', 1)[0])
+                    if route is None:
+                        code, headers, body = 404, {}, b''
+                    else:
+                        code, headers, body = route(self)
+                finally:
+                    with stand._lock:
+                        stand.active -= 1
+                self.send_response(code)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD' and code not in (204, 304):
+                    self.wfile.write(body)
+
+            do_GET = do_HEAD = _handle
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,40 @@
+import unittest
+
+from bench_m3u import compare
+
+
+def result(seconds, low, high, rss_mb=30):
+    return {'seconds': seconds, 'seconds_min': low, 'seconds_max': high, 'max_rss_kb': int(rss_mb * 1024)}
+
+
+class CompareTest(unittest.TestCase):
+
+    def test_small_absolute_change_is_noise(self):
+        # +34% на операции в 50 мс меньше абсолютного порога
+        baseline = {'parse/5000': result(0.050, 0.045, 0.060)}
+        self.assertEqual(compare({'parse/5000': result(0.067, 0.061, 0.070)}, baseline), [])
+
+    def test_overlapping_runs_are_noise(self):
+        baseline = {'merge/5000': result(0.33, 0.28, 0.42)}
+        self.assertEqual(compare({'merge/5000': result(0.41, 0.39, 0.45)}, baseline), [])
+
+    def test_real_slowdown_is_reported(self):
+        baseline = {'sort/100000': result(1.00, 0.95, 1.05)}
+        regressions = compare({'sort/100000': result(1.50, 1.40, 1.60)}, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('+50%', regressions[0])
+
+    def test_memory_growth_needs_absolute_floor(self):
+        baseline = {'parse/5000': result(0.05, 0.05, 0.05, rss_mb=20)}
+        self.assertEqual(compare({'parse/5000': result(0.05, 0.05, 0.05, rss_mb=26)}, baseline), [])
+        regressions = compare({'parse/5000': result(0.05, 0.05, 0.05, rss_mb=40)}, baseline)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('память', regressions[0])
+
+    def test_old_baseline_without_ranges(self):
+        baseline = {'sort/100000': {'seconds': 1.0, 'max_rss_kb': 30720}}
+        self.assertEqual(len(compare({'sort/100000': result(1.5, 1.4, 1.6)}, baseline)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
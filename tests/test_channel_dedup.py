@@ -0,0 +1,87 @@
+import unittest
+
+from channel_dedup import TitleIndex, find_duplicate_clusters, keep_best, normalize_title, quality_rank
+from m3u_parser import Channel
+
+
+def channels_of(*titles):
+    return [Channel(f'#EXTINF:-1,{title}', url=f'http://a.example/{i}') for i, title in enumerate(titles)]
+
+
+def clusters_of(*titles):
+    channels = channels_of(*titles)
+    return [[channels[i].name for i in members] for members in find_duplicate_clusters(channels)]
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_variants_of_one_channel(self):
+        for title in ('Первый канал', 'Первый канал HD', 'Perviy kanal FHD', 'Pervyj kanal', 'ПЕРВЫЙ  КАНАЛ (4K)'):
+            self.assertEqual(normalize_title(title), 'pervi kanal', title)
+        self.assertEqual(normalize_title('Матч ТВ'), normalize_title('Match TV'))
+        self.assertEqual(normalize_title('Россия 1 HD 50fps'), 'rosia 1')
+
+    def test_short_names_are_not_over_normalized(self):
+        self.assertEqual(normalize_title('СТС'), 'sts')
+        self.assertEqual(normalize_title('STS HD'), 'sts')
+        self.assertEqual(normalize_title('СТС Love'), 'sts love')
+        # В длинных словах ts по-прежнему сводится к c
+        self.assertEqual(normalize_title('Царь'), normalize_title('Tsar'))
+        self.assertEqual(normalize_title('Детский'), normalize_title('Detskiy'))
+
+    def test_quality_rank(self):
+        self.assertEqual([quality_rank(title) for title in ('Канал', 'Канал SD', 'Канал HD', 'Канал FHD', 'Канал 4K')],
+                         [0, 1, 2, 3, 4])
+
+
+class ClusterTest(unittest.TestCase):
+
+    def test_first_channel_variants(self):
+        self.assertEqual(clusters_of('Первый канал', 'Первый канал HD', 'Perviy kanal FHD', 'Pervyj kanal', 'НТВ'),
+                         [['Первый канал', 'Первый канал HD', 'Perviy kanal FHD', 'Pervyj kanal']])
+
+    def test_numbers_keep_channels_apart(self):
+        self.assertEqual(clusters_of('Россия 1', 'Россия 2', 'Россия 1 HD'), [['Россия 1', 'Россия 1 HD']])
+
+    def test_transliterated_title(self):
+        self.assertEqual(clusters_of('Матч ТВ', 'Match TV', 'Матч! Футбол 1'), [['Матч ТВ', 'Match TV']])
+
+    def test_short_brand_names(self):
+        self.assertEqual(clusters_of('СТС', 'STS', 'СТС HD', 'SC'), [['СТС', 'STS', 'СТС HD']])
+
+    def test_fuzzy_match_and_exact_mode(self):
+        titles = ('Discovery Channel', 'Discovery Chanel HD', 'Discovery Science')
+        self.assertEqual(clusters_of(*titles), [['Discovery Channel', 'Discovery Chanel HD']])
+        channels = channels_of('Discovery Channel', 'Discovery Channel HD', 'Discovery Channnel')
+        self.assertEqual(find_duplicate_clusters(channels, fuzzy=False), [[0, 1, 2]])
+        self.assertEqual(find_duplicate_clusters(channels_of('Канал А', 'Канал Б'), fuzzy=False), [])
+
+
+class KeepBestTest(unittest.TestCase):
+
+    def test_best_channel_is_kept_in_place(self):
+        channels = channels_of('Первый канал', 'НТВ', 'Первый канал FHD', 'Первый канал HD', 'Perviy kanal FHD')
+        channels[4].set_attr('tvg-id', 'perviy')
+        kept = keep_best(channels, find_duplicate_clusters(channels))
+        # Выше качество, затем есть tvg-id, затем раньше в плейлисте
+        self.assertEqual([channel.name for channel in kept], ['НТВ', 'Perviy kanal FHD'])
+
+    def test_earlier_channel_wins_tie(self):
+        channels = channels_of('Россия 1', 'Россия 2', 'Россия 1')
+        self.assertEqual([channel.url for channel in keep_best(channels, find_duplicate_clusters(channels))],
+                         ['http://a.example/0', 'http://a.example/1'])
+
+
+class TitleIndexTest(unittest.TestCase):
+
+    def test_best_match(self):
+        index = TitleIndex()
+        for title in ('Первый канал', 'Россия 1', 'Россия 2'):
+            index.add(normalize_title(title))
+        self.assertEqual(index.best(normalize_title('Perviy kanal HD'))[0], 0)
+        self.assertEqual(index.best(normalize_title('Россия 2 HD'))[0], 2)
+        self.assertIsNone(index.best(normalize_title('Карусель')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import gzip
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from unittest import mock
+
+import epg_match
+from epg_match import EpgIndex, assign_epg, cache_path, iter_epg_channels, load_epg_channels
+from m3u_parser import Channel
+
+CHANNELS = (
+    '<channel id="first.ru"><display-name>Первый канал</display-name>'
+    '<display-name lang="en">Channel One</display-name></channel>'
+    '<channel id="russia1.ru"><display-name>Россия 1</display-name></channel>'
+    '<channel id="match.ru"><display-name> Матч! </display-name><display-name> </display-name></channel>'
+    '<channel id="empty.ru"><display-name></display-name></channel>'
+    '<channel id="discovery.ru"><display-name>Discovery Channel</display-name></channel>'
+)
+PROGRAMME = '<programme channel="first.ru" start="20260101000000 +0300"><title>Новости</title></programme>\n'
+
+
+def xmltv(channels=CHANNELS, programmes=1, tail='</tv>'):
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<tv>' + channels + PROGRAMME * programmes + tail
+
+
+def make_channel(title, tvg_id=None):
+    attrs = f' tvg-id="{tvg_id}"' if tvg_id else ''
+    return Channel(f'#EXTINF:-1{attrs},{title}', url='http://a.example/1')
+
+
+class EpgChannelsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.epg = self.path('epg.xml')
+        self.write(xmltv())
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def write(self, text, path=None):
+        with open(path or self.epg, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def test_channels_and_names(self):
+        self.assertEqual(list(iter_epg_channels(self.epg)),
+                         [('first.ru', ['Первый канал', 'Channel One']), ('russia1.ru', ['Россия 1']),
+                          ('match.ru', ['Матч!']), ('discovery.ru', ['Discovery Channel'])])
+        with gzip.open(self.path('epg.xml.gz'), 'wt', encoding='utf-8') as f:
+            f.write(xmltv())
+        self.assertEqual(list(iter_epg_channels(self.path('epg.xml.gz'))), list(iter_epg_channels(self.epg)))
+
+    def test_stops_at_first_programme(self):
+        # После передач канал и испорченный XML: при остановке на <programme> они не читаются
+        late = '<channel id="late.ru"><display-name>Поздний</display-name></channel>'
+        self.write(xmltv(programmes=1, tail=late + PROGRAMME * 2000 + '<broken'))
+        self.assertEqual([channel_id for channel_id, _ in iter_epg_channels(self.epg)],
+                         ['first.ru', 'russia1.ru', 'match.ru', 'discovery.ru'])
+        with self.assertRaises(ET.ParseError):
+            list(iter_epg_channels(self.epg, scan_all=True))
+        self.write(xmltv(programmes=1, tail=late + PROGRAMME + '</tv>'))
+        self.assertEqual(list(iter_epg_channels(self.epg, scan_all=True))[-1], ('late.ru', ['Поздний']))
+
+    def test_parsed_elements_are_cleared(self):
+        roots = []
+        sizes = []
+        iterparse = ET.iterparse
+
+        def recording_iterparse(source, events=None):
+            for event, element in iterparse(source, events):
+                if not roots:
+                    roots.append(element)
+                yield event, element
+                # Размер дерева после обработки события
+                sizes.append(len(roots[0]))
+
+        programmes = 2000
+        self.write(xmltv(programmes=programmes))
+        with mock.patch.object(ET, 'iterparse', recording_iterparse):
+            self.assertEqual(len(list(iter_epg_channels(self.epg, scan_all=True))), 4)
+        # Дерево растёт только в пределах прочитанного блока файла
+        self.assertLess(max(sizes), programmes // 4)
+        self.assertEqual(len(roots[0]), 0)
+
+    def test_cache_is_rebuilt_when_file_changes(self):
+        expected = load_epg_channels(self.epg)
+        self.assertTrue(os.path.exists(cache_path(self.epg)))
+        with mock.patch.object(epg_match, 'iter_epg_channels', side_effect=AssertionError('parsed')):
+            self.assertEqual(load_epg_channels(self.epg), expected)
+        # Другой размер
+        self.write(xmltv(CHANNELS.replace('Россия 1', 'Россия 24')))
+        self.assertEqual(load_epg_channels(self.epg)[1], ('russia1.ru', ['Россия 24']))
+        # Тот же размер, другое время изменения
+        stat = os.stat(self.epg)
+        self.write(xmltv(CHANNELS.replace('Россия 1', 'Россия 42')))
+        os.utime(self.epg, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(os.path.getsize(self.epg), stat.st_size)
+        self.assertEqual(load_epg_channels(self.epg)[1], ('russia1.ru', ['Россия 42']))
+        # Без кеша файл читается всегда, а файл-спутник не меняется
+        os.remove(cache_path(self.epg))
+        load_epg_channels(self.epg, use_cache=False)
+        self.assertFalse(os.path.exists(cache_path(self.epg)))
+
+
+class EpgIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = EpgIndex([('first.ru', ['Первый канал', 'Channel One']), ('russia1.ru', ['Россия 1']),
+                               ('other.ru', ['Первый канал HD']), ('nat.ru', ['National Geographic Channel'])])
+
+    def test_exact_match(self):
+        # Любое из display-name канала; при одинаковой нормализации побеждает первый канал EPG
+        self.assertEqual(self.index.match('Perviy kanal FHD'), ('first.ru', 'Первый канал', 1.0))
+        self.assertEqual(self.index.match('CHANNEL ONE HD'), ('first.ru', 'Channel One', 1.0))
+        self.assertEqual(self.index.match('Россия 1'), ('russia1.ru', 'Россия 1', 1.0))
+        self.assertIsNone(self.index.match('Россия 2'))
+        self.assertIsNone(self.index.match('HD'))
+
+    def test_fuzzy_match(self):
+        channel_id, name, score = self.index.match('National Geographic Chanal')
+        self.assertEqual((channel_id, name), ('nat.ru', 'National Geographic Channel'))
+        self.assertTrue(0.8 <= score < 1.0)
+        self.assertIsNone(self.index.match('National Geographic Chanal', fuzzy=False))
+        self.assertIsNone(self.index.match('National Geographic Chanal', threshold=0.9))
+
+
+class AssignEpgTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = EpgIndex([('first.ru', ['Первый канал']), ('nat.ru', ['National Geographic Channel'])])
+
+    def test_only_matched_channels_are_changed(self):
+        channels = [make_channel('Первый канал HD'), make_channel('National Geographic Chanal'),
+                    make_channel('Неизвестный'), make_channel('Первый канал', tvg_id='own.id')]
+        counts = {}
+        result = list(assign_epg(channels, self.index, counts=counts))
+        self.assertEqual([channel.extinf for channel in result], [
+            '#EXTINF:-1 tvg-id="first.ru" tvg-name="Первый канал",Первый канал HD',
+            '#EXTINF:-1 tvg-id="nat.ru" tvg-name="National Geographic Channel",National Geographic Chanal',
+            '#EXTINF:-1,Неизвестный',
+            '#EXTINF:-1 tvg-id="own.id",Первый канал',
+        ])
+        self.assertEqual(counts, {'exact': 1, 'fuzzy': 1, 'missing': 1, 'skipped': 1})
+
+    def test_overwrite_and_exact_only(self):
+        channels = [make_channel('Первый канал', tvg_id='own.id'), make_channel('National Geographic Chanal')]
+        counts = {}
+        result = list(assign_epg(channels, self.index, fuzzy=False, overwrite=True, counts=counts))
+        self.assertEqual(result[0].get_attr('tvg-id'), 'first.ru')
+        self.assertIsNone(result[1].get_attr('tvg-id'))
+        self.assertEqual(counts, {'exact': 1, 'fuzzy': 0, 'missing': 1, 'skipped': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
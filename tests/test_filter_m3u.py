@@ -0,0 +1,140 @@
+import functools
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+import filter_m3u
+import m3u_remote
+from filter_m3u import filter_m3u_by_extgrp_batch
+from gen_playlist import generate_playlist
+from m3u_parallel import read_channels_parallel
+from m3u_remote import RemoteCache
+from m3u_snapshot import build_snapshot
+from tests.http_stand import StandServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = (('Спорт', 'sport.m3u', 'Спорт'), ('Кино', 'movies.m3u', 'Фильмы'), ('Новости', 'news.m3u', 'Новости'))
+PLAYLIST = (
+    '#EXTM3U\n'
+    '#EXTINF:-1 group-title="Старая",Хоккей\n#EXTGRP:SPORT\nhttp://a.example/1\n'
+    '#EXTINF:-1,Боевик\n#EXTGRP:Movies\n#EXTVLCOPT:http-user-agent=UA\nhttp://a.example/2\n'
+    '#EXTINF:-1,Арена\n#EXTGRP:sport\nhttp://a.example/3\n'
+    '#EXTINF:-1,Мультфильм\n#EXTGRP:Cartoons\nhttp://a.example/4\n'
+    '#EXTINF:-1,Погода\n#EXTGRP:Прочее\nhttp://a.example/5\n'
+    '#EXTINF:-1,Без EXTGRP\nhttp://a.example/6\n'
+)
+SPORT = (
+    '#EXTM3U\n'
+    '#EXTINF:-1 group-title="Спорт",Арена\nhttp://a.example/3\n\n'
+    '#EXTINF:-1 group-title="Спорт",Хоккей\nhttp://a.example/1\n'
+)
+FILMS = (
+    '#EXTM3U\n'
+    '#EXTINF:-1 group-title="Фильмы",Боевик\n#EXTVLCOPT:http-user-agent=UA\nhttp://a.example/2\n\n'
+    '#EXTINF:-1 group-title="Детям",Мультфильм\nhttp://a.example/4\n'
+)
+
+
+class FilterRoutesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playlist = self.path('in.m3u')
+        with open(self.playlist, 'w', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+        self.routes = {'Sport': (self.path('sport.m3u'), 'Спорт'), 'movies': (self.path('films.m3u'), 'Фильмы'),
+                       'CARTOONS': (self.path('films.m3u'), 'Детям'), 'Новости': (self.path('news.m3u'), 'Новости')}
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def read(self, name):
+        with open(self.path(name), encoding='utf-8') as f:
+            return f.read()
+
+    def filter(self, input_file=None, **kwargs):
+        with redirect_stdout(StringIO()):
+            return filter_m3u_by_extgrp_batch(input_file or self.playlist, self.routes, **kwargs)
+
+    def test_routes(self):
+        counts = self.filter()
+        # Группы без маршрута и каналы без #EXTGRP: никуда не попадают, файл без каналов всё равно создаётся
+        self.assertEqual(counts, {self.path('sport.m3u'): 2, self.path('films.m3u'): 2, self.path('news.m3u'): 0})
+        self.assertEqual(self.read('sport.m3u'), SPORT)
+        self.assertEqual(self.read('films.m3u'), FILMS)
+        self.assertEqual(self.read('news.m3u'), '#EXTM3U\n')
+
+    def test_without_sort(self):
+        self.filter(sort_channels=False)
+        self.assertEqual(self.read('sport.m3u'),
+                         '#EXTM3U\n'
+                         '#EXTINF:-1 group-title="Спорт",Хоккей\nhttp://a.example/1\n\n'
+                         '#EXTINF:-1 group-title="Спорт",Арена\nhttp://a.example/3\n')
+
+    def test_snapshot_input(self):
+        build_snapshot(self.playlist, self.path('in.m3us'))
+        self.filter(self.path('in.m3us'))
+        self.assertEqual(self.read('sport.m3u'), SPORT)
+        self.assertEqual(self.read('films.m3u'), FILMS)
+
+    def test_cli_routes(self):
+        proc = subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'filter_m3u.py'), 'in.m3u', '-r', 'sport', 'sport.m3u', 'Спорт',
+             '-r', 'Movies', 'films.m3u', 'Фильмы', '-r', 'cartoons', 'films.m3u', 'Детям'],
+            cwd=self.tmp.name, capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertEqual(self.read('sport.m3u'), SPORT)
+        self.assertEqual(self.read('films.m3u'), FILMS)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['films.m3u', 'in.m3u', 'sport.m3u'])
+
+
+class FilterBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playlist = self.path('in.m3u')
+        generate_playlist(self.playlist, 3000, groups=8)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def run_batch(self, prefix, jobs, input_file=None):
+        routes = {extgrp: (self.path(prefix + output), title) for extgrp, output, title in ROUTES}
+        counts = filter_m3u_by_extgrp_batch(input_file or self.playlist, routes, jobs=jobs)
+        outputs = {}
+        for output, _ in routes.values():
+            with open(output, 'rb') as f:
+                outputs[os.path.basename(output)[len(prefix):]] = f.read()
+        return counts, outputs
+
+    def test_parallel_output_matches_serial(self):
+        _, serial = self.run_batch('serial-', jobs=1)
+        # Порог 0: файл делится на куски даже при небольшом размере
+        parallel_reader = functools.partial(read_channels_parallel, threshold=0)
+        with mock.patch.object(filter_m3u, 'read_channels_parallel', parallel_reader):
+            counts, parallel = self.run_batch('parallel-', jobs=2)
+        self.assertTrue(all(counts.values()))
+        self.assertEqual(parallel, serial)
+
+    def test_remote_input_is_requested_once(self):
+        with open(self.playlist, 'rb') as f:
+            body = f.read()
+        _, local = self.run_batch('local-', jobs=1)
+        cache = RemoteCache(self.path('cache'))
+        with StandServer({'/in.m3u': lambda handler: (200, {'Content-Type': 'audio/x-mpegurl'}, body)}) as server, \
+                mock.patch.object(m3u_remote, '_default_cache', cache):
+            _, remote = self.run_batch('remote-', jobs=2, input_file=server.base_url + '/in.m3u')
+            requests = len(server.requests)
+        self.assertEqual(requests, 1)
+        self.assertEqual(remote, local)
+
+
+if __name__ == '__main__':
+    unittest.main()
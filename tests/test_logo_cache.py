@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import logo_cache
+from logo_cache import STATUS_FAILED, STATUS_NEW, LogoCache, fetch_logos
+from tests.http_stand import StandServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def slow_logo(handler):
+    time.sleep(0.3)
+    return 200, {'Content-Type': 'image/png'}, handler.path.encode('ascii')
+
+
+class LogoCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_host_queue_does_not_count_toward_timeout(self):
+        cache = LogoCache(os.path.join(self.tmp.name, 'logos'))
+        with StandServer({'/logo.png': slow_logo}) as server, mock.patch.object(logo_cache, 'LOGO_TIMEOUT', 1.0):
+            urls = [f'{server.base_url}/logo.png?n={i}' for i in range(12)]
+            results = fetch_logos(urls, cache, per_host=2)
+        self.assertEqual([url for url, (status, _) in results.items() if status != STATUS_NEW], [])
+
+    def test_slow_logo_times_out(self):
+        def hang(handler):
+            time.sleep(1.5)
+            return 200, {'Content-Type': 'image/png'}, b'png'
+
+        cache = LogoCache(os.path.join(self.tmp.name, 'logos'))
+        with StandServer({'/hang.png': hang}) as server, mock.patch.object(logo_cache, 'LOGO_TIMEOUT', 0.5):
+            url = server.base_url + '/hang.png'
+            results = fetch_logos([url], cache)
+        self.assertEqual(results[url], (STATUS_FAILED, 'таймаут'))
+
+    def test_base_url_requires_separate_output(self):
+        playlist = os.path.join(self.tmp.name, 'in.m3u')
+        with open(playlist, 'w', encoding='utf-8') as f:
+            f.write('#EXTM3U\n#EXTINF:-1 tvg-logo="http://127.0.0.1:9/a.png",A\nhttp://a.example/1\n')
+        for extra in ([], ['-o', playlist]):
+            proc = subprocess.run(
+                [sys.executable, os.path.join(ROOT, 'logo_cache.py'), playlist, '--base-url', 'http://mirror/'] + extra,
+                cwd=self.tmp.name, capture_output=True, text=True)
+            self.assertEqual(proc.returncode, 2)
+        with open(playlist, encoding='utf-8') as f:
+            self.assertIn('http://127.0.0.1:9/a.png', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
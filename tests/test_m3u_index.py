@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import m3u_index
+from gen_playlist import generate_playlist
+from m3u_index import build_index, index_path, load_index
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLAYLIST = (
+    '#EXTM3U url-tvg="http://epg.example/epg.xml"\n'
+    '#EXTINF:-1 group-title="Новости",Первый\n#EXTGRP:Эфир\nhttp://a.example/1\n'
+    '#EXTINF:-1 group-title="Кино",Фильм\nhttp://a.example/2\n'
+    '#EXTINF:-1 group-title="Кино",Без URL\n'
+    '#EXTINF:-1,Без группы\nhttp://a.example/3\n'
+    '#EXTINF:-1 group-title="Новости",Второй\n#EXTVLCOPT:http-user-agent=UA\nhttp://a.example/4'
+)
+
+
+class PlaylistIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playlist = self.path('in.m3u')
+        self.write(PLAYLIST)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def write(self, text, path=None):
+        with open(path or self.playlist, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def read(self, path):
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def manager(self, *args):
+        proc = subprocess.run([sys.executable, os.path.join(ROOT, 'iptv_manager.py')] + list(args),
+                              cwd=self.tmp.name, capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stdout + proc.stderr)
+        return proc.stdout
+
+    def test_groups_and_counts(self):
+        index = build_index(self.playlist)
+        self.assertEqual(index.group_counts(), [('Новости', 2), ('Кино', 1), ('Без группы', 1)])
+        self.assertEqual(index.channel_count, 4)
+        self.assertFalse(index.tail_newline)
+
+    def test_write_groups_without_trailing_newline(self):
+        count = build_index(self.playlist).write_groups(self.path('out.m3u'), ['Без группы', 'Новости'])
+        self.assertEqual(count, 3)
+        self.assertEqual(self.read(self.path('out.m3u')),
+                         '#EXTM3U url-tvg="http://epg.example/epg.xml"\n'
+                         '#EXTINF:-1,Без группы\nhttp://a.example/3\n'
+                         '#EXTINF:-1 group-title="Новости",Первый\n#EXTGRP:Эфир\nhttp://a.example/1\n'
+                         '#EXTINF:-1 group-title="Новости",Второй\n#EXTVLCOPT:http-user-agent=UA\nhttp://a.example/4\n')
+
+    def test_fresh_index_is_reused(self):
+        load_index(self.playlist)
+        self.assertTrue(os.path.exists(index_path(self.playlist)))
+        with mock.patch.object(m3u_index, 'build_index', side_effect=AssertionError('rebuilt')), \
+                mock.patch.object(m3u_index, 'file_digest', side_effect=AssertionError('hashed')):
+            self.assertEqual(load_index(self.playlist).channel_count, 4)
+
+    def test_size_change_rebuilds(self):
+        load_index(self.playlist)
+        self.write(PLAYLIST + '\n#EXTINF:-1 group-title="Спорт",Мяч\nhttp://a.example/5\n')
+        self.assertEqual(list(load_index(self.playlist).groups), ['Новости', 'Кино', 'Без группы', 'Спорт'])
+
+    def test_same_size_uses_content_hash(self):
+        index = load_index(self.playlist)
+        # Только время изменения: индекс сохраняется, новое время записывается
+        os.utime(self.playlist, ns=(index.mtime_ns + 10**9, index.mtime_ns + 10**9))
+        with mock.patch.object(m3u_index, 'build_index', side_effect=AssertionError('rebuilt')):
+            self.assertEqual(load_index(self.playlist).mtime_ns, index.mtime_ns + 10**9)
+            self.assertEqual(load_index(self.playlist).mtime_ns, index.mtime_ns + 10**9)
+        # Тот же размер, но другое содержимое: индекс перестраивается
+        self.write(PLAYLIST.replace('group-title="Кино"', 'group-title="Спор"'))
+        os.utime(self.playlist, ns=(index.mtime_ns, index.mtime_ns))
+        self.assertEqual(os.path.getsize(self.playlist), index.size)
+        self.assertEqual(list(load_index(self.playlist).groups), ['Новости', 'Спор', 'Без группы'])
+
+    def test_manager_matches_no_index(self):
+        generate_playlist(self.playlist, 2000, groups=6)
+        args = [self.playlist, '-s', 'Спорт', 'Кино', '-r', 'Новости', 'Без группы']
+        self.manager(*args, '-o', self.path('indexed.m3u'))
+        self.assertTrue(os.path.exists(index_path(self.playlist)))
+        self.manager(*args, '-o', self.path('parsed.m3u'), '--no-index')
+        with open(self.path('indexed.m3u'), 'rb') as a, open(self.path('parsed.m3u'), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_manager_overwrites_input_in_place(self):
+        self.manager(self.playlist, '-l')
+        self.manager(self.playlist, '-s', 'Новости', 'Без группы')
+        expected = ('#EXTM3U url-tvg="http://epg.example/epg.xml"\n'
+                    '#EXTINF:-1,Без группы\nhttp://a.example/3\n'
+                    '#EXTINF:-1 group-title="Кино",Фильм\nhttp://a.example/2\n'
+                    '#EXTINF:-1 group-title="Новости",Первый\n#EXTGRP:Эфир\nhttp://a.example/1\n'
+                    '#EXTINF:-1 group-title="Новости",Второй\n#EXTVLCOPT:http-user-agent=UA\nhttp://a.example/4\n')
+        self.assertEqual(self.read(self.playlist), expected)
+        # Индекс перезаписанного файла перестраивается
+        self.assertEqual(list(load_index(self.playlist).groups), ['Без группы', 'Кино', 'Новости'])
+        self.manager(self.playlist, '-r', 'Кино')
+        self.assertEqual(self.read(self.playlist), expected.replace('#EXTINF:-1 group-title="Кино",Фильм\nhttp://a.example/2\n', ''))
+
+
+if __name__ == '__main__':
+    unittest.main()
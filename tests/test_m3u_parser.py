@@ -0,0 +1,179 @@
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+import m3u_stats
+from m3u_parser import Channel, Extinf, iter_channels, read_channels
+
+
+class IterChannelsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def read(self, data):
+        path = os.path.join(self.tmp.name, 'playlist.m3u')
+        with open(path, 'wb') as f:
+            f.write(data)
+        header = []
+        return list(read_channels(path, header)), header
+
+    def test_blank_and_stray_lines(self):
+        stats = m3u_stats.Stats('test')
+        with mock.patch.object(m3u_stats, 'current', stats):
+            channels, header = self.read(
+                b'stray-before-header\n#EXTM3U\n\n   \nhttp://orphan.example/0\n#COMMENT\n'
+                b'#EXTINF:-1,A\n\nhttp://a.example/1\nhttp://a.example/extra\n\n'
+                b'#EXTINF:-1,B\nhttp://b.example/2\n')
+        self.assertEqual(header, ['#EXTM3U'])
+        self.assertEqual([(channel.name, channel.url) for channel in channels],
+                         [('A', 'http://a.example/1'), ('B', 'http://b.example/2')])
+        # Строки без канала и лишний URL учитываются как некорректные
+        self.assertEqual(stats.counters['malformed_lines'], 3)
+
+    def test_crlf_and_bom(self):
+        channels, header = self.read(
+            '\ufeff#EXTM3U url-tvg="http://epg.example/e.xml"\r\n'
+            '#EXTINF:-1 group-title="Кино",Фильм\r\n#EXTGRP:Кино\r\nhttp://a.example/1\r\n'.encode('utf-8'))
+        self.assertEqual(header, ['#EXTM3U url-tvg="http://epg.example/e.xml"'])
+        channel, = channels
+        self.assertEqual((channel.name, channel.group, channel.extgrp, channel.url),
+                         ('Фильм', 'Кино', 'Кино', 'http://a.example/1'))
+        self.assertEqual(channel.to_m3u(), '#EXTINF:-1 group-title="Кино",Фильм\n#EXTGRP:Кино\nhttp://a.example/1\n')
+
+    def test_missing_url(self):
+        channels, _ = self.read(b'#EXTM3U\n#EXTINF:-1,No URL\n#EXTINF:-1,Next\nhttp://a.example/1\n#EXTINF:-1,Last\n')
+        self.assertEqual([(channel.name, channel.url) for channel in channels],
+                         [('No URL', None), ('Next', 'http://a.example/1'), ('Last', None)])
+        self.assertEqual(channels[0].lines(), ['#EXTINF:-1,No URL'])
+
+    def test_extgrp_and_directives(self):
+        channels, _ = self.read(
+            b'#EXTM3U\n#EXTINF:-1,A\n#EXTGRP:  News  \n#EXTVLCOPT:http-user-agent=UA\n'
+            b'#EXTVLCOPT:http-referrer=http://r.example/\n#KODIPROP:inputstream=x\nhttp://a.example/1\n'
+            b'#EXTINF:-1,B\n#EXTGRP:\nhttp://b.example/2\n')
+        first, second = channels
+        self.assertEqual(first.extgrp, 'News')
+        self.assertEqual(first.directives,
+                         ['#EXTVLCOPT:http-user-agent=UA', '#EXTVLCOPT:http-referrer=http://r.example/',
+                          '#KODIPROP:inputstream=x'])
+        self.assertEqual(first.lines(keep_extgrp=False)[1:], first.directives + ['http://a.example/1'])
+        self.assertEqual(second.extgrp, '')
+        self.assertIsNone(second.directives)
+        self.assertEqual(second.to_m3u(), '#EXTINF:-1,B\n#EXTGRP:\nhttp://b.example/2\n')
+
+    def test_iter_channels_accepts_lines(self):
+        channels = list(iter_channels(['#EXTM3U\n', '#EXTINF:-1 tvg-id="x",X\n', 'http://x.example/\n']))
+        self.assertEqual(channels[0].get_attr('tvg-id'), 'x')
+        self.assertEqual(channels[0].group, 'Без группы')
+
+
+class ChannelTest(unittest.TestCase):
+
+    def test_copy_is_independent(self):
+        channel = Channel('#EXTINF:-1 group-title="A",X', 'A', ['#EXTVLCOPT:a=b'], 'http://x.example/')
+        copy = channel.copy()
+        copy.set_attr('group-title', 'B')
+        copy.add_directive('#EXTVLCOPT:c=d')
+        self.assertEqual(channel.extinf, '#EXTINF:-1 group-title="A",X')
+        self.assertEqual(channel.directives, ['#EXTVLCOPT:a=b'])
+        self.assertEqual(copy.extinf, '#EXTINF:-1 group-title="B",X')
+
+    def test_pickle_keeps_changes(self):
+        channel = Channel('#EXTINF:-1,X', url='http://x.example/')
+        channel.set_attr('tvg-id', 'x')
+        restored = pickle.loads(pickle.dumps(channel))
+        self.assertEqual(restored.to_m3u(), channel.to_m3u())
+        self.assertEqual(restored.get_attr('tvg-id'), 'x')
+
+
+class ExtinfTest(unittest.TestCase):
+
+    def test_comma_inside_quoted_value(self):
+        info = Extinf('#EXTINF:-1 tvg-name="Первый, HD" group-title="Эфир",Первый HD')
+        self.assertEqual(info.attrs, {'tvg-name': 'Первый, HD', 'group-title': 'Эфир'})
+        self.assertEqual(info.title, 'Первый HD')
+
+    def test_comma_in_title(self):
+        info = Extinf('#EXTINF:-1 tvg-id="a",Новости, спорт, погода')
+        self.assertEqual(info.title, 'Новости, спорт, погода')
+        self.assertEqual(info.duration, '-1')
+
+    def test_unquoted_and_empty_values(self):
+        info = Extinf('#EXTINF:0 tvg-id=abc tvg-shift=-2 catchup="" tvg-logo= flag,Канал')
+        self.assertEqual(info.attrs, {'tvg-id': 'abc', 'tvg-shift': '-2', 'catchup': '', 'tvg-logo': '', 'flag': ''})
+        self.assertEqual(info.duration, '0')
+        self.assertEqual(info.title, 'Канал')
+
+    def test_no_attributes_and_no_title(self):
+        info = Extinf('#EXTINF:-1,')
+        self.assertEqual((info.attrs, info.title), ({}, ''))
+        info = Extinf('#EXTINF:-1 tvg-id="a"')
+        self.assertEqual((info.attrs, info.title), ({'tvg-id': 'a'}, ''))
+
+    def test_unchanged_line_is_returned_as_is(self):
+        raw = '#EXTINF:-1  tvg-id=abc   group-title="A",X'
+        info = Extinf(raw)
+        info.get('tvg-id')
+        self.assertIs(str(info), raw)
+
+    def test_set_rewrites_only_changed_attributes(self):
+        info = Extinf('#EXTINF:-1 tvg-id=abc group-title="Старая, группа" tvg-logo="l.png",Канал, HD')
+        info.set('group-title', 'Новая')
+        info.set('tvg-logo', None)
+        info.set('tvg-name', 'Канал')
+        self.assertEqual(str(info), '#EXTINF:-1 tvg-id=abc group-title="Новая" tvg-name="Канал",Канал, HD')
+        self.assertEqual(info.attrs, {'tvg-id': 'abc', 'group-title': 'Новая', 'tvg-name': 'Канал'})
+        reparsed = Extinf(str(info))
+        self.assertEqual((reparsed.attrs, reparsed.title), (info.attrs, 'Канал, HD'))
+
+    def test_set_without_attributes(self):
+        info = Extinf('#EXTINF:-1,Канал')
+        info.set('group-title', 'Кино')
+        self.assertEqual(str(info), '#EXTINF:-1 group-title="Кино",Канал')
+        self.assertEqual(info.get('group-title'), 'Кино')
+        info.set('group-title', None)
+        self.assertEqual(str(info), '#EXTINF:-1,Канал')
+        self.assertIsNone(info.get('group-title'))
+
+    def test_attribute_right_after_duration(self):
+        info = Extinf('#EXTINF:-1group-title="a",N')
+        self.assertEqual((info.duration, info.attrs, info.title), ('-1', {'group-title': 'a'}, 'N'))
+        info.set('group-title', 'b')
+        self.assertEqual(str(info), '#EXTINF:-1 group-title="b",N')
+        self.assertEqual(Extinf('#EXTINF:10.5tvg-id=x,N').duration, '10.5')
+        # Нечисловая длительность не поглощает атрибуты
+        self.assertEqual(Extinf('#EXTINF:abc tvg-id=x,N').attrs, {'abc': '', 'tvg-id': 'x'})
+
+    def test_set_without_comma(self):
+        info = Extinf('#EXTINF:-1 tvg-id="a"')
+        info.set('group-title', 'Кино')
+        self.assertEqual(str(info), '#EXTINF:-1 tvg-id="a" group-title="Кино",')
+        reparsed = Extinf(str(info))
+        self.assertEqual((reparsed.attrs, reparsed.title), ({'tvg-id': 'a', 'group-title': 'Кино'}, ''))
+        info = Extinf('#EXTINF:-1')
+        info.set('group-title', 'Кино')
+        self.assertEqual(str(info), '#EXTINF:-1 group-title="Кино",')
+        channel = Channel('#EXTINF:-1 tvg-id="a"', url='http://a.example/')
+        channel.set_attr('group-title', 'Кино')
+        self.assertEqual(channel.to_m3u(), '#EXTINF:-1 tvg-id="a" group-title="Кино",\nhttp://a.example/\n')
+
+    def test_duplicate_group_title(self):
+        raw = '#EXTINF:-1 group-title="A" tvg-id="1" group-title="B",X'
+        info = Extinf(raw)
+        # Действует первое значение, строка без изменений записывается как есть
+        self.assertEqual(info.get('group-title'), 'A')
+        self.assertEqual(str(info), raw)
+        # При изменении повторы атрибута сворачиваются в один
+        info.set('group-title', 'C')
+        self.assertEqual(str(info), '#EXTINF:-1 group-title="C" tvg-id="1",X')
+        channel = Channel(raw)
+        channel.set_attr('group-title', 'D')
+        self.assertEqual(channel.extinf, '#EXTINF:-1 group-title="D" tvg-id="1",X')
+
+
+if __name__ == '__main__':
+    unittest.main()
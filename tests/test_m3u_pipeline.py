@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from iptv_manager import remove_groups
+from m3u_parser import read_channels
+from m3u_pipeline import PipelineError, load_spec, parse_stages, remove_stage, run_pipeline
+
+A = (
+    '#EXTM3U url-tvg="http://epg.example/a.xml"\n'
+    '#EXTINF:-1 group-title="Кино",Щит\n#EXTGRP:Movies\nhttp://a.example/1\n'
+    '#EXTINF:-1 group-title="Новости",Ёж\n#EXTGRP:News\nhttp://a.example/2\n'
+    '#EXTINF:-1 group-title="Спорт",Мяч\n#EXTGRP:Sport\nhttp://a.example/3\n'
+    '#EXTINF:-1 group-title="Кино",Ангел\n#EXTGRP:movies\nhttp://a.example/4\n'
+    '#EXTINF:-1 group-title="Кино",Без URL\n#EXTGRP:Movies\n'
+)
+B = (
+    '#EXTM3U url-tvg="http://epg.example/b.xml"\n'
+    '#EXTINF:-1 group-title="Спорт",Гол\n#EXTGRP:Sport\nhttp://a.example/5\n'
+    '#EXTINF:-1 group-title="Кино",Щит копия\n#EXTGRP:Movies\nhttp://a.example/1\n'
+    '#EXTINF:-1 group-title="Музыка",Песня\n#EXTGRP:Music\nhttp://a.example/6\n'
+)
+SPEC = {
+    'inputs': ['a.m3u', 'b.m3u'],
+    'output': 'out.m3u',
+    'stages': [
+        {'merge': {'dedup': ['url'], 'prefer': 'b.m3u'}},
+        {'filter': ['sport', 'MOVIES']},
+        {'swap': ['Спорт', 'Кино']},
+        'sort',
+    ],
+}
+YAML_SPEC = '''\
+inputs: [a.m3u, b.m3u]
+output: out.m3u
+stages:
+  - merge: {dedup: [url], prefer: b.m3u}
+  - filter: [sport, MOVIES]
+  - swap: [Спорт, Кино]
+  - sort
+'''
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        for name, text in (('a.m3u', A), ('b.m3u', B)):
+            with open(self.path(name), 'w', encoding='utf-8') as f:
+                f.write(text)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def run_spec(self, spec):
+        inputs = [self.path(name) for name in spec['inputs']]
+        stages = parse_stages(spec['stages'])
+        for name, _, params in stages:
+            if name == 'merge':
+                params['prefer'] = self.path(params['prefer'])
+        with redirect_stdout(StringIO()) as out:
+            count = run_pipeline(inputs, self.path(spec['output']), stages)
+        with open(self.path(spec['output']), encoding='utf-8') as f:
+            return count, f.read(), out.getvalue()
+
+    def test_json_and_yaml_specs(self):
+        with open(self.path('spec.json'), 'w', encoding='utf-8') as f:
+            json.dump(SPEC, f, ensure_ascii=False)
+        with open(self.path('spec.yaml'), 'w', encoding='utf-8') as f:
+            f.write(YAML_SPEC)
+        self.assertEqual(load_spec(self.path('spec.json')), SPEC)
+        self.assertEqual(load_spec(self.path('spec.yaml')), SPEC)
+        with open(self.path('list.json'), 'w', encoding='utf-8') as f:
+            json.dump(SPEC['stages'], f)
+        with self.assertRaisesRegex(PipelineError, 'должно быть словарём'):
+            load_spec(self.path('list.json'))
+
+    def test_stage_order_and_output(self):
+        count, text, out = self.run_spec(SPEC)
+        self.assertEqual(count, 4)
+        # Заголовок и дубликат URL - из предпочтительного источника, группы переставлены, каналы отсортированы
+        self.assertEqual(text,
+                         '#EXTM3U url-tvg="http://epg.example/b.xml"\n'
+                         '#EXTINF:-1 group-title="Кино",Ангел\n#EXTGRP:movies\nhttp://a.example/4\n'
+                         '#EXTINF:-1 group-title="Кино",Щит копия\n#EXTGRP:Movies\nhttp://a.example/1\n'
+                         '#EXTINF:-1 group-title="Спорт",Гол\n#EXTGRP:Sport\nhttp://a.example/5\n'
+                         '#EXTINF:-1 group-title="Спорт",Мяч\n#EXTGRP:Sport\nhttp://a.example/3\n')
+        self.assertIn('merge: отброшено дубликатов: 1', out)
+
+    def test_filter_keeps_group_title(self):
+        spec = dict(SPEC, stages=[{'filter': {'extgrp': ['sport', 'movies'], 'group-title': 'Разное'}},
+                                  {'query': 'not title ~ "^щ"'}, {'remove': 'Нет такой'}])
+        _, text, out = self.run_spec(spec)
+        self.assertEqual(text.count('group-title="Разное"'), 3)
+        self.assertNotIn('Щит', text)
+        self.assertNotIn('#EXTGRP:', text)
+        self.assertIn('Следующие группы не найдены: Нет такой', out)
+
+    def test_parse_stages_errors(self):
+        cases = [
+            ([{'shuffle': None}], "Неизвестная стадия 'shuffle'"),
+            (['merge', {'sort': None, 'dedup': 0.8}], 'Некорректное описание стадии'),
+            ([42], 'Некорректное описание стадии'),
+            ([{'merge': {'dedup': ['url', 'name']}}], 'Неизвестные ключи дедупликации: name'),
+            ([{'swap': ['Кино']}], "Некорректные параметры стадии 'swap'"),
+            ([{'sort': 'быстро'}], "Некорректные параметры стадии 'sort'"),
+            ([{'keep': {'group': 'Кино'}}], "Некорректные параметры стадии 'keep'"),
+            ([{'query': 'title ='}], "Некорректный запрос 'title ='"),
+        ]
+        for stages, message in cases:
+            with self.subTest(stages=stages), self.assertRaises(PipelineError) as raised:
+                parse_stages(stages)
+            self.assertIn(message, str(raised.exception))
+        self.assertEqual([name for name, _, _ in parse_stages(['sort', {'dedup': 0.9}, {'merge': []}])],
+                         ['sort', 'dedup', 'merge'])
+
+    def test_remove_matches_iptv_manager(self):
+        channels = list(read_channels(self.path('a.m3u'))) + list(read_channels(self.path('b.m3u')))
+        for channel, group in zip(channels, ('Кино', ' Кино ', 'кино', 'Кино HD')):
+            channel.set_attr('group-title', group)
+        groups = ['Кино', 'Музыка', 'Нет такой']
+        with redirect_stdout(StringIO()) as manager_out:
+            expected = remove_groups([channel.copy() for channel in channels], groups)
+        with redirect_stdout(StringIO()) as stage_out:
+            result = list(remove_stage(groups)(channel.copy() for channel in channels))
+        self.assertEqual(sorted(channel.to_m3u() for channel in result),
+                         sorted(channel.to_m3u() for channel in expected))
+        self.assertEqual(stage_out.getvalue(), manager_out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+
+from m3u_parser import Channel
+from m3u_query import ChannelIndex, QueryError, Router, _tokenize, any_of, compile_query, transform
+
+
+def make_channels():
+    return [
+        Channel('#EXTINF:-1 tvg-id="ru.first" group-title="Эфир",Первый канал HD', 'Эфир', url='http://cdn.example.com/1'),
+        Channel('#EXTINF:-1 tvg-id="ru.sport" group-title="Спорт",Матч ТВ', 'Спорт', url='http://CDN.example.com/2'),
+        Channel('#EXTINF:-1 tvg-id="kz.news" group-title="спорт" catchup-days="3",Спорт Test', 'спорт',
+                url='http://other.example/3'),
+        Channel('#EXTINF:-1 group-title="Кино HD",Фильм', url='http://other.example/4'),
+        Channel('#EXTINF:-1,Без группы'),
+    ]
+
+
+class ParserTest(unittest.TestCase):
+
+    def test_tokens(self):
+        self.assertEqual(_tokenize('title==x and(group ^ "a b")'),
+                         [('word', 'title'), ('op', '=='), ('word', 'x'), ('and', 'and'), ('(', '('),
+                          ('word', 'group'), ('op', '^'), ('value', 'a b'), (')', ')')])
+        self.assertEqual(_tokenize('NOT a != b OR c ~ d'),
+                         [('not', 'NOT'), ('word', 'a'), ('op', '!='), ('word', 'b'), ('or', 'OR'),
+                          ('word', 'c'), ('op', '~'), ('word', 'd')])
+
+    def test_precedence(self):
+        self.assertEqual(repr(compile_query('a = 1 or b = 2 and not c = 3')),
+                         '(a = "1" or (b = "2" and not c = "3"))')
+        self.assertEqual(repr(compile_query('not (a = 1 or b) and c')), '(not (a = "1" or b) and c)')
+        self.assertEqual(repr(compile_query('not not a')), 'not not a')
+
+    def test_quoting_and_escapes(self):
+        query = compile_query(r'title == "Кино \"HD\" (1) \\ = ~"')
+        self.assertEqual(query.value, 'Кино "HD" (1) \\ = ~')
+        self.assertEqual(compile_query(repr(query)).value, query.value)
+        self.assertEqual(compile_query('title = ""').value, '')
+
+    def test_errors(self):
+        cases = {
+            '': 'Пустой запрос',
+            '   ': 'Пустой запрос',
+            'title ! x': "Неожиданный символ в запросе на позиции 7: '! x'",
+            'title = "abc': 'Неожиданный символ',
+            '(title = a': 'Не закрыта скобка',
+            'title =': "Ожидалось значение после 'title ='",
+            'title = = a': "Ожидалось значение после 'title ='",
+            'title = a )': "Лишний элемент в запросе: ')'",
+            'title = a b': "Лишний элемент в запросе: 'b'",
+            'and title': "Ожидалось имя поля, а не 'and'",
+            'title = a or': 'Ожидалось имя поля в конце запроса',
+            'title ~ "("': "Неверное регулярное выражение '('",
+        }
+        for text, message in cases.items():
+            with self.subTest(text=text), self.assertRaises(QueryError) as raised:
+                compile_query(text)
+            self.assertIn(message, str(raised.exception))
+
+
+class MatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.channels = make_channels()
+
+    def names(self, text):
+        query = compile_query(text)
+        return [channel.name for channel in self.channels if query.matches(channel)]
+
+    def test_operators_and_fields(self):
+        self.assertEqual(self.names('group = СПОРТ'), ['Матч ТВ', 'Спорт Test'])
+        self.assertEqual(self.names('group == Спорт'), ['Матч ТВ'])
+        self.assertEqual(self.names('tvg-id != ru.sport'), ['Первый канал HD', 'Спорт Test', 'Фильм', 'Без группы'])
+        self.assertEqual(self.names('title ~ "hd$|test"'), ['Первый канал HD', 'Спорт Test'])
+        self.assertEqual(self.names('tvg-id ^ RU.'), ['Первый канал HD', 'Матч ТВ'])
+        self.assertEqual(self.names('host = cdn.example.com'), ['Первый канал HD', 'Матч ТВ'])
+        self.assertEqual(self.names('catchup or not url'), ['Спорт Test', 'Без группы'])
+        self.assertEqual(self.names('group = "Без группы" or group ^ кино and not extgrp'), ['Фильм', 'Без группы'])
+
+
+class ChannelIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.channels = make_channels()
+        self.index = ChannelIndex(self.channels)
+
+    def assertSameAsScan(self, text):
+        query = compile_query(text)
+        expected = [channel for channel in self.channels if query.matches(channel)]
+        self.assertEqual(self.index.select(query), expected, text)
+
+    def test_lookups(self):
+        self.assertEqual(self.index.equal('group', 'спорт'), {1, 2})
+        self.assertEqual(self.index.exact('group', 'спорт'), {2})
+        self.assertEqual(self.index.exact('group', 'Спорт'), {1})
+        self.assertEqual(self.index.prefix('tvg-id', 'ru.'), {0, 1})
+        self.assertEqual(self.index.prefix('group', 'кино'), {3})
+        self.assertEqual(self.index.prefix('group', 'я'), set())
+        self.assertEqual(self.index.where('title', lambda value: 'т' in value.lower()), {1, 2})
+        self.assertEqual(self.index.distinct('extgrp'), ['Эфир', 'Спорт', 'спорт'])
+        self.assertEqual(self.index.positions('tvg-id', None), [3, 4])
+
+    def test_any_of(self):
+        self.assertEqual(self.index.find(any_of('group', ['спорт', 'кино hd'])), {1, 2, 3})
+        self.assertEqual(self.index.find(any_of('group', 'спорт', exact=True)), {2})
+        self.assertEqual(self.index.find(any_of('group', ['Спорт', 'Эфир'], exact=True)), {0, 1})
+
+    def test_queries_match_scan(self):
+        for text in ('group = спорт', 'group == Спорт', 'tvg-id != ru.sport', 'tvg-id ^ ru', 'title ~ "^с"',
+                     'catchup', 'not url', 'host = cdn.example.com and not title ~ hd',
+                     '(group = эфир or group = спорт) and tvg-id ^ ru', 'group = нет and title'):
+            self.assertSameAsScan(text)
+
+    def test_invalidate_after_change(self):
+        self.assertEqual(self.index.find('group = кино'), set())
+        self.assertEqual(self.index.find('tvg-id ^ kz'), {2})
+        self.channels[0].set_attr('group-title', 'Кино')
+        self.channels[2].set_attr('tvg-id', 'ru.news')
+        # Без сброса индексы возвращают прежний результат
+        self.assertEqual(self.index.find('group = кино'), set())
+        self.index.invalidate()
+        self.assertEqual(self.index.find('group = кино'), {0})
+        self.assertEqual(self.index.find('tvg-id ^ kz'), set())
+        self.assertEqual(self.index.find('tvg-id ^ ru'), {0, 1, 2})
+
+
+class RouterTest(unittest.TestCase):
+
+    def route_all(self, router, channels):
+        return [router.route(channel) for channel in channels]
+
+    def test_table_matches_general_path(self):
+        channels = make_channels()
+        routes = [(compile_query('group = "кино hd"'), 'b.m3u'),
+                  (compile_query('group = спорт or group = эфир'), 'a.m3u'),
+                  (any_of('group', ['эфир', 'без группы']), 'c.m3u')]
+        router = Router(routes)
+        self.assertIsNotNone(router._table)
+        self.assertEqual(router.equality_values('group'), {'спорт', 'эфир', 'кино hd', 'без группы'})
+        table = self.route_all(router, channels)
+        router._table = None
+        self.assertEqual(self.route_all(router, channels), table)
+        self.assertEqual(table, ['a.m3u', 'a.m3u', 'a.m3u', 'b.m3u', 'c.m3u'])
+
+    def test_general_path(self):
+        channels = make_channels()
+        router = Router([(compile_query('title ~ test'), 'test.m3u'), (compile_query('group = спорт'), 'sport.m3u')])
+        self.assertIsNone(router._table)
+        self.assertIsNone(router.equality_values('group'))
+        self.assertEqual(self.route_all(router, channels), [None, 'sport.m3u', 'test.m3u', None, None])
+
+
+class TransformTest(unittest.TestCase):
+
+    def test_set_and_unset(self):
+        channels = list(transform(make_channels(), compile_query('group = спорт'),
+                                  {'group-title': 'Спорт', 'catchup-days': None, 'tvg-rec': '1'}))
+        self.assertEqual(len(channels), 5)
+        self.assertEqual(channels[2].extinf, '#EXTINF:-1 tvg-id="kz.news" group-title="Спорт" tvg-rec="1",Спорт Test')
+        self.assertEqual(channels[0].extinf, make_channels()[0].extinf)
+
+    def test_delete(self):
+        channels = transform(make_channels(), compile_query('not url or host = other.example'), delete=True)
+        self.assertEqual([channel.name for channel in channels], ['Первый канал HD', 'Матч ТВ'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import time
+import unittest
+
+from m3u_remote import STATUS_FAILED, STATUS_NOT_MODIFIED, STATUS_UPDATED, RemoteCache, prefetch
+from tests.http_stand import StandServer
+
+PLAYLIST = b'#EXTM3U\n#EXTINF:-1,A\nhttp://a.example/1\n'
+
+
+def slow_playlist(handler):
+    time.sleep(0.3)
+    if handler.headers.get('If-None-Match') == '"v1"':
+        return 304, {'ETag': '"v1"'}, b''
+    return 200, {'Content-Type': 'audio/x-mpegurl', 'ETag': '"v1"'}, PLAYLIST
+
+
+def hang(handler):
+    time.sleep(1.5)
+    return 200, {}, PLAYLIST
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = RemoteCache(os.path.join(self.tmp.name, 'cache'))
+
+    def test_host_queue_does_not_count_toward_timeout(self):
+        # Восемь источников на одном хосте по одному соединению: последний ждёт очереди дольше таймаута
+        with StandServer({'/list.m3u': slow_playlist}) as server:
+            urls = [f'{server.base_url}/list.m3u?n={i}' for i in range(8)]
+            results = prefetch(urls, self.cache, per_host=1, timeout=0.5)
+            self.assertEqual({status for status, _ in results.values()}, {STATUS_UPDATED})
+            with open(self.cache.body_path(urls[-1]), 'rb') as f:
+                self.assertEqual(f.read(), PLAYLIST)
+            again = prefetch(urls[:1], self.cache, per_host=1, timeout=0.5)
+        self.assertEqual(again[urls[0]][0], STATUS_NOT_MODIFIED)
+
+    def test_stalled_source_times_out(self):
+        with StandServer({'/hang.m3u': hang}) as server:
+            url = server.base_url + '/hang.m3u'
+            results = prefetch([url], self.cache, timeout=0.5)
+        self.assertEqual(results[url], (STATUS_FAILED, 'таймаут'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import gzip
+import http.client
+import os
+import tempfile
+import threading
+import unittest
+from urllib.parse import quote
+
+from m3u_server import PlaylistServer, PlaylistSource, accepts_gzip
+
+PLAYLIST = (
+    '#EXTM3U\n'
+    '#EXTINF:-1 group-title="Кино",Фильм\nhttp://a.example/1\n'
+    '#EXTINF:-1 group-title="Спорт",Матч\nhttp://a.example/2\n'
+)
+
+
+class PlaylistServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        path = os.path.join(self.tmp.name, 'playlist.m3u')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+        self.server = PlaylistServer(('127.0.0.1', 0), PlaylistSource(path), quiet=True)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def get(self, headers=None, path='/playlist.m3u?group=' + quote('Кино')):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1])
+        try:
+            connection.request('GET', path, headers=headers or {})
+            response = connection.getresponse()
+            return response, response.read()
+        finally:
+            connection.close()
+
+    def test_each_encoding_has_own_etag(self):
+        plain, plain_body = self.get()
+        packed, packed_body = self.get({'Accept-Encoding': 'gzip'})
+        self.assertEqual(packed.getheader('Content-Encoding'), 'gzip')
+        self.assertEqual(gzip.decompress(packed_body), plain_body)
+        self.assertIn('Фильм', plain_body.decode('utf-8'))
+        self.assertNotEqual(plain.getheader('ETag'), packed.getheader('ETag'))
+        self.assertEqual(plain.getheader('Vary'), 'Accept-Encoding')
+        self.assertEqual(packed.getheader('Vary'), 'Accept-Encoding')
+
+    def test_conditional_request_matches_encoding(self):
+        plain, _ = self.get()
+        packed, _ = self.get({'Accept-Encoding': 'gzip'})
+        response, _ = self.get({'If-None-Match': plain.getheader('ETag')})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.getheader('Vary'), 'Accept-Encoding')
+        response, _ = self.get({'If-None-Match': packed.getheader('ETag'), 'Accept-Encoding': 'gzip'})
+        self.assertEqual((response.status, response.getheader('ETag')), (304, packed.getheader('ETag')))
+        # ETag несжатого ответа не подтверждает сжатый вариант, и наоборот
+        response, body = self.get({'If-None-Match': plain.getheader('ETag'), 'Accept-Encoding': 'gzip'})
+        self.assertEqual((response.status, response.getheader('Content-Encoding')), (200, 'gzip'))
+        self.assertTrue(body)
+        response, _ = self.get({'If-None-Match': packed.getheader('ETag')})
+        self.assertEqual(response.status, 200)
+
+    def test_gzip_refused_by_q_value(self):
+        plain, plain_body = self.get()
+        for header in ('gzip;q=0', 'gzip; q=0.0, identity', 'br, *;q=0', 'deflate'):
+            with self.subTest(header=header):
+                response, body = self.get({'Accept-Encoding': header})
+                self.assertIsNone(response.getheader('Content-Encoding'))
+                self.assertEqual((body, response.getheader('ETag')), (plain_body, plain.getheader('ETag')))
+        response, _ = self.get({'If-None-Match': plain.getheader('ETag'), 'Accept-Encoding': 'gzip;q=0'})
+        self.assertEqual((response.status, response.getheader('ETag')), (304, plain.getheader('ETag')))
+
+    def test_accepts_gzip(self):
+        for header, expected in (('gzip', True), ('GZIP;Q=0.5', True), ('deflate, gzip;q=1.0', True),
+                                 ('*', True), ('*;q=0, gzip;q=0.1', True), ('x-gzip', True),
+                                 ('', False), ('gzip;q=0', False), ('gzip;q=0.000', False), ('gzip;q=x', False),
+                                 ('*;q=0.5, gzip;q=0', False), ('identity', False), ('br', False)):
+            with self.subTest(header=header):
+                self.assertIs(accepts_gzip(header), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import struct
+import tempfile
+import unittest
+
+from gen_playlist import generate_playlist
+from m3u_parser import read_channels
+from m3u_snapshot import SNAPSHOT_VERSION, Snapshot, SnapshotError, build_snapshot, write_snapshot
+from m3u_writer import write_playlist
+
+PLAYLIST = (
+    '#EXTM3U url-tvg="http://epg.example/epg.xml"\n'
+    '#EXTINF:-1 tvg-id="a" group-title="Новости",Первый, канал\n'
+    '#EXTGRP:Эфир\n'
+    '#EXTVLCOPT:http-user-agent=Test\n'
+    'http://a.example/1\n'
+    '#EXTINF:-1 group-title="Кино",Без URL\n'
+    '#EXTINF:-1,Без группы\n'
+    '#EXTGRP:\n'
+    'http://a.example/3\n'
+    '#EXTINF:-1 tvg-id="b" group-title="Новости",Второй\n'
+    '#EXTGRP:Эфир\n'
+    'http://a.example/4\n'
+)
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playlist = self.path('in.m3u')
+        with open(self.playlist, 'w', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_export_matches_source(self):
+        build_snapshot(self.playlist, self.path('in.m3us'))
+        with Snapshot(self.path('in.m3us')) as snapshot:
+            self.assertEqual(snapshot.export(self.path('out.m3u')), 4)
+        with open(self.path('out.m3u'), encoding='utf-8') as f:
+            self.assertEqual(f.read(), PLAYLIST)
+
+    def test_channels_and_columns(self):
+        build_snapshot(self.playlist, self.path('in.m3us'))
+        expected = list(read_channels(self.playlist))
+        with Snapshot(self.path('in.m3us')) as snapshot:
+            channels = list(read_channels(self.path('in.m3us')))
+            self.assertEqual([channel.to_m3u() for channel in channels], [channel.to_m3u() for channel in expected])
+            self.assertIsNone(snapshot.channel(1).url)
+            self.assertEqual(snapshot.channel(2).extgrp, '')
+            self.assertEqual(snapshot.title(0), 'Первый, канал')
+            self.assertEqual(snapshot.attrs(0), {'tvg-id': 'a', 'group-title': 'Новости'})
+            self.assertEqual(list(snapshot.group_counts().items()), [('Новости', 2), ('Без группы', 1)])
+            self.assertEqual(list(snapshot.group_counts(with_url=False)), ['Новости', 'Кино', 'Без группы'])
+            self.assertEqual([channel.name for channel in snapshot.group_channels(['Новости'])],
+                             ['Первый, канал', 'Второй'])
+            self.assertEqual(snapshot.extgrp_values(), {'Эфир', ''})
+            self.assertEqual([channel.url for channel in snapshot.select_extgrp({'эфир'})],
+                             ['http://a.example/1', 'http://a.example/4'])
+
+    def test_changed_attributes_are_written(self):
+        channels = list(read_channels(self.playlist))
+        channels[0].set_attr('group-title', 'Спорт')
+        write_snapshot(self.path('changed.m3us'), channels)
+        with Snapshot(self.path('changed.m3us')) as snapshot:
+            self.assertEqual(snapshot.channel(0).group, 'Спорт')
+            self.assertEqual(list(snapshot.group_counts()), ['Спорт', 'Без группы', 'Новости'])
+
+    def test_smaller_than_text_and_identical_export(self):
+        generate_playlist(self.path('big.m3u'), 5000)
+        build_snapshot(self.path('big.m3u'), self.path('big.m3us'))
+        self.assertLess(os.path.getsize(self.path('big.m3us')), os.path.getsize(self.path('big.m3u')))
+        header = []
+        write_playlist(self.path('text.m3u'), read_channels(self.path('big.m3u'), header), header)
+        with Snapshot(self.path('big.m3us')) as snapshot:
+            snapshot.export(self.path('export.m3u'))
+        with open(self.path('text.m3u'), 'rb') as a, open(self.path('export.m3u'), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_old_version_is_rejected(self):
+        build_snapshot(self.playlist, self.path('in.m3us'))
+        with open(self.path('in.m3us'), 'r+b') as f:
+            f.seek(8)
+            f.write(struct.pack('<I', SNAPSHOT_VERSION - 1))
+        with self.assertRaisesRegex(SnapshotError, 'версия'):
+            Snapshot(self.path('in.m3us'))
+
+
+if __name__ == '__main__':
+    unittest.main()
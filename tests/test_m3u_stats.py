@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import m3u_stats
+from gen_playlist import generate_playlist
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MergeStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playlist = os.path.join(self.tmp.name, 'in.m3u')
+        generate_playlist(self.playlist, 2000)
+
+    def run_tool(self, *args):
+        return subprocess.run([sys.executable, *args], cwd=self.tmp.name, capture_output=True, text=True, check=True)
+
+    def test_stats_json_goes_to_stderr_and_counts_dedup(self):
+        output = os.path.join(self.tmp.name, 'out.m3u')
+        proc = self.run_tool(os.path.join(ROOT, 'merge_m3u.py'), self.playlist, self.playlist, output,
+                             '--stats-json', '-')
+        self.assertNotIn('{', proc.stdout)
+        data = json.loads(proc.stderr)
+        self.assertEqual(data['tool'], 'merge_m3u')
+        self.assertGreater(data['stages']['dedup'], 0)
+        self.assertGreaterEqual(data['counters']['duplicates_dropped'], 2000)
+        self.assertIsNone(data['peak_rss_children_bytes'])
+
+    def test_child_process_memory_is_reported(self):
+        stats = m3u_stats.Stats('test')
+        self.assertIsNone(stats.peak_memory(children=True))
+        # Дочерний процесс занимает заметно больше памяти, чем процессы, запущенные до Stats
+        subprocess.run([sys.executable, '-c', 'data = bytearray(256 * 1024 * 1024)'], check=True)
+        self.assertGreater(stats.peak_memory(children=True), 256 * 1024 * 1024)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from m3u_watch import FilterJob, IncrementalRunner, ManageJob, SortJob
+from sort_iptv import sort_m3u_playlist
+
+HEADER = '#EXTM3U url-tvg="http://epg.example/epg.xml.gz" tvg-shift=3'
+PLAYLIST = (
+    HEADER + '\n'
+    '#EXTINF:-1 group-title="Кино",Щит\n#EXTGRP:Фильмы\nhttp://a.example/1\n'
+    '#EXTINF:-1 group-title="Новости",Ёж\nhttp://a.example/2\n'
+    '#EXTINF:-1 group-title="Кино",Ангел\n#EXTGRP:Фильмы\nhttp://a.example/3\n'
+    '#EXTINF:-1 group-title="Новости",Без URL\n'
+    '#EXTINF:-1 group-title="Новости",Дождь\nhttp://a.example/4\n'
+)
+
+
+class IncrementalRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = self.path('in.m3u')
+        self.write_source(PLAYLIST)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def write_source(self, text):
+        with open(self.source, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def read(self, name):
+        with open(self.path(name), encoding='utf-8') as f:
+            return f.read()
+
+    def cycle(self, runner):
+        with redirect_stdout(StringIO()):
+            return runner.run_cycle()
+
+    def freeze(self, name):
+        # Старое время изменения: перезапись файла его сменит
+        os.utime(self.path(name), ns=(1, 1))
+
+    def test_sort_matches_sort_iptv(self):
+        self.cycle(IncrementalRunner(self.source, SortJob(self.path('watch.m3u'))))
+        sort_m3u_playlist(self.source, self.path('sort.m3u'))
+        self.assertTrue(self.read('watch.m3u').startswith(HEADER + '\n'))
+        self.assertEqual(self.read('watch.m3u'), self.read('sort.m3u'))
+
+    def test_unchanged_source_is_skipped(self):
+        runner = IncrementalRunner(self.source, SortJob(self.path('out.m3u')))
+        self.assertEqual(self.cycle(runner), (5, 0, 0))
+        self.freeze('out.m3u')
+        self.write_source(PLAYLIST)
+        self.assertEqual(self.cycle(runner), (0, 0, 0))
+        self.assertEqual(os.stat(self.path('out.m3u')).st_mtime_ns, 1)
+        # Новый запуск сравнивает результат с уже записанным файлом
+        self.cycle(IncrementalRunner(self.source, SortJob(self.path('out.m3u'))))
+        self.assertEqual(os.stat(self.path('out.m3u')).st_mtime_ns, 1)
+
+    def test_added_removed_modified_counts(self):
+        runner = IncrementalRunner(self.source, SortJob(self.path('out.m3u')))
+        self.cycle(runner)
+        changed = (PLAYLIST.replace('Ёж', 'Ёжик')
+                   .replace('#EXTINF:-1 group-title="Новости",Дождь\nhttp://a.example/4\n', '')
+                   + '#EXTINF:-1 group-title="Спорт",Мяч\nhttp://a.example/5\n'
+                   + '#EXTINF:-1 group-title="Спорт",Мяч 2\nhttp://a.example/6\n')
+        self.write_source(changed)
+        self.assertEqual(self.cycle(runner), (2, 1, 1))
+        self.assertIn('Ёжик', self.read('out.m3u'))
+        self.assertNotIn('Дождь', self.read('out.m3u'))
+
+    def test_header_change_rewrites_output(self):
+        runner = IncrementalRunner(self.source, SortJob(self.path('out.m3u')))
+        self.cycle(runner)
+        self.freeze('out.m3u')
+        new_header = '#EXTM3U url-tvg="http://epg.example/new.xml"'
+        self.write_source(PLAYLIST.replace(HEADER, new_header))
+        self.assertEqual(self.cycle(runner), (0, 0, 0))
+        self.assertNotEqual(os.stat(self.path('out.m3u')).st_mtime_ns, 1)
+        self.assertTrue(self.read('out.m3u').startswith(new_header + '\n'))
+
+    def test_manage_and_filter_jobs(self):
+        self.cycle(IncrementalRunner(self.source, ManageJob(self.path('manage.m3u'), remove=['Кино'])))
+        manage = self.read('manage.m3u')
+        self.assertTrue(manage.startswith(HEADER + '\n'))
+        self.assertNotIn('Кино', manage)
+        self.cycle(IncrementalRunner(self.source, FilterJob({'фильмы': (self.path('movies.m3u'), 'Фильмы')})))
+        self.assertEqual(self.read('movies.m3u'),
+                         '#EXTM3U\n'
+                         '#EXTINF:-1 group-title="Фильмы",Ангел\nhttp://a.example/3\n\n'
+                         '#EXTINF:-1 group-title="Фильмы",Щит\nhttp://a.example/1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
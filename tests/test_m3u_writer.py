@@ -0,0 +1,100 @@
+import gzip
+import os
+import stat
+import tempfile
+import unittest
+
+from m3u_parser import Channel, read_channels
+from m3u_writer import PlaylistWriter, atomic_output, write_playlist
+
+ORIGINAL = '#EXTM3U\n#EXTINF:-1,Старый\nhttp://a.example/old\n'
+
+
+def make_channels(count):
+    return [Channel(f'#EXTINF:-1 group-title="Группа",Канал {i}', url=f'http://a.example/{i}') for i in range(count)]
+
+
+class AtomicWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.output = self.path('out.m3u')
+        with open(self.output, 'w', encoding='utf-8') as f:
+            f.write(ORIGINAL)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def read(self, path=None):
+        with open(path or self.output, encoding='utf-8') as f:
+            return f.read()
+
+    def test_error_inside_with_keeps_original(self):
+        with self.assertRaises(RuntimeError):
+            with PlaylistWriter(self.output, '#EXTM3U x-tvg-url="e.xml"') as writer:
+                for channel in make_channels(3):
+                    writer.write(channel)
+                raise RuntimeError('сбой')
+        self.assertEqual(self.read(), ORIGINAL)
+        with self.assertRaises(KeyboardInterrupt):
+            with atomic_output(self.output) as f:
+                f.write('частично')
+                raise KeyboardInterrupt
+        self.assertEqual(self.read(), ORIGINAL)
+        # Временные файлы удалены
+        self.assertEqual(os.listdir(self.tmp.name), ['out.m3u'])
+
+    def test_overwrite_input_while_reading(self):
+        header = []
+        count = write_playlist(self.output, read_channels(self.output, header), header)
+        self.assertEqual(count, 1)
+        self.assertEqual(self.read(), ORIGINAL)
+
+    def test_header_and_separator(self):
+        with PlaylistWriter(self.output, ['#EXTM3U url-tvg="e.xml"'], separator='\n') as writer:
+            writer.write_all(make_channels(2))
+        self.assertEqual(self.read(), '#EXTM3U url-tvg="e.xml"\n'
+                                      '#EXTINF:-1 group-title="Группа",Канал 0\nhttp://a.example/0\n\n'
+                                      '#EXTINF:-1 group-title="Группа",Канал 1\nhttp://a.example/1\n')
+        # Без каналов записывается только заголовок
+        write_playlist(self.output, [], [])
+        self.assertEqual(self.read(), '#EXTM3U\n')
+
+    def test_gzip_output(self):
+        path = self.path('out.m3u.gz')
+        self.assertEqual(write_playlist(path, make_channels(1000), '#EXTM3U'), 1000)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(2), b'\x1f\x8b')
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            text = f.read()
+        self.assertTrue(text.startswith('#EXTM3U\n#EXTINF:-1 group-title="Группа",Канал 0\n'))
+        self.assertLess(os.path.getsize(path), len(text.encode('utf-8')))
+        self.assertEqual([channel.url for channel in read_channels(path)][-1], 'http://a.example/999')
+        # Сжатие задаётся и явно, независимо от расширения
+        write_playlist(self.output, make_channels(1), compression='gzip')
+        with gzip.open(self.output, 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), '#EXTM3U\n' + make_channels(1)[0].to_m3u())
+
+    def test_file_mode_is_preserved(self):
+        os.chmod(self.output, 0o640)
+        write_playlist(self.output, make_channels(1))
+        self.assertEqual(stat.S_IMODE(os.stat(self.output).st_mode), 0o640)
+        os.chmod(self.output, 0o604)
+        write_playlist(self.output, make_channels(1))
+        self.assertEqual(stat.S_IMODE(os.stat(self.output).st_mode), 0o604)
+        # Новый файл получает права по umask, а не 0600 временного файла
+        umask = os.umask(0o022)
+        try:
+            write_playlist(self.path('new.m3u'), make_channels(1))
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path('new.m3u')).st_mode), 0o644)
+
+    def test_url_output_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'по URL'):
+            write_playlist('http://example.com/out.m3u', make_channels(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
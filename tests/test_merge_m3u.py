@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from merge_m3u import merge_m3u_playlists
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+A = (
+    '#EXTM3U url-tvg="http://epg.example/a.xml"\n'
+    '#EXTINF:-1 tvg-id="first",Первый A\nhttp://a.example/1\n'
+    '#EXTINF:-1 tvg-id="second",Второй A\nhttp://a.example/2\n'
+    '#EXTINF:-1,Третий A\nhttp://a.example/3\n'
+)
+B = (
+    '#EXTM3U url-tvg="http://epg.example/b.xml"\n'
+    # Тот же URL с другим регистром хоста и портом по умолчанию
+    '#EXTINF:-1,Первый B\nhttp://A.EXAMPLE:80/1\n'
+    '#EXTINF:-1 tvg-id="SECOND ",Второй B\nhttp://b.example/2\n'
+    '#EXTINF:-1,Четвёртый B\nhttp://b.example/4\n'
+)
+C = (
+    '#EXTM3U\n'
+    '#EXTINF:-1 tvg-id="fourth",Четвёртый C\nhttp://b.example/4\n'
+    '#EXTINF:-1 tvg-id="fifth",Пятый C\nhttp://c.example/5\n'
+    '#EXTINF:-1 tvg-id="fifth",Пятый C копия\nhttp://c.example/5b\n'
+)
+
+
+class MergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.paths = []
+        for name, text in (('a.m3u', A), ('b.m3u', B), ('c.m3u', C)):
+            self.paths.append(self.path(name))
+            with open(self.path(name), 'w', encoding='utf-8') as f:
+                f.write(text)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def merge(self, **kwargs):
+        output = self.path('out.m3u')
+        with redirect_stdout(StringIO()):
+            stats = merge_m3u_playlists(self.paths, output, **kwargs)
+        with open(output, encoding='utf-8') as f:
+            text = f.read()
+        names = [line.split(',', 1)[1] for line in text.splitlines() if line.startswith('#EXTINF')]
+        counts = {os.path.basename(path): value for path, value in stats.items()}
+        return names, counts, text.splitlines()[0]
+
+    def test_dedup_by_url(self):
+        names, counts, header = self.merge()
+        self.assertEqual(names, ['Первый A', 'Второй A', 'Третий A', 'Второй B', 'Четвёртый B',
+                                 'Пятый C', 'Пятый C копия'])
+        self.assertEqual(counts, {'a.m3u': (3, 0, 0), 'b.m3u': (2, 1, 0), 'c.m3u': (2, 1, 0)})
+        self.assertEqual(header, '#EXTM3U url-tvg="http://epg.example/a.xml"')
+
+    def test_dedup_by_tvg_id(self):
+        names, counts, _ = self.merge(dedup=('tvg-id',))
+        # tvg-id сравнивается без учёта регистра и пробелов, каналы без tvg-id не отбрасываются
+        self.assertEqual(names, ['Первый A', 'Второй A', 'Третий A', 'Первый B', 'Четвёртый B',
+                                 'Четвёртый C', 'Пятый C'])
+        self.assertEqual(counts, {'a.m3u': (3, 0, 0), 'b.m3u': (2, 1, 0), 'c.m3u': (2, 1, 0)})
+
+    def test_dedup_by_url_and_tvg_id(self):
+        names, counts, _ = self.merge(dedup=('url', 'tvg-id'))
+        self.assertEqual(names, ['Первый A', 'Второй A', 'Третий A', 'Четвёртый B', 'Пятый C'])
+        self.assertEqual(counts, {'a.m3u': (3, 0, 0), 'b.m3u': (1, 2, 0), 'c.m3u': (1, 2, 0)})
+
+    def test_no_dedup(self):
+        names, counts, _ = self.merge(dedup=())
+        self.assertEqual(len(names), 9)
+        self.assertEqual(counts, {'a.m3u': (3, 0, 0), 'b.m3u': (3, 0, 0), 'c.m3u': (3, 0, 0)})
+
+    def test_prefer_changes_kept_duplicate(self):
+        names, counts, header = self.merge(prefer=self.path('c.m3u'))
+        self.assertEqual(names, ['Четвёртый C', 'Пятый C', 'Пятый C копия', 'Первый A', 'Второй A', 'Третий A',
+                                 'Второй B'])
+        self.assertEqual(counts, {'c.m3u': (3, 0, 0), 'a.m3u': (3, 0, 0), 'b.m3u': (1, 2, 0)})
+        self.assertEqual(header, '#EXTM3U')
+        with redirect_stdout(StringIO()) as out:
+            self.assertIsNone(merge_m3u_playlists(self.paths, self.path('x.m3u'), prefer=self.path('d.m3u')))
+        self.assertIn('не входит в список плейлистов', out.getvalue())
+
+    def test_bloom_matches_exact_set(self):
+        exact = self.merge(dedup=('url', 'tvg-id'))
+        self.assertEqual(self.merge(dedup=('url', 'tvg-id'), bloom_capacity=1000), exact)
+        # Переполненный крошечный фильтр отбрасывает лишнее, но не пропускает дубликаты
+        names, _, _ = self.merge(dedup=('url', 'tvg-id'), bloom_capacity=1, bloom_error=0.5)
+        self.assertTrue(set(names) <= set(exact[0]))
+
+    def test_health_cache_requires_drop_dead(self):
+        proc = subprocess.run([sys.executable, os.path.join(ROOT, 'merge_m3u.py'), *self.paths, self.path('out.m3u'),
+                               '--health-cache', self.path('probes.db')], capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 2)
+        self.assertIn('--drop-dead', proc.stderr)
+        self.assertFalse(os.path.exists(self.path('out.m3u')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+import unittest
+
+from iptv_manager import apply_cached_health
+from m3u_parser import read_channels
+from merge_m3u import merge_m3u_playlists
+from probe_cache import ProbeCache
+from stream_check import STATUS_DEAD, STATUS_OK, ProbeResult
+
+PLAYLIST = (
+    '#EXTM3U\n'
+    '#EXTINF:-1,Fresh dead\nhttp://a.example/fresh\n'
+    '#EXTINF:-1,Old dead\nhttp://a.example/old\n'
+    '#EXTINF:-1,Alive\nhttp://a.example/ok\n'
+)
+
+
+class ProbeCacheTtlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playlist = os.path.join(self.tmp.name, 'in.m3u')
+        with open(self.playlist, 'w', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+        self.cache = ProbeCache(os.path.join(self.tmp.name, 'probes.db'))
+        self.addCleanup(self.cache.close)
+        self.cache.store([
+            ProbeResult('http://a.example/fresh', STATUS_DEAD, 404),
+            ProbeResult('http://a.example/old', STATUS_DEAD, 404),
+            ProbeResult('http://a.example/ok', STATUS_OK, 200),
+            ProbeResult('http://other.example/dead', STATUS_DEAD, 404),
+        ])
+        # Результат для /old старше TTL недоступных (1 ч)
+        self.cache._db.execute('UPDATE probes SET checked_at = ? WHERE url_key = ?',
+                               (time.time() - 2 * 3600, 'http://a.example/old'))
+
+    def test_dead_keys_respect_ttl_and_requested_urls(self):
+        urls = ['http://a.example/fresh', 'http://a.example/old', 'http://a.example/ok']
+        self.assertEqual(self.cache.dead_keys(urls), {'http://a.example/fresh'})
+        self.assertEqual(self.cache.dead_keys(urls, max_age=3 * 3600),
+                         {'http://a.example/fresh', 'http://a.example/old'})
+
+    def test_merge_drops_only_fresh_dead(self):
+        output = os.path.join(self.tmp.name, 'out.m3u')
+        stats = merge_m3u_playlists([self.playlist], output, health_cache=self.cache)
+        self.assertEqual(stats[self.playlist], (2, 0, 1))
+        self.assertEqual([channel.name for channel in read_channels(output)], ['Old dead', 'Alive'])
+
+    def test_apply_cached_health_ignores_stale(self):
+        channels = list(read_channels(self.playlist))
+        kept = apply_cached_health(channels, self.cache)
+        self.assertEqual([channel.name for channel in kept], ['Old dead', 'Alive'])
+        kept = apply_cached_health(channels, self.cache, max_age=3 * 3600)
+        self.assertEqual([channel.name for channel in kept], ['Alive'])
+
+
+if __name__ == '__main__':
+    unittest.main()
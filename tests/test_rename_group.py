@@ -0,0 +1,81 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from m3u_parser import is_snapshot, read_channels
+from m3u_snapshot import Snapshot, build_snapshot
+from rename_group import update_group_title
+
+PLAYLIST = (
+    '#EXTM3U url-tvg="http://epg.example/epg.xml"\n'
+    '#PLAYLIST:Мой список\n'
+    '# комментарий\n'
+    '#EXTINF:-1 tvg-id="a" group-title="Старая",Первый, канал\n'
+    '#EXTGRP:Эфир\n'
+    '#EXTVLCOPT:http-user-agent=UA\n'
+    'http://a.example/1\n'
+    '\n'
+    '#EXTINF:-1,Без группы\n'
+    'http://a.example/2\n'
+    '#EXTINF:-1 tvg-id="c"\n'
+    'http://a.example/3'
+)
+RENAMED = (
+    '#EXTM3U url-tvg="http://epg.example/epg.xml"\n'
+    '#PLAYLIST:Мой список\n'
+    '# комментарий\n'
+    '#EXTINF:-1 tvg-id="a" group-title="Новая",Первый, канал\n'
+    '#EXTGRP:Эфир\n'
+    '#EXTVLCOPT:http-user-agent=UA\n'
+    'http://a.example/1\n'
+    '\n'
+    '#EXTINF:-1 group-title="Новая",Без группы\n'
+    'http://a.example/2\n'
+    '#EXTINF:-1 tvg-id="c" group-title="Новая",\n'
+    'http://a.example/3'
+)
+
+
+class RenameGroupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_text_keeps_other_lines(self):
+        path = self.path('in.m3u')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+        self.assertEqual(update_group_title(path, 'Новая'), 3)
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(f.read(), RENAMED)
+
+    def test_gzip_in_place(self):
+        path = self.path('in.m3u.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+        update_group_title(path, 'Новая')
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), RENAMED)
+
+    def test_snapshot_stays_snapshot(self):
+        with open(self.path('in.m3u'), 'w', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+        path = self.path('in.m3us')
+        build_snapshot(self.path('in.m3u'), path)
+        self.assertEqual(update_group_title(path, 'Новая'), 3)
+        self.assertTrue(is_snapshot(path))
+        with Snapshot(path) as snapshot:
+            self.assertEqual(snapshot.header, '#EXTM3U url-tvg="http://epg.example/epg.xml"')
+            self.assertEqual(dict(snapshot.group_counts()), {'Новая': 3})
+        channels = list(read_channels(path))
+        self.assertEqual(channels[0].to_m3u(), '#EXTINF:-1 tvg-id="a" group-title="Новая",Первый, канал\n'
+                                               '#EXTGRP:Эфир\n#EXTVLCOPT:http-user-agent=UA\nhttp://a.example/1\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import functools
+import gzip
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import sort_iptv
+from m3u_parallel import read_channels_parallel
+from sort_iptv import sort_m3u_playlist, sorted_output_name
+
+HEADER = '#EXTM3U url-tvg="http://epg.example/epg.xml.gz" tvg-shift=3'
+PLAYLIST = (
+    HEADER + '\n'
+    '#EXTINF:-1 group-title="Кино",Щит\nhttp://a.example/1\n'
+    '#EXTINF:-1 group-title="Новости",Ёж\nhttp://a.example/2\n'
+    '#EXTINF:-1 group-title="Кино",Ангел\nhttp://a.example/3\n'
+    '#EXTINF:-1 group-title="Новости",Без URL\n'
+    '#EXTINF:-1 group-title="Новости",Дождь\nhttp://a.example/4\n'
+)
+SORTED = (
+    HEADER + '\n'
+    '#EXTINF:-1 group-title="Кино",Ангел\nhttp://a.example/3\n'
+    '#EXTINF:-1 group-title="Кино",Щит\nhttp://a.example/1\n'
+    '#EXTINF:-1 group-title="Новости",Дождь\nhttp://a.example/4\n'
+    '#EXTINF:-1 group-title="Новости",Ёж\nhttp://a.example/2\n'
+)
+
+
+class SortPlaylistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.playlist = os.path.join(self.tmp.name, 'in.m3u')
+        with open(self.playlist, 'w', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+
+    def sort(self, **kwargs):
+        output = os.path.join(self.tmp.name, 'out.m3u')
+        sort_m3u_playlist(self.playlist, output, **kwargs)
+        with open(output, encoding='utf-8') as f:
+            return f.read()
+
+    def test_header_attributes_are_kept(self):
+        self.assertEqual(self.sort(), SORTED)
+
+    def test_external_sort_keeps_header(self):
+        self.assertEqual(self.sort(max_channels=2, tmp_dir=self.tmp.name), SORTED)
+
+    def test_parallel_read_keeps_header(self):
+        parallel_reader = functools.partial(read_channels_parallel, threshold=0)
+        with mock.patch.object(sort_iptv, 'read_channels_parallel', parallel_reader):
+            self.assertEqual(self.sort(jobs=2), SORTED)
+
+    def test_default_output_name(self):
+        self.assertEqual(sorted_output_name('x.m3u'), 'x_sorted.m3u')
+        self.assertEqual(sorted_output_name('x.m3u.gz'), 'x_sorted.m3u.gz')
+        self.assertEqual(sorted_output_name('dir.v2/x.M3U.ZST'), 'dir.v2/x_sorted.M3U.ZST')
+        self.assertEqual(sorted_output_name('x.gz'), 'x_sorted.gz')
+        path = os.path.join(self.tmp.name, 'in.m3u.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+        output = sort_m3u_playlist(path)
+        self.assertEqual(output, os.path.join(self.tmp.name, 'in_sorted.m3u.gz'))
+        with gzip.open(output, 'rt', encoding='utf-8') as f:
+            self.assertEqual(f.read(), SORTED)
+
+
+if __name__ == '__main__':
+    unittest.main()
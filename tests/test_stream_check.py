@@ -0,0 +1,88 @@
+import time
+import unittest
+
+from stream_check import STATUS_DEAD, STATUS_OK, check_urls
+from tests.http_stand import StandServer
+
+MANIFEST = b'#EXTM3U\n#EXT-X-TARGETDURATION:10\n#EXTINF:10,\nsegment0.ts\n'
+
+
+def slow(handler):
+    time.sleep(0.3)
+    return 200, {'Content-Type': 'video/mp2t'}, b''
+
+
+def no_head(handler):
+    if handler.command == 'HEAD':
+        return 405, {}, b''
+    return 206, {'Content-Type': 'video/mp2t'}, b'x' * 16
+
+
+def hang(handler):
+    time.sleep(1.5)
+    return 200, {}, b''
+
+
+ROUTES = {
+    '/slow': slow,
+    '/nohead': no_head,
+    '/hang': hang,
+    '/good.m3u8': lambda handler: (200, {'Content-Type': 'application/vnd.apple.mpegurl'}, MANIFEST),
+    '/bad.m3u8': lambda handler: (200, {'Content-Type': 'application/vnd.apple.mpegurl'}, b'<html>not found</html>'),
+    '/missing': lambda handler: (404, {}, b''),
+}
+
+
+class StreamCheckTest(unittest.TestCase):
+
+    def test_head_falls_back_to_get(self):
+        with StandServer(ROUTES) as server:
+            url = server.base_url + '/nohead'
+            result = check_urls([url])[url]
+            methods = [method for method, path, _ in server.requests]
+            range_headers = [headers.get('Range') for method, _, headers in server.requests if method == 'GET']
+        self.assertEqual(result.status, STATUS_OK)
+        self.assertEqual(methods, ['HEAD', 'GET'])
+        self.assertTrue(range_headers[0].startswith('bytes=0-'))
+
+    def test_manifest_validation(self):
+        with StandServer(ROUTES) as server:
+            good, bad = server.base_url + '/good.m3u8', server.base_url + '/bad.m3u8'
+            results = check_urls([good, bad])
+        self.assertEqual(results[good].status, STATUS_OK)
+        self.assertIsNotNone(results[good].fingerprint)
+        self.assertEqual(results[bad].status, STATUS_DEAD)
+        self.assertIn('HLS', results[bad].detail)
+
+    def test_http_error_is_dead(self):
+        with StandServer(ROUTES) as server:
+            url = server.base_url + '/missing'
+            result = check_urls([url])[url]
+        self.assertEqual((result.status, result.code), (STATUS_DEAD, 404))
+
+    def test_per_host_limit(self):
+        with StandServer(ROUTES) as server:
+            urls = [f'{server.base_url}/slow?n={i}' for i in range(8)]
+            results = check_urls(urls, per_host=2)
+            max_active = server.max_active
+        self.assertTrue(all(result.status == STATUS_OK for result in results.values()))
+        self.assertLessEqual(max_active, 2)
+
+    def test_timeout_is_dead(self):
+        with StandServer(ROUTES) as server:
+            url = server.base_url + '/hang'
+            result = check_urls([url], timeout=0.5)[url]
+        self.assertEqual(result.status, STATUS_DEAD)
+        self.assertEqual(result.detail, 'таймаут')
+
+    def test_host_queue_does_not_count_toward_timeout(self):
+        # Ответ за 0.3 с укладывается в таймаут, даже если URL долго ждёт свободного соединения хоста
+        with StandServer(ROUTES) as server:
+            urls = [f'{server.base_url}/slow?n={i}' for i in range(30)]
+            results = check_urls(urls, per_host=2, timeout=1)
+        dead = [url for url, result in results.items() if result.status != STATUS_OK]
+        self.assertEqual(dead, [])
+
+
+if __name__ == '__main__':
+    unittest.main()